@@ -0,0 +1,485 @@
+'''
+Benchmarks for the CSP routines, run on the KenKen BOARDS used by tests.py.
+
+    python benchmarks.py
+
+1. bench_domains
+    - Solves every board with kenken_csp_model under prop_FC and prop_GAC
+      (with ord_mrv), once with the bitset-backed Variable of cspbase and once
+      with ListVariable, a copy of the old list-of-flags implementation kept
+      here only as a reference point. Prints model build time, solve time and
+      the speedup of the bitset domains.
+
+2. bench_propagators
+    - Solves every board with each of the given propagators and prints the 
+      decisions, prunings and solve time of each, e.g. to compare prop_CT 
+      against prop_GAC.
+
+3. bench_backjumping
+    - Solves every board with each propagator, with chronological 
+      backtracking and with conflict-directed backjumping, and prints the 
+      decisions and solve time of both.
+
+4. bench_scaling
+    - Builds every board of a generated corpus (kenken_boards.corpus, 4x4 to 
+      15x15) with each model and solves it with each propagator, within a 
+      decision budget. Prints the build time, the memory of the model, and 
+      the decisions and time of the search, and can save the rows as JSON 
+      lines to compare runs. Run it alone with
+
+          python benchmarks.py scaling [results.jsonl]
+
+5. bench_symmetry
+    - Counts the solutions of n-Queens and of empty Latin square grids with 
+      and without the constraints of symmetry.py, and finds a first 
+      solution of larger n-Queens both ways. Prints the solutions and the 
+      decisions each search needed.
+
+6. bench_preprocessing
+    - Solves every board with and without preprocessing.preprocess (SAC, 
+      and RPC first if asked) and prints the values removed by the 
+      propagator alone and by the preprocessing, its time, and the 
+      decisions and solve time of the search.
+
+7. bench_cages
+    - Builds boards with large cages (5 to 8 cells) with the cages as 
+      tables of cage_tuples, as SumConstraints and ProductConstraints with 
+      domain consistency, and with bounds consistency, and prints the build 
+      time and the decisions and solve time of each propagator.
+
+8. bench_local_search
+    - Solves n-Queens (localsearch.queens_csp) and empty Latin square grids 
+      (nary_ad_grid) of growing size with localsearch.MinConflicts, and 
+      the smaller ones with bt_search (prop_GAC, ord_mrv) up to a decision 
+      budget, and prints the moves or decisions and the time of each.
+
+9. bench_serialize
+    - Builds n-Queens and the boards (kenken_csp_model and
+      kenken_csp_model_nary), saves each CSP with serialize.save_csp and
+      loads it back, and prints the build, save and load times, the size
+      of the file, and the time of the first prop_GAC call on the built
+      and on the loaded CSP (which reads the tables of the loaded one).
+'''
+
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import cspbase
+import kenken_csp
+import kenken_boards
+import symmetry
+import preprocessing
+import localsearch
+import serialize
+from cspbase import *
+from propagators import *
+from heuristics import *
+from tests import BOARDS, nQueens
+
+class ListVariable(Variable):
+    '''
+    Reference implementation of the current domain as a list of booleans,
+    with every value resolved through dom.index(). Only used to measure the
+    bitset representation against.
+    '''
+
+    def __init__(self, name, domain=[]):
+        Variable.__init__(self, name, domain)
+        self.curdom = [True] * len(self.dom)
+
+    def add_domain_values(self, values):
+        if isinstance(self.curdom, int):
+            #called from Variable.__init__, the list is built afterwards
+            Variable.add_domain_values(self, values)
+            return
+        for val in values:
+            self.dom.append(val)
+            self.curdom.append(True)
+
+    def prune_value(self, value):
+        i = self.value_index(value)
+        if self.curdom[i]:
+            self.curdom[i] = False
+            if self.trail is not None:
+                self.trail.record(self, value)
+
+    def unprune_value(self, value):
+        self.curdom[self.value_index(value)] = True
+
+    def cur_domain(self):
+        vals = []
+        if self.is_assigned():
+            vals.append(self.get_assigned_value())
+        else:
+            for i, val in enumerate(self.dom):
+                if self.curdom[i]:
+                    vals.append(val)
+        return vals
+
+    def in_cur_domain(self, value):
+        if not value in self.dom:
+            return False
+        if self.is_assigned():
+            return value == self.get_assigned_value()
+        else:
+            return self.curdom[self.value_index(value)]
+
+    def cur_domain_size(self):
+        if self.is_assigned():
+            return 1
+        else:
+            return(sum(1 for v in self.curdom if v))
+
+    def restore_curdom(self):
+        for i in range(len(self.curdom)):
+            self.curdom[i] = True
+
+    def value_index(self, value):
+        return self.dom.index(value)
+
+def time_solve(model, board, prop, var_ord=ord_mrv, repeat=3):
+    '''
+    Build and solve board with model, repeat times. Return the best
+    (build time, solve time) pair in seconds.
+    '''
+    best_build = best_solve = float('inf')
+    for _ in range(repeat):
+        board_copy = [list(cage) for cage in board]
+        stime = time.perf_counter()
+        csp, _ = model(board_copy)
+        btime = time.perf_counter()
+        solver = BT(csp)
+        solver.quiet()
+        solver.bt_search(prop, var_ord)
+        etime = time.perf_counter()
+        best_build = min(best_build, btime - stime)
+        best_solve = min(best_solve, etime - btime)
+    return best_build, best_solve
+
+def bench_domains(boards=BOARDS, props=(prop_FC, prop_GAC)):
+    '''
+    Compare ListVariable against the bitset Variable on every board and
+    propagator.
+    '''
+    print("{:<6} {:<9} {:>12} {:>12} {:>12} {:>12} {:>8}".format(
+        "board", "prop", "list build", "list solve", "bits build",
+        "bits solve", "speedup"))
+    total_list = total_bits = 0
+    for n, board in enumerate(boards):
+        for prop in props:
+            kenken_csp.Variable = ListVariable
+            try:
+                list_build, list_solve = time_solve(kenken_csp.kenken_csp_model,
+                                                    board, prop)
+            finally:
+                kenken_csp.Variable = cspbase.Variable
+            bits_build, bits_solve = time_solve(kenken_csp.kenken_csp_model,
+                                                board, prop)
+            total_list += list_build + list_solve
+            total_bits += bits_build + bits_solve
+            print("{:<6} {:<9} {:>12.4f} {:>12.4f} {:>12.4f} {:>12.4f} {:>7.2f}x".format(
+                n + 1, prop.__name__, list_build, list_solve, bits_build,
+                bits_solve, (list_build + list_solve) / (bits_build + bits_solve)))
+    print("Total: list {:.4f}s, bitset {:.4f}s, speedup {:.2f}x".format(
+        total_list, total_bits, total_list / total_bits))
+
+def bench_propagators(boards=BOARDS, props=(prop_GAC, prop_CT), var_ord=ord_mrv,
+                      model=kenken_csp.kenken_csp_model):
+    '''Solve every board with each propagator and print the search stats'''
+    print("{:<6} {:<9} {:>10} {:>10} {:>12}".format(
+        "board", "prop", "decisions", "prunings", "solve"))
+    for n, board in enumerate(boards):
+        for prop in props:
+            csp, _ = model([list(cage) for cage in board])
+            solver = BT(csp)
+            solver.quiet()
+            stime = time.perf_counter()
+            solver.bt_search(prop, var_ord)
+            etime = time.perf_counter()
+            print("{:<6} {:<9} {:>10} {:>10} {:>12.4f}".format(
+                n + 1, prop.__name__, solver.nDecisions, solver.nPrunings,
+                etime - stime))
+
+def bench_backjumping(boards=BOARDS, props=(prop_FC, prop_GAC), var_ord=ord_mrv,
+                      model=kenken_csp.kenken_csp_model):
+    '''Compare bt_search with and without backjumping on every board'''
+    print("{:<6} {:<9} {:>10} {:>10} {:>10} {:>10}".format(
+        "board", "prop", "bt dec", "bt solve", "cbj dec", "cbj solve"))
+    for n, board in enumerate(boards):
+        for prop in props:
+            row = []
+            for backjump in (False, True):
+                csp, _ = model([list(cage) for cage in board])
+                solver = BT(csp)
+                solver.quiet()
+                stime = time.perf_counter()
+                solver.bt_search(prop, var_ord, backjump=backjump)
+                etime = time.perf_counter()
+                row += [solver.nDecisions, etime - stime]
+            print("{:<6} {:<9} {:>10} {:>10.4f} {:>10} {:>10.4f}".format(
+                n + 1, prop.__name__, *row))
+
+def bench_scaling(boards=None, models=(kenken_csp.kenken_csp_model, 
+                                        kenken_csp.kenken_csp_model_nary),
+                  props=(prop_FC, prop_GAC, prop_CT), var_ord=ord_mrv,
+                  max_decisions=20000, json_file=None):
+    '''
+    Build and solve every board (default kenken_boards.corpus()) with each 
+    model and propagator. A search that makes max_decisions decisions is 
+    given up and reported as "budget". The memory is what tracemalloc sees 
+    allocated by the model (measured on a second build, so that tracing 
+    does not slow the timed one). If json_file is given each row is also 
+    appended to it as a JSON line.
+    '''
+    if boards is None:
+        boards = kenken_boards.corpus()
+    print("{:<6} {:<24} {:<9} {:>10} {:>10} {:>10} {:>10} {:>8}".format(
+        "size", "model", "prop", "build", "memory MB", "decisions", "solve", "result"))
+    for board in boards:
+        n = board[0][0]
+        for model in models:
+            stime = time.perf_counter()
+            model([list(cage) for cage in board])
+            build = time.perf_counter() - stime
+            tracemalloc.start()
+            model([list(cage) for cage in board])
+            memory = tracemalloc.get_traced_memory()[0] / 1e6
+            tracemalloc.stop()
+            for prop in props:
+                csp, _ = model([list(cage) for cage in board])
+                solver = BT(csp)
+                solver.quiet()
+                stats = solver.bt_search(prop, var_ord, max_decisions=max_decisions)
+                solver.stop()
+                result = {True: "solved", False: "none", None: "budget"}[stats.status]
+                print("{:<6} {:<24} {:<9} {:>10.4f} {:>10.2f} {:>10} {:>10.4f} {:>8}".format(
+                    "{}x{}".format(n, n), model.__name__, prop.__name__, build, memory, 
+                    stats.decisions, stats.time, result))
+                if json_file is not None:
+                    row = dict(board=board, model=model.__name__, prop=prop.__name__,
+                               build=build, memory=memory, result=result)
+                    row.update(stats.as_dict())
+                    with open(json_file, 'a') as f:
+                        f.write(json.dumps(row) + '\n')
+
+def bench_symmetry(queens=range(4, 11), first=(20, 25, 30), grids=(3, 4), 
+                   prop=prop_GAC, var_ord=ord_mrv):
+    '''
+    Compare the search with and without symmetry breaking: count the 
+    solutions of n-Queens for n in queens and of the empty grids 
+    (nary_ad_grid) for n in grids, and find one solution of n-Queens for n 
+    in first. (Counting the 161280 5x5 Latin squares takes minutes.)
+    '''
+    def build(name, n):
+        if name == "queens":
+            csp = nQueens(n)
+            return csp, lambda: symmetry.break_queens_symmetry(csp, csp.get_all_vars())
+        csp, var_array = kenken_csp.nary_ad_grid([[n]])
+        return csp, lambda: symmetry.break_grid_symmetry(csp, var_array)
+
+    print("{:<8} {:<6} {:>10} {:>10} {:>10} {:>10} {:>10} {:>10}".format(
+        "problem", "search", "solutions", "decisions", "time", "sym sols", 
+        "sym dec", "sym time"))
+    runs = [("queens", n, "count") for n in queens] + \
+           [("grid", n, "count") for n in grids] + \
+           [("queens", n, "first") for n in first]
+    for name, n, mode in runs:
+        row = []
+        for breaking in (False, True):
+            csp, add = build(name, n)
+            if breaking:
+                add()
+            solver = BT(csp)
+            solver.quiet()
+            if mode == "count":
+                solutions = solver.count_solutions(prop, var_ord)
+                stats = solver.stats
+            else:
+                stats = solver.bt_search(prop, var_ord)
+                solutions = int(stats.status == True)
+                solver.restore_all_variable_domains()
+            row += [solutions, stats.decisions, stats.time]
+        print("{:<8} {:<6} {:>10} {:>10} {:>10.4f} {:>10} {:>10} {:>10.4f}".format(
+            "{}-{}".format(name, n), mode, *row))
+
+def bench_preprocessing(boards=None, prop=prop_GAC, var_ord=ord_mrv, 
+                        model=kenken_csp.kenken_csp_model, rpc=False, time_limit=None):
+    '''
+    Solve every board (default BOARDS and a generated board of each size 
+    from 6 to 10) with and without preprocessing, which uses the same 
+    propagator as the search.
+    '''
+    if boards is None:
+        boards = list(BOARDS) + kenken_boards.corpus(range(6, 11), per_size=1)
+    print("{:<6} {:<6} {:>10} {:>10} {:>10} {:>10} {:>10} {:>10} {:>10}".format(
+        "board", "size", "decisions", "solve", "prop rem", "pre rem", "pre time",
+        "decisions", "solve"))
+    for n, board in enumerate(boards):
+        csp, _ = model([list(cage) for cage in board])
+        solver = BT(csp)
+        solver.quiet()
+        plain = solver.bt_search(prop, var_ord)
+        csp, _ = model([list(cage) for cage in board])
+        result = preprocessing.preprocess(csp, prop, time_limit, rpc)
+        solver = BT(csp)
+        solver.quiet()
+        stats = solver.bt_search(prop, var_ord)
+        print("{:<6} {:<6} {:>10} {:>10.4f} {:>10} {:>10} {:>10.4f} {:>10} {:>10.4f}".format(
+            n + 1, "{}x{}".format(board[0][0], board[0][0]), plain.decisions, plain.time, 
+            result['propagator_removed'], result['removed'], result['time'], 
+            stats.decisions, stats.time))
+
+def bench_cages(boards=None, models=(kenken_csp.kenken_csp_model, 
+                                      kenken_csp.kenken_csp_model_nary),
+                props=(prop_GAC, prop_CT), var_ord=ord_mrv):
+    '''
+    Compare the cage constraints on every board (default a generated 6x6 
+    and 7x7 board with cages of 3 to 8 cells), built with the size limits 
+    of each mode (see kenken_csp.cage_constraint).
+    '''
+    if boards is None:
+        rng = random.Random(3)
+        boards = [kenken_boards.generate_board(n, rng, sizes={3: 1, 5: 2, 6: 2, 7: 1, 8: 1})
+                  for n in (6, 7)]
+    #(arithmetic_size, domain_size) of each way to model the cages
+    modes = [("table", (float('inf'), 0)), ("domain", (5, float('inf'))), ("bounds", (5, 0))]
+    print("{:<6} {:<24} {:<9} {:<8} {:>10} {:>10} {:>10}".format(
+        "size", "model", "prop", "cages", "build", "decisions", "solve"))
+    for board in boards:
+        n = board[0][0]
+        for model in models:
+            for prop in props:
+                for mode, (arithmetic_size, domain_size) in modes:
+                    stime = time.perf_counter()
+                    csp, _ = model([list(cage) for cage in board], arithmetic_size, domain_size)
+                    build = time.perf_counter() - stime
+                    solver = BT(csp)
+                    solver.quiet()
+                    stats = solver.bt_search(prop, var_ord)
+                    print("{:<6} {:<24} {:<9} {:<8} {:>10.4f} {:>10} {:>10.4f}".format(
+                        "{}x{}".format(n, n), model.__name__, prop.__name__, mode, 
+                        build, stats.decisions, stats.time))
+
+def bench_local_search(queens=(50, 200, 1000, 2000), grids=(10, 30, 50), 
+                       max_steps=100000, max_decisions=20000, bt_vars=1000, seed=1):
+    '''
+    Compare min-conflicts with backtracking on large n-Queens and Latin 
+    squares. bt_search only runs on problems of up to bt_vars variables 
+    (every propagation of the all-different constraints is quadratic or 
+    worse in their size). A search that reaches its budget is reported as 
+    "budget".
+    '''
+    print("{:<12} {:>10} {:>10} {:>8} {:>10} {:>10} {:>8}".format(
+        "problem", "moves", "time", "result", "decisions", "time", "result"))
+    runs = [("queens", n) for n in queens] + [("grid", n) for n in grids]
+    for name, n in runs:
+        row = []
+        if name == "queens":
+            build = lambda: localsearch.queens_csp(n)
+        else:
+            build = lambda: kenken_csp.nary_ad_grid([[n]])[0]
+        solver = localsearch.MinConflicts(build())
+        solver.quiet()
+        solved = solver.search(max_steps, seed=seed)
+        row += [solver.nSteps, solver.runtime, "solved" if solved else "budget"]
+        if len(build().get_all_vars()) > bt_vars:
+            print("{:<12} {:>10} {:>10.4f} {:>8}".format("{}-{}".format(name, n), *row))
+            continue
+        solver = BT(build())
+        solver.quiet()
+        stats = solver.bt_search(prop_GAC, ord_mrv, max_decisions=max_decisions)
+        solver.stop()
+        row += [stats.decisions, stats.time, {True: "solved", False: "none", None: "budget"}[stats.status]]
+        print("{:<12} {:>10} {:>10.4f} {:>8} {:>10} {:>10.4f} {:>8}".format(
+            "{}-{}".format(name, n), *row))
+
+def bench_serialize(queens=(20, 40, 60), boards=None,
+                    models=(kenken_csp.kenken_csp_model, kenken_csp.kenken_csp_model_nary)):
+    '''
+    Compare building a model with loading it from a file saved by
+    serialize.save_csp. The memoized cage tables are cleared before each
+    build, as in a new process.
+    '''
+    if boards is None:
+        boards = BOARDS
+    runs = [("queens-{}".format(n), lambda n=n: (nQueens(n), None)) for n in queens]
+    for model in models:
+        for k, board in enumerate(boards):
+            runs.append(("{}-{}".format(model.__name__, k + 1), 
+                         lambda model=model, board=board: model([list(cage) for cage in board])))
+    print("{:<28} {:>9} {:>9} {:>9} {:>10} {:>10} {:>10}".format(
+        "problem", "build", "save", "load", "size KB", "GAC built", "GAC load"))
+    with tempfile.TemporaryDirectory() as tmp:
+        file = os.path.join(tmp, "bench.csp")
+        for name, build in runs:
+            kenken_csp.cage_tuples.cache_clear()
+            stime = time.perf_counter()
+            csp, var_array = build()
+            built = time.perf_counter() - stime
+            stime = time.perf_counter()
+            serialize.save_csp(csp, file, var_array)
+            saved = time.perf_counter() - stime
+            stime = time.perf_counter()
+            loaded, _ = serialize.load_csp(file)
+            load = time.perf_counter() - stime
+            stime = time.perf_counter()
+            prop_GAC(csp)
+            gac = time.perf_counter() - stime
+            stime = time.perf_counter()
+            prop_GAC(loaded)
+            gac_loaded = time.perf_counter() - stime
+            serialize.close_csp(loaded)
+            print("{:<28} {:>9.4f} {:>9.4f} {:>9.4f} {:>10.1f} {:>10.4f} {:>10.4f}".format(
+                name, built, saved, load, os.path.getsize(file) / 1e3, gac, gac_loaded))
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["scaling"]:
+        bench_scaling(json_file=sys.argv[2] if len(sys.argv) > 2 else None)
+        sys.exit()
+    if sys.argv[1:2] == ["symmetry"]:
+        bench_symmetry()
+        sys.exit()
+    if sys.argv[1:2] == ["preprocessing"]:
+        bench_preprocessing()
+        sys.exit()
+    if sys.argv[1:2] == ["cages"]:
+        bench_cages()
+        sys.exit()
+    if sys.argv[1:2] == ["localsearch"]:
+        bench_local_search()
+        sys.exit()
+    if sys.argv[1:2] == ["serialize"]:
+        bench_serialize()
+        sys.exit()
+
+    print("Bitset domains vs list domains (kenken_csp_model, ord_mrv)")
+    bench_domains()
+    print()
+    print("Compact-table vs GAC (kenken_csp_model, ord_mrv)")
+    bench_propagators()
+    print()
+    print("Backjumping vs backtracking (kenken_csp_model, ord_mrv)")
+    bench_backjumping()
+    print()
+    print("Scaling on generated boards (ord_mrv)")
+    bench_scaling()
+    print()
+    print("Symmetry breaking (prop_GAC, ord_mrv)")
+    bench_symmetry()
+    print()
+    print("SAC preprocessing (kenken_csp_model, prop_GAC, ord_mrv)")
+    bench_preprocessing()
+    print()
+    print("Large cages as tables and arithmetic constraints (ord_mrv)")
+    bench_cages()
+    print()
+    print("Min-conflicts vs backtracking (prop_GAC, ord_mrv)")
+    bench_local_search()
+    print()
+    print("Building models vs loading saved CSPs")
+    bench_serialize()
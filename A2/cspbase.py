@@ -20,6 +20,22 @@ Constraint Satisfaction Routines and Objects
     - Once initialized, one can incrementally add lists of satisfying tuples. 
       Each tuple specifies a value for each variable in the constraint (in the 
       same ORDER that the variables of the constraint were specified in).
+    - The tuples are stored in an immutable Relation, interned so that 
+      constraints with the same table share one copy and one index.
+    - FunctionConstraint is a variant defined by a predicate over the values of 
+      the scope instead of a table. Its supports are found by searching the 
+      current domains, so nothing is enumerated up front.
+    - AllDiffConstraint is a native all-different constraint. It enforces GAC 
+      with Regin's bipartite matching filter instead of support checks.
+    - A table constraint can also be filtered through its CompactTable, which 
+      keeps the set of live tuples as a bitset (see prop_CT).
+    - SumConstraint and ProductConstraint (ArithmeticConstraint) require the 
+      values of the scope to add or multiply up to a total, with a bounds 
+      consistency filter or, for small scopes, a domain consistency one.
+    - NogoodConstraint forbids one combination of assignments. bt_search 
+      learns them when it restarts.
+    - LexLeqConstraint orders two vectors of variables lexicographically, 
+      to break symmetries.
 
 3. CSP object
     - Class for packing up a set of variables into a CSP problem. 
@@ -27,22 +43,42 @@ Constraint Satisfaction Routines and Objects
     - The variables of the CSP can be added later or on initialization. 
     - The constraints must be added later.
 
-4. BT object
+4. Trail object
+    - An undo log of value prunings. Variables attached to a trail record every 
+      value they prune onto it.
+    - Checkpoints mark decision levels; backtracking pops the log back to the 
+      last checkpoint, restoring every value pruned since.
+
+5. BT object
     - A class to encapsulate things like statistics and bookeeping for 
       pruning/unpruning variabel domains. 
     - To use the backtracking routine make one of these objects passing the CSP 
       as a parameter. 
     - Then you can invoke the Backtracking Routine (method of BT object).
 
-5. Backtracking Routine
+6. Backtracking Routine
     - bt_search (inside of BT class)
     - takes a propagator and a CSP as arguments
     - Executes backtracking, forward-checking or GAC, depending on the 
       propagator argument.
+    - Optionally restarts the search with growing decision cutoffs 
+      (luby_cutoffs, geometric_cutoffs), randomized tie-breaking and nogoods 
+      learned from each interrupted run.
+    - solutions (generator of every solution) and count_solutions (number of 
+      solutions) search the whole tree with the same arguments.
+    - Returns a SearchStats (time split, prunings and wipeouts per 
+      constraint, maximum depth) and can log a binary SearchTrace.
 '''
 
 import time
+import random
+import collections
+import json
+import struct
+import weakref
 import functools
+import itertools
+import operator
 
 class Variable: 
     '''
@@ -54,19 +90,34 @@ class Variable:
     The variable object offers two types of functionality to support
     search.
 
-    (a) It has a current domain, implimented as a set of flags 
-    determining which domain values are "current", i.e., unpruned.
+    (a) It has a current domain, implimented as an integer bitmask 
+    determining which domain values are "current", i.e., unpruned. Bit i of 
+    the mask is the flag for dom[i], and dom_index maps each value to its bit 
+    so that membership tests, pruning and restoring are O(1) and the size of 
+    the current domain is a popcount.
     - you can prune a value, and restore it.
     - you can obtain a list of values in the current domain, or count
         how many are still there
 
     (b) You can assign and unassign a value to the variable.
     The assigned value must be from the variable domain, and
-    you cannot assign to an already assigned variable.
+    you cannot assign to an already assigned variable. Assigning and 
+    unassigning also updates the unassigned counters of every constraint 
+    with the variable in its scope.
 
     You can get the assigned value e.g., to find the solution after
     search.
 
+    (c) While attached to a Trail (bt_search does this), every value that is 
+    actually removed by prune_value is recorded on the trail so that search 
+    can restore it on backtrack. Pruning a value that is not current is a 
+    no-op and is not recorded.
+
+    (d) A variable ordering (see VarHeap in heuristics) can set itself as 
+    the variable's order to be notified of every change of its current 
+    domain and of every assignment, so that it can keep its priorities up to 
+    date instead of rescanning all the variables at each decision.
+
     Assignments and current domain interact at the external interface
     level. Assignments do not affect the internal state of the current domain 
     so as not to interact with value pruning and restoring during search. 
@@ -89,9 +140,16 @@ class Variable:
         specify the initial domain.
         '''
         self.name          = name                 # Text name for variable
-        self.dom           = list(domain)         # Make a copy of passed domain
-        self.curdom        = [True] * len(domain) # Using list
+        self.dom           = []                   # Permanent domain values
+        self.dom_index     = dict()               # Value -> bit position in curdom
+        self.curdom        = 0                    # Bitmask, bit i set if dom[i] is current
         self.assignedValue = None                 # For bt_search
+        self.trail         = None                 # Trail recording prunings, set by bt_search
+        self.watchers      = []                   # (Constraint, position in its scope) pairs
+        self.order         = None                 # Variable ordering to notify of changes
+        self.level         = 0                    # Decision level of the assignment, set by bt_search
+        self.expl          = 0                    # Bitmask of the decision levels the prunings depend on
+        self.add_domain_values(domain)
 
     def add_domain_values(self, values):
         '''
@@ -99,8 +157,11 @@ class Variable:
         removals.
         '''
         for val in values: 
+            self.dom_index.setdefault(val, len(self.dom))
+            self.curdom |= 1 << len(self.dom)
             self.dom.append(val)
-            self.curdom.append(True)
+        if self.order is not None:
+            self.order.changed(self)
 
     def domain_size(self):
         '''Return the size of the (permanent) domain'''
@@ -113,51 +174,55 @@ class Variable:
     # Methods for current domain (pruning and unpruning)
     def prune_value(self, value):
         '''Remove value from CURRENT domain'''
-        self.curdom[self.value_index(value)] = False
+        bit = 1 << self.dom_index[value]
+        if self.curdom & bit:
+            self.curdom ^= bit
+            if self.trail is not None:
+                self.trail.record(self, value)
+            if self.order is not None:
+                self.order.changed(self)
 
     def unprune_value(self, value):
         '''Restore value to CURRENT domain'''
-        self.curdom[self.value_index(value)] = True
+        self.curdom |= 1 << self.dom_index[value]
+        if self.order is not None:
+            self.order.changed(self)
 
     def cur_domain(self):
         '''
         Return list of values in CURRENT domain (if assigned only assigned value 
         is viewed as being in current domain).
         '''
-        vals = []
-        if self.is_assigned():
-            vals.append(self.get_assigned_value())
-        else:
-            for i, val in enumerate(self.dom):
-                if self.curdom[i]:
-                    vals.append(val)
-        return vals
+        if self.assignedValue is not None:
+            return [self.assignedValue]
+        mask = self.curdom
+        return [val for i, val in enumerate(self.dom) if mask >> i & 1]
 
     def in_cur_domain(self, value):
         '''
         Check if value is in CURRENT domain (without constructing list) if 
         assigned only assigned value is viewed as being in current domain
         '''
-        if not value in self.dom:
+        i = self.dom_index.get(value)
+        if i is None:
             return False
-        if self.is_assigned():
-            return value == self.get_assigned_value()
-        else:
-            return self.curdom[self.value_index(value)]
+        if self.assignedValue is not None:
+            return value == self.assignedValue
+        return self.curdom >> i & 1 == 1
 
     def cur_domain_size(self):
         '''
         Return the size of the variables domain (without constructing list)
         '''
-        if self.is_assigned():
+        if self.assignedValue is not None:
             return 1
-        else:
-            return(sum(1 for v in self.curdom if v))
+        return self.curdom.bit_count()
 
     def restore_curdom(self):
         '''Return all values back into CURRENT domain'''
-        for i in range(len(self.curdom)):
-            self.curdom[i] = True
+        self.curdom = (1 << len(self.dom)) - 1
+        if self.order is not None:
+            self.order.changed(self)
 
     #methods for assigning and unassigning
     def is_assigned(self):
@@ -174,6 +239,11 @@ class Variable:
                   "that is already assigned or illegal value (not in curdom)")
             return
         self.assignedValue = value
+        for c, i in self.watchers:
+            c.n_unasgn -= 1
+            c.unasgn_xor ^= i
+        if self.order is not None:
+            self.order.assigned(self)
 
     def unassign(self):
         '''Used by bt_search. Unassign and restore old curdom'''
@@ -181,18 +251,35 @@ class Variable:
             print("ERROR: trying to unassign variable", self, " not yet assigned")
             return
         self.assignedValue = None
+        for c, i in self.watchers:
+            c.n_unasgn += 1
+            c.unasgn_xor ^= i
+        if self.order is not None:
+            self.order.unassigned(self)
 
     def get_assigned_value(self):
         '''return assigned value...returns None if is unassigned'''
         return self.assignedValue
 
+    def culprits(self):
+        '''
+        Bitmask of the decision levels the current domain depends on (bit L 
+        for level L): the level of the assignment if assigned, otherwise the 
+        levels that explain the values pruned so far. Only maintained while 
+        bt_search backjumps.
+        '''
+        if self.assignedValue is not None:
+            return 1 << self.level
+        return self.expl
+
     #internal methods
     def value_index(self, value):
         '''
-        Domain values need not be numbers, so return the index in the domain 
-        list of a variable value.
+        Domain values need not be numbers (but must be hashable), so return the 
+        index in the domain list of a variable value. This is also the bit 
+        position of the value in curdom.
         '''
-        return self.dom.index(value)
+        return self.dom_index[value]
 
     def __repr__(self):
         return("Var-{}".format(self.name))
@@ -204,7 +291,81 @@ class Variable:
         '''Also print the variable domain and current domain'''
         print("Var--\"{}\": Dom = {}, CurDom = {}".format(self.name, 
                                                              self.dom, 
-                                                             self.curdom))
+                                                             self.cur_domain()))
+class Relation:
+    '''
+    Immutable table of satisfying tuples, shared by every Constraint with the 
+    same table. Build them with Relation.intern(tuples), which returns the 
+    existing relation if one with the same tuples (in the same order) is 
+    still in use, so e.g. the n*(n-1) not-equal tuples of all the cell pairs 
+    of a grid are stored and indexed once.
+
+        tuples   - the distinct tuples, in the order they were given
+        sat      - dict with the tuples as keys, for membership tests
+        supports - supports[i][val] is the tuple of the tuples giving value 
+                   val at position i of the scope
+    
+    Relations are indexed by position, so they do not refer to variables. 
+    The CompactTable support bitsets of a relation are also built once per 
+    list of domains (see bitsets).
+    '''
+
+    interned = weakref.WeakValueDictionary()
+
+    @classmethod
+    def intern(cls, tuples):
+        '''Return the shared Relation of tuples, an iterable of sequences'''
+        if isinstance(tuples, Relation):
+            return tuples
+        key = tuple(dict.fromkeys(tuple(t) for t in tuples))
+        relation = cls.interned.get(key)
+        if relation is None:
+            relation = cls(key)
+            cls.interned[key] = relation
+        return relation
+
+    def __init__(self, tuples):
+        '''Internal, use Relation.intern. tuples is a tuple of distinct tuples'''
+        self.tuples = tuples
+        self.sat = dict.fromkeys(tuples, True)
+        supports = []
+        for t in tuples:
+            while len(supports) < len(t):
+                supports.append(dict())
+            for i, val in enumerate(t):
+                supports[i].setdefault(val, []).append(t)
+        self.supports = [dict((val, tuple(sups)) for val, sups in sup.items()) 
+                         for sup in supports]
+        self.cts = dict() #CompactTable support bitsets, see bitsets
+
+    def bitsets(self, doms):
+        '''
+        Return (supports, all_live) for a CompactTable over variables with 
+        the domain lists doms: supports[i][j] is the bitset of the tuples 
+        (numbered in order) giving position i the value doms[i][j], all_live 
+        the bitset of the tuples whose values are all in the domains.
+        '''
+        key = tuple(tuple(dom) for dom in doms)
+        ct = self.cts.get(key)
+        if ct is None:
+            index = [dict((val, j) for j, val in enumerate(dom)) for dom in key]
+            supports = [[0] * len(dom) for dom in key]
+            all_live = 0
+            for ti, t in enumerate(self.tuples):
+                bit = 1 << ti
+                for i, val in enumerate(t):
+                    j = index[i].get(val)
+                    if j is None:
+                        break
+                    supports[i][j] |= bit
+                else:
+                    all_live |= bit
+            ct = self.cts[key] = (supports, all_live)
+        return ct
+
+    def __len__(self):
+        return len(self.tuples)
+
 class Constraint: 
     '''
     Class for defining constraints variable objects specifes an ordering over 
@@ -221,7 +382,9 @@ class Constraint:
 
         Constraints are implemented by storing a set of satisfying tuples (i.e., 
         each tuple specifies a value for each variable in the scope such that 
-        this sequence of values satisfies the constraints).
+        this sequence of values satisfies the constraints). The tuples are 
+        kept in a Relation, which is shared by every constraint with the same 
+        table.
 
         NOTE: This is a very space expensive representation...a proper 
         constraint object would allow for representing the constraint with a 
@@ -230,29 +393,60 @@ class Constraint:
 
         self.scope = list(scope)
         self.name = name
-        self.sat_tuples = dict()
+        self.relation = Relation.intern(())
+        self.position = dict((var, i) for i, var in enumerate(self.scope))
+
+        # Number of unassigned variables in the scope, and the XOR of their 
+        # positions in the scope (which is the position of the last one when 
+        # only one is left). Kept up to date by Variable.assign/unassign.
+        self.n_unasgn = 0
+        self.unasgn_xor = 0
+        for i, var in enumerate(self.scope):
+            var.watchers.append((self, i))
+            if not var.is_assigned():
+                self.n_unasgn += 1
+                self.unasgn_xor ^= i
+
+        # Residual supports (AC-3rm): for each variable/value pair the index in 
+        # its supports of the last support has_support found. It is only a hint 
+        # that is rechecked on use, so it stays correct across backtracking 
+        # without being restored.
+        self.residues = dict()
+
+        # CompactTable used by prop_CT, built on first use.
+        self.ct = None
 
-        # The next object data item 'sup_tuples' will be used to help support 
-        # GAC propgation. It allows access to a list of satisfying tuples that 
-        # contain a particular variable/value pair.
-        self.sup_tuples = dict()
+        # Conflict weight for dom/wdeg, increased each time a propagator 
+        # finds the constraint causes a domain wipeout.
+        self.weight = 1
 
     def add_satisfying_tuples(self, tuples):
         '''
         We specify the constraint by adding its complete list of satisfying 
-        tuples.
+        tuples. tuples may also be a Relation, which is then shared.
         '''
-        for x in tuples:
-            t = tuple(x)  #ensure we have an immutable tuple
-            if not t in self.sat_tuples:
-                self.sat_tuples[t] = True
+        if not self.relation.tuples:
+            self.relation = Relation.intern(tuples)
+        else:
+            self.relation = Relation.intern(self.relation.tuples + 
+                                            tuple(tuple(x) for x in tuples))
 
-            #now put t in as a support for all of the variable values in it
-            for i, val in enumerate(t):
-                var = self.scope[i]
-                if not (var,val) in self.sup_tuples:
-                    self.sup_tuples[(var,val)] = []
-                self.sup_tuples[(var,val)].append(t)
+    @property
+    def sat_tuples(self):
+        '''The satisfying tuples, as the keys of a dict (do not modify it)'''
+        return self.relation.sat
+
+    @property
+    def sup_tuples(self):
+        '''
+        Dict mapping (variable, value) to the list of satisfying tuples 
+        that contain it. Built from the relation on each call.
+        '''
+        sup_tuples = dict()
+        for var, sup in zip(self.scope, self.relation.supports):
+            for val, sups in sup.items():
+                sup_tuples[(var, val)] = list(sups)
+        return sup_tuples
 
     def get_scope(self):
         '''Get the list of variables that the constraint is over'''
@@ -266,39 +460,56 @@ class Constraint:
         list of values are must be ordered in the same order as the list of 
         variables in the constraints scope.
         '''
-        return tuple(vals) in self.sat_tuples
+        return tuple(vals) in self.relation.sat
 
     def get_n_unasgn(self):
         '''
         Return the number of unassigned variables in the constraint's scope.
         '''
-        n = 0
-        for v in self.scope:
-            if not v.is_assigned():
-                n = n + 1
-        return n
+        return self.n_unasgn
 
     def get_unasgn_vars(self): 
         '''
         Return list of unassigned variables in constraint's scope. 
         NOTE: more expensive to get the list than to then number.
         '''
-        vs = []
-        for v in self.scope:
-            if not v.is_assigned():
-                vs.append(v)
-        return vs
+        if self.n_unasgn == 0:
+            return []
+        if self.n_unasgn == 1:
+            return [self.scope[self.unasgn_xor]]
+        return [v for v in self.scope if v.assignedValue is None]
+
+    def get_last_unasgn_var(self):
+        '''
+        Return the only unassigned variable of the scope in O(1), or None if 
+        the number of unassigned variables is not exactly one.
+        '''
+        if self.n_unasgn == 1:
+            return self.scope[self.unasgn_xor]
+        return None
 
     def has_support(self, var, val):
         '''
         Test if a variable value pair has a supporting tuple (a set of 
         assignments satisfying the constraint where each value is still in the 
         corresponding variables current domain.
+
+        The residual support of the pair is checked first, then the scan 
+        resumes after it and wraps around, so every tuple is still visited 
+        before giving up.
         '''
-        if (var, val) in self.sup_tuples:
-            for t in self.sup_tuples[(var, val)]:
-                if self.tuple_is_valid(t):
-                    return True
+        supports = self.relation.supports
+        i = self.position[var]
+        if i >= len(supports):
+            return False
+        sups = supports[i].get(val)
+        if not sups:
+            return False
+        res = self.residues.get((var, val), 0)
+        for i in itertools.chain(range(res, len(sups)), range(res)):
+            if self.tuple_is_valid(sups[i]):
+                self.residues[(var, val)] = i
+                return True
         return False
 
     def tuple_is_valid(self, t):
@@ -306,14 +517,915 @@ class Constraint:
         Internal routine. Check if every value in tuple is still in 
         corresponding variable domains.
         '''
-        for i, var in enumerate(self.scope):
-            if not var.in_cur_domain(t[i]):
+        for var, val in zip(self.scope, t):
+            if not var.in_cur_domain(val):
                 return False
         return True
 
+    # The filter of a plain table constraint is not idempotent: pruning a 
+    # later variable of the scope can remove the support of a value of an 
+    # earlier one, so the propagation queue has to revise it again after it 
+    # prunes. Filters that reach their fixpoint in one call set this to True.
+    idempotent = False
+
+    def queue_priority(self):
+        '''
+        Scheduling class in the propagation queue, lower is revised first. 
+        Binary constraints are the cheapest to revise.
+        '''
+        return 0 if len(self.scope) <= 2 else 1
+
+    def prune_unsupported(self, changed_vars=None):
+        '''
+        Make this constraint GAC: prune every value in the current domains of 
+        the scope that has no support. Return the list of variables whose 
+        current domain was reduced, in the order they were first pruned. 
+        Stops at the first domain wipeout, which the caller detects from the 
+        last variable of the list having an empty current domain.
+
+        changed_vars is the set of scope variables whose domains changed since 
+        the constraint was last made GAC, or None if unknown. The values of a 
+        variable only lose support when another variable changes, so if only 
+        one variable changed its own values are not rechecked.
+
+        prop_GAC calls this for every constraint it revises. Subclasses with a 
+        dedicated filtering algorithm override it.
+        '''
+        skip = None
+        if changed_vars is not None and len(changed_vars) == 1:
+            skip = next(iter(changed_vars))
+        changed = []
+        for var in self.scope:
+            if var is skip:
+                continue
+            for d in var.cur_domain():
+                if not self.has_support(var, d):
+                    var.prune_value(d)
+                    if not changed or changed[-1] is not var:
+                        changed.append(var)
+                    if var.cur_domain_size() == 0:
+                        return changed
+        return changed
+
+    def compact_table(self):
+        '''
+        Return the CompactTable prop_CT uses to filter this constraint, built 
+        on first use and rebuilt if tuples were added since. Constraints that 
+        are not defined by a table return None.
+        '''
+        if self.ct is None or self.ct.relation is not self.relation:
+            self.ct = CompactTable(self)
+        return self.ct
+
+    def support_counts(self, var):
+        '''
+        Return a dict mapping each value a in the current domain of var to 
+        the number of (variable, value) pairs of the other unassigned 
+        variables of the scope that still have a support once var = a, i.e. 
+        what val_lcv counts by assigning a and calling has_support. Nothing 
+        is assigned: table constraints read the counts off their 
+        CompactTable, the others test each pair with feasible().
+        '''
+        ct = self.compact_table()
+        if ct is not None:
+            return ct.support_counts(var)
+        doms = [v.cur_domain() for v in self.scope]
+        i = self.scope.index(var)
+        counts = dict()
+        for a in doms[i]:
+            n = 0
+            fixed = list(doms)
+            fixed[i] = [a]
+            for j, other in enumerate(self.scope):
+                if j == i or other.is_assigned():
+                    continue
+                for b in doms[j]:
+                    fixed[j] = [b]
+                    if self.feasible(fixed):
+                        n += 1
+                fixed[j] = doms[j]
+            counts[a] = n
+        return counts
+
+    def feasible(self, doms):
+        '''
+        Test if some satisfying tuple takes its values from doms, a list of 
+        value lists ordered like the scope.
+        '''
+        doms = [set(d) for d in doms]
+        for t in self.relation.tuples:
+            if all(val in d for val, d in zip(t, doms)):
+                return True
+        return False
+
+    def culprits(self):
+        '''Bitmask of the decision levels the domains of the scope depend on'''
+        levels = 0
+        for var in self.scope:
+            levels |= var.culprits()
+        return levels
+
+    def blame(self):
+        '''
+        Called by the propagators before they prune with this constraint. 
+        When bt_search backjumps, the values pruned until the next blame() 
+        are then explained by the culprits of the scope.
+        '''
+        trail = self.scope[0].trail if self.scope else None
+        if trail is not None:
+            trail.blamed = self
+            if trail.explaining:
+                trail.reason = self.culprits()
+
+    def record_conflict(self):
+        '''
+        Called by the propagators when this constraint wipes out a domain (or 
+        is violated). Increase its weight and tell the variable ordering of 
+        the scope, if any. When bt_search backjumps, also report the culprits 
+        of the scope as the conflict set of the dead-end.
+        '''
+        self.weight += 1
+        trail = self.scope[0].trail if self.scope else None
+        if trail is not None:
+            trail.failed = self
+            if trail.stats is not None:
+                trail.stats.wipeouts[self.name] += 1
+            if trail.explaining:
+                trail.conflict = self.culprits()
+        for var in self.scope:
+            if var.order is not None:
+                var.order.conflict(self)
+                return
+
+    def wipe_out(self):
+        '''
+        Internal routine for filters that detect the constraint can not be 
+        satisfied. Every value is then unsupported, so prune the domain of an 
+        unassigned variable of the scope until it is empty. Return the 
+        changed variables list as prune_unsupported does. If every variable 
+        is assigned there is no domain to empty and [] is returned: the 
+        propagators check fully assigned constraints themselves (see 
+        GAC_enforce).
+        '''
+        for var in self.scope:
+            if not var.is_assigned():
+                for d in var.cur_domain():
+                    var.prune_value(d)
+                return [var]
+        return []
+
     def __str__(self):
         return("{}({})".format(self.name,[var.name for var in self.scope]))
 
+class CompactTable:
+    '''
+    Compact-table (STR-style) filtering state for a table Constraint. 
+
+    The satisfying tuples are numbered and the tuples that are still live, 
+    i.e. whose values are all in the current domains, are kept as one integer 
+    bitset. supports[i][j] is the bitset of tuples giving scope[i] the value 
+    scope[i].dom[j]. Domain reductions since the last call are applied to the 
+    live set in one pass (removing the supports of the deleted values, or 
+    keeping those of the remaining ones, whichever is fewer), and then a value 
+    is supported iff its support bitset meets the live set.
+
+    The live set is trailed, so bt_search restores it on backtrack. If 
+    domains grew without a backtrack (e.g. bt_search restoring all domains 
+    before starting) it is recomputed from scratch.
+    '''
+
+    #pruning values without live support does not change the live set
+    idempotent = True
+
+    def __init__(self, con):
+        self.scope = con.scope
+        self.con = con
+        self.relation = con.relation
+        self.n_tuples = len(con.relation)
+        #shared by the constraints with the same relation and domains
+        self.supports, self.all_live = con.relation.bitsets([var.dom for var in self.scope])
+        self.full_doms = tuple((1 << len(var.dom)) - 1 for var in self.scope)
+        #(live tuples, effective domain bitmask of each scope variable that 
+        #the live tuples were last restricted to)
+        self.state = (self.all_live, self.full_doms)
+        self.saved_trail = None
+        self.saved_stamp = None
+
+    def prune_unsupported(self, changed_vars=None):
+        '''
+        Update the live tuples to the current domains and prune every value 
+        without a live support. Same contract as 
+        Constraint.prune_unsupported, the changed variables are found from 
+        the domains themselves.
+        '''
+        scope = self.scope
+        supports = self.supports
+        live, doms = self.state
+        cur = [1 << var.dom_index[var.assignedValue] 
+               if var.assignedValue is not None else var.curdom for var in scope]
+        for dom, last in zip(cur, doms):
+            if dom & ~last:
+                live, doms = self.all_live, self.full_doms
+                break
+        for i, dom in enumerate(cur):
+            if dom != doms[i]:
+                removed = doms[i] & ~dom
+                if removed.bit_count() < dom.bit_count():
+                    live &= ~self.union(supports[i], removed)
+                else:
+                    live &= self.union(supports[i], dom)
+        if live == 0:
+            self.set_state(live, cur)
+            return self.con.wipe_out()
+
+        changed = []
+        for i, var in enumerate(scope):
+            sup = supports[i]
+            m = cur[i]
+            while m:
+                low = m & -m
+                m ^= low
+                j = low.bit_length() - 1
+                if not sup[j] & live:
+                    var.prune_value(var.dom[j])
+                    cur[i] ^= low
+                    if not changed or changed[-1] is not var:
+                        changed.append(var)
+            if var.assignedValue is None and not cur[i]:
+                break
+        self.set_state(live, cur)
+        return changed
+
+    def support_counts(self, var):
+        '''
+        Constraint.support_counts from the support bitsets: a pair (other, b) 
+        counts for var = a iff some live tuple supports both. The live tuples 
+        kept by prop_CT are reused when they are up to date with the current 
+        domains, otherwise they are recomputed in one pass.
+        '''
+        scope = self.scope
+        supports = self.supports
+        cur = [1 << v.dom_index[v.assignedValue] 
+               if v.assignedValue is not None else v.curdom for v in scope]
+        live, doms = self.state
+        if doms != tuple(cur):
+            live = self.all_live
+            for i, dom in enumerate(cur):
+                if dom != self.full_doms[i]:
+                    live &= self.union(supports[i], dom)
+        i = scope.index(var)
+        counts = dict()
+        for a in var.cur_domain():
+            with_a = live & supports[i][var.dom_index[a]]
+            n = 0
+            if with_a:
+                for j, other in enumerate(scope):
+                    if j == i or other.assignedValue is not None:
+                        continue
+                    sup = supports[j]
+                    m = cur[j]
+                    while m:
+                        low = m & -m
+                        m ^= low
+                        if sup[low.bit_length() - 1] & with_a:
+                            n += 1
+            counts[a] = n
+        return counts
+
+    def union(self, sup, mask):
+        '''Internal routine. OR of the support bitsets of the values in mask'''
+        tuples = 0
+        while mask:
+            low = mask & -mask
+            mask ^= low
+            tuples |= sup[low.bit_length() - 1]
+        return tuples
+
+    def set_state(self, live, doms):
+        '''Internal routine. Trail the state once per level, then update it'''
+        trail = self.scope[0].trail if self.scope else None
+        if trail is not None and (self.saved_trail is not trail or 
+                                  self.saved_stamp != trail.stamp):
+            trail.save(self, 'state')
+            self.saved_trail = trail
+            self.saved_stamp = trail.stamp
+        self.state = (live, tuple(doms))
+
+    def n_live(self):
+        '''Number of live tuples as of the last call'''
+        return self.state[0].bit_count()
+
+class FunctionConstraint(Constraint):
+    '''
+    Constraint defined by a predicate (intensionally) instead of a table of 
+    satisfying tuples. It can be used anywhere a Constraint can: check() calls 
+    the predicate and has_support() searches the CURRENT domains of the scope 
+    for a satisfying tuple, so memory and build time do not depend on the 
+    number of satisfying tuples.
+    '''
+
+    def __init__(self, name, scope, predicate, partial=False):
+        '''
+        predicate is called with a list of values ordered like scope and 
+        returns True iff they satisfy the constraint. 
+
+        If partial is True the predicate must also accept a prefix of such a 
+        list (values for the first k variables of the scope) and return False 
+        only if no extension of the prefix can satisfy the constraint, e.g. 
+        lambda vals: len(set(vals)) == len(vals) for all-different. The 
+        support search then abandons a prefix as soon as the predicate rejects 
+        it instead of enumerating every combination of the current domains.
+        '''
+        Constraint.__init__(self, name, scope)
+        self.predicate = predicate
+        self.partial = partial
+
+    def add_satisfying_tuples(self, tuples):
+        print("WARNING: Trying to add satisfying tuples to function constraint ", self)
+
+    def compact_table(self):
+        return None
+
+    def queue_priority(self):
+        #support search may enumerate many combinations of the domains
+        return 2
+
+    def check(self, vals):
+        return bool(self.predicate(list(vals)))
+
+    def has_support(self, var, val):
+        '''
+        Test if var = val extends to an assignment of the scope, using only 
+        values in the current domains, that satisfies the predicate.
+        '''
+        if not var.in_cur_domain(val):
+            return False
+        return self.feasible([[val] if v is var else v.cur_domain() 
+                              for v in self.scope])
+
+    def feasible(self, doms):
+        if not self.partial:
+            for t in itertools.product(*doms):
+                if self.predicate(list(t)):
+                    return True
+            return False
+        return self.extend(doms, [])
+
+    def extend(self, doms, vals):
+        '''
+        Internal routine. Depth first search for a satisfying extension of the 
+        prefix vals, with values drawn from doms. Uses the predicate to reject 
+        prefixes.
+        '''
+        if len(vals) == len(doms):
+            return True
+        for d in doms[len(vals)]:
+            vals.append(d)
+            if self.predicate(vals) and self.extend(doms, vals):
+                return True
+            vals.pop()
+        return False
+
+class AllDiffConstraint(Constraint):
+    '''
+    All-different constraint over its scope, without a table of satisfying 
+    tuples. prune_unsupported() implements Regin's filter: a value is kept 
+    iff the edge (variable, value) belongs to some maximum matching of the 
+    variable/value graph of the current domains, which is found from one 
+    maximum matching and the strongly connected components of its residual 
+    graph in polynomial time. This is stronger than the equivalent binary 
+    not-equal constraints.
+
+    With offsets, a list of numbers ordered like the scope, the values plus 
+    their offsets must be all different instead, e.g. offsets 0, 1, 2, ... 
+    for the diagonals of n-Queens. The filter then runs on the shifted 
+    values.
+    '''
+
+    def __init__(self, name, scope, offsets=None):
+        Constraint.__init__(self, name, scope)
+        self.offsets = list(offsets) if offsets is not None else [0] * len(self.scope)
+        #last maximum matching found, Variable -> Value. Only used as a 
+        #starting point for the next matching so it needs no restoring.
+        self.match = dict()
+
+    def add_satisfying_tuples(self, tuples):
+        print("WARNING: Trying to add satisfying tuples to all-different constraint ", self)
+
+    def compact_table(self):
+        return None
+
+    #one run of the matching filter leaves every remaining value supported
+    idempotent = True
+
+    def queue_priority(self):
+        return 2
+
+    def check(self, vals):
+        return len(set(v + o for v, o in zip(vals, self.offsets))) == len(vals)
+
+    def has_support(self, var, val):
+        '''
+        Test if var = val can be extended to distinct values, from the current 
+        domains, for the rest of the scope.
+        '''
+        if not var.in_cur_domain(val):
+            return False
+        return self.feasible([[val] if v is var else v.cur_domain() 
+                              for v in self.scope])
+
+    def feasible(self, doms):
+        doms = [[d + o for d in dom] for dom, o in zip(doms, self.offsets)]
+        return len(self.max_matching(doms)) == len(self.scope)
+
+    def prune_unsupported(self, changed_vars=None):
+        #the matching is over the shifted values
+        doms = [[d + o for d in v.cur_domain()] for v, o in zip(self.scope, self.offsets)]
+        supported = self.supported_values(doms)
+        if supported is None:
+            return self.wipe_out()
+        changed = []
+        for i, dom in enumerate(doms):
+            var = self.scope[i]
+            for d in dom:
+                if d not in supported[i]:
+                    var.prune_value(d - self.offsets[i])
+                    if not changed or changed[-1] is not var:
+                        changed.append(var)
+        return changed
+
+    def support_counts(self, var):
+        '''
+        Return the support counts of the values of var as 
+        Constraint.support_counts does, with one matching (grown from the 
+        last one) and one pass over the residual graph for each value, 
+        instead of a matching for every pair of the other variables.
+        '''
+        i = self.position[var]
+        doms = [[d + o for d in v.cur_domain()] for v, o in zip(self.scope, self.offsets)]
+        others = [j for j, v in enumerate(self.scope) if j != i and not v.is_assigned()]
+        counts = dict()
+        for a in var.cur_domain():
+            fixed = list(doms)
+            fixed[i] = [a + self.offsets[i]]
+            supported = self.supported_values(fixed)
+            counts[a] = 0 if supported is None else sum(len(supported[j]) for j in others)
+        return counts
+
+    def supported_values(self, doms):
+        '''
+        Internal routine. Return, for each position of the scope, the set of 
+        values of doms (shifted values) that belong to some maximum matching 
+        covering the scope, or None if there is no such matching.
+        '''
+        match = self.max_matching(doms)
+        if len(match) < len(self.scope):
+            return None
+        for i, val in match.items():
+            self.match[self.scope[i]] = val
+
+        #Residual graph. Nodes are variable positions 0..k-1 and values, 
+        #matched edges go variable -> value, the others value -> variable.
+        k = len(self.scope)
+        val_node = dict()
+        for dom in doms:
+            for d in dom:
+                if d not in val_node:
+                    val_node[d] = k + len(val_node)
+        owner = dict((d, i) for i, d in match.items())
+        succ = [[val_node[match[i]]] for i in range(k)]
+        succ.extend([] for _ in val_node)
+        for i, dom in enumerate(doms):
+            for d in dom:
+                if match[i] != d:
+                    succ[val_node[d]].append(i)
+
+        #Edges on an even alternating path from a free value are in some 
+        #maximum matching: mark everything reachable from free values.
+        reach = [False] * len(succ)
+        stack = [val_node[d] for d in val_node if d not in owner]
+        for node in stack:
+            reach[node] = True
+        while stack:
+            node = stack.pop()
+            for nxt in succ[node]:
+                if not reach[nxt]:
+                    reach[nxt] = True
+                    stack.append(nxt)
+
+        comp = strongly_connected(succ)
+        return [set(d for d in dom if match[i] == d or reach[val_node[d]] 
+                    or comp[val_node[d]] == comp[i])
+                for i, dom in enumerate(doms)]
+
+    def max_matching(self, doms):
+        '''
+        Internal routine. Return a maximum matching {position: value} of the 
+        scope positions to distinct values of doms, grown by augmenting paths 
+        from the last matching found.
+        '''
+        match = dict()
+        owner = dict()
+        for i, var in enumerate(self.scope):
+            val = self.match.get(var)
+            if val is not None and val not in owner and val in doms[i]:
+                match[i] = val
+                owner[val] = i
+        for i in range(len(doms)):
+            if i not in match and not self.augment(i, doms, match, owner, set()):
+                return match
+        return match
+
+    def augment(self, i, doms, match, owner, seen):
+        '''
+        Internal routine. Find an augmenting path from unmatched position i 
+        and flip it into the matching. seen holds the values already visited.
+        '''
+        for d in doms[i]:
+            if d in seen:
+                continue
+            seen.add(d)
+            j = owner.get(d)
+            if j is None or self.augment(j, doms, match, owner, seen):
+                match[i] = d
+                owner[d] = i
+                return True
+        return False
+
+def strongly_connected(succ):
+    '''
+    Tarjan's algorithm over a graph given as adjacency lists succ[node]. 
+    Return a list mapping each node to the number of its strongly connected 
+    component. Iterative, so large graphs do not hit the recursion limit.
+    '''
+    index = [None] * len(succ)
+    low = [0] * len(succ)
+    comp = [None] * len(succ)
+    on_stack = [False] * len(succ)
+    stack = []
+    counter = 0
+    n_comps = 0
+    for root in range(len(succ)):
+        if index[root] is not None:
+            continue
+        work = [(root, 0)]
+        while work:
+            node, pos = work.pop()
+            if pos == 0:
+                index[node] = low[node] = counter
+                counter += 1
+                stack.append(node)
+                on_stack[node] = True
+            recurse = False
+            edges = succ[node]
+            while pos < len(edges):
+                nxt = edges[pos]
+                pos += 1
+                if index[nxt] is None:
+                    work.append((node, pos))
+                    work.append((nxt, 0))
+                    recurse = True
+                    break
+                elif on_stack[nxt]:
+                    low[node] = min(low[node], index[nxt])
+            if recurse:
+                continue
+            if low[node] == index[node]:
+                while True:
+                    top = stack.pop()
+                    on_stack[top] = False
+                    comp[top] = n_comps
+                    if top == node:
+                        break
+                n_comps += 1
+            if work:
+                parent = work[-1][0]
+                low[parent] = min(low[parent], low[node])
+    return comp
+
+class ArithmeticConstraint(Constraint):
+    '''
+    Constraint that the values of the scope, combined with an associative 
+    operation, make total. The operation is given with its identity element 
+    and its inverse (inverse(total, partial) is what the other values must 
+    make), e.g. operator.add, 0 and operator.sub. SumConstraint (addition) 
+    and ProductConstraint (multiplication) build it for KenKen cages. The 
+    values must be positive integers. Nothing is enumerated up front, so 
+    cages of any size are cheap to build.
+
+    By default prune_unsupported enforces bounds consistency: a value is 
+    kept if the rest of total it leaves is within what the smallest and the 
+    largest values of the other variables make, until no domain changes. 
+    With domain_consistency every value without a support is pruned (GAC, as 
+    with a table), using the sets of partial results of the variables before 
+    and after each one. These sets are small for small cages but grow with 
+    the number of cells.
+    '''
+
+    def __init__(self, name, scope, total, operation, identity, inverse, 
+                 domain_consistency=False):
+        Constraint.__init__(self, name, scope)
+        self.total = total
+        self.operation = operation
+        self.identity = identity
+        self.inverse = inverse
+        self.domain_consistency = domain_consistency
+
+    def add_satisfying_tuples(self, tuples):
+        print("WARNING: Trying to add satisfying tuples to arithmetic constraint ", self)
+
+    def compact_table(self):
+        return None
+
+    #both filters run to their fixpoint
+    idempotent = True
+
+    def queue_priority(self):
+        return 2 if self.domain_consistency else 1
+
+    def combine(self, a, b):
+        '''The operation of the constraint'''
+        return self.operation(a, b)
+
+    def rest(self, partial):
+        '''
+        The result the other values must combine to for partial to make 
+        total, or None if no positive values can.
+        '''
+        r = self.inverse(self.total, partial)
+        if r < self.identity or self.operation(partial, r) != self.total:
+            return None
+        return r
+
+    def check(self, vals):
+        return functools.reduce(self.combine, vals, self.identity) == self.total
+
+    def has_support(self, var, val):
+        if not var.in_cur_domain(val):
+            return False
+        return self.feasible([[val] if v is var else v.cur_domain() 
+                              for v in self.scope])
+
+    def feasible(self, doms):
+        return self.total in self.partials(doms)[-1]
+
+    def partials(self, doms):
+        '''
+        Internal routine. List of the sets of results that the values of the 
+        first 0, 1, 2, ... lists of doms make, leaving out those that can not 
+        be part of total.
+        '''
+        sets = [set([self.identity])]
+        for dom in doms:
+            results = set()
+            for s in sets[-1]:
+                for d in dom:
+                    r = self.combine(s, d)
+                    if self.rest(r) is not None:
+                        results.add(r)
+            sets.append(results)
+        return sets
+
+    def prune_unsupported(self, changed_vars=None):
+        if self.domain_consistency:
+            return self.prune_domains()
+        return self.prune_bounds()
+
+    def prune_domains(self):
+        '''
+        Internal routine. Prune every value that no values of the other 
+        variables complete to total.
+        '''
+        doms = [v.cur_domain() for v in self.scope]
+        before = self.partials(doms)
+        after = self.partials(doms[::-1])[::-1]
+        changed = []
+        for i, var in enumerate(self.scope):
+            for d in doms[i]:
+                if any(self.rest(self.combine(s, d)) in after[i + 1] for s in before[i]):
+                    continue
+                if var.is_assigned():
+                    return self.wipe_out()
+                var.prune_value(d)
+                if not changed or changed[-1] is not var:
+                    changed.append(var)
+                if var.cur_domain_size() == 0:
+                    return changed
+        return changed
+
+    def prune_bounds(self):
+        '''
+        Internal routine. Prune the values whose rest of total is out of the 
+        range of the other variables, until every value is within range.
+        '''
+        doms = [v.cur_domain() for v in self.scope]
+        if not all(doms):
+            return self.wipe_out()
+        lows = [min(dom) for dom in doms]
+        highs = [max(dom) for dom in doms]
+        changed = []
+        again = True
+        while again:
+            again = False
+            for i, var in enumerate(self.scope):
+                others = lows[:i] + lows[i + 1:]
+                low = functools.reduce(self.combine, others, self.identity)
+                others = highs[:i] + highs[i + 1:]
+                high = functools.reduce(self.combine, others, self.identity)
+                pruned = False
+                for d in doms[i]:
+                    r = self.rest(d)
+                    if r is not None and low <= r <= high:
+                        continue
+                    if var.is_assigned():
+                        return self.wipe_out()
+                    var.prune_value(d)
+                    pruned = True
+                if not pruned:
+                    continue
+                if not changed or changed[-1] is not var:
+                    changed.append(var)
+                doms[i] = var.cur_domain()
+                if not doms[i]:
+                    return changed
+                if lows[i] != min(doms[i]) or highs[i] != max(doms[i]):
+                    lows[i] = min(doms[i])
+                    highs[i] = max(doms[i])
+                    again = True
+        return changed
+
+class SumConstraint(ArithmeticConstraint):
+    '''The values of the scope, positive integers, add up to total'''
+
+    def __init__(self, name, scope, total, domain_consistency=False):
+        ArithmeticConstraint.__init__(self, name, scope, total, operator.add, 0, 
+                                      operator.sub, domain_consistency)
+
+class ProductConstraint(ArithmeticConstraint):
+    '''
+    The values of the scope, positive integers, multiply to total. Only 
+    divisors of total are ever supported.
+    '''
+
+    def __init__(self, name, scope, total, domain_consistency=False):
+        ArithmeticConstraint.__init__(self, name, scope, total, operator.mul, 1, 
+                                      operator.floordiv, domain_consistency)
+
+class NogoodConstraint(Constraint):
+    '''
+    Constraint forbidding one combination of assignments, given as a list of 
+    (Variable, Value) literals: at least one of the variables must take 
+    another value. Used for the nogoods bt_search learns when it restarts. 
+    Propagation is the usual nogood rule: once every literal but one is 
+    entailed (its variable has only that value left) the value of the last 
+    literal is pruned.
+    '''
+
+    def __init__(self, name, literals):
+        Constraint.__init__(self, name, [var for var, _ in literals])
+        self.values = [val for _, val in literals]
+
+    def add_satisfying_tuples(self, tuples):
+        print("WARNING: Trying to add satisfying tuples to nogood constraint ", self)
+
+    def compact_table(self):
+        return None
+
+    #pruning the last literal satisfies the nogood
+    idempotent = True
+
+    def check(self, vals):
+        return list(vals) != self.values
+
+    def has_support(self, var, val):
+        if not var.in_cur_domain(val):
+            return False
+        return self.feasible([[val] if v is var else v.cur_domain() 
+                              for v in self.scope])
+
+    def feasible(self, doms):
+        for dom, val in zip(doms, self.values):
+            if len(dom) > 1 or (dom and dom[0] != val):
+                return True
+        return False
+
+    def prune_unsupported(self, changed_vars=None):
+        last = None
+        for var, val in zip(self.scope, self.values):
+            if not var.in_cur_domain(val):
+                #literal false, the nogood is satisfied
+                return []
+            if var.cur_domain_size() > 1:
+                if last is not None:
+                    #two literals left open, nothing to prune
+                    return []
+                last = var, val
+        if last is None:
+            return self.wipe_out()
+        var, val = last
+        var.prune_value(val)
+        return [var]
+
+class LexLeqConstraint(Constraint):
+    '''
+    Constraint that the vector left is lexicographically less than or equal 
+    to the vector right, used to break symmetries (see symmetry.py). Each 
+    entry of the vectors is a Variable, or a (Variable, mapping) pair 
+    standing for mapping[value of the variable], e.g. (x, {1: 3, 2: 2, 3: 1}) 
+    for the reflection 4 - x. A variable may appear in several entries and on 
+    both sides. The scope is the distinct variables, in order of appearance.
+
+    prune_unsupported is a bounds filter: at the first position whose two 
+    entries are not fixed to the same value, the left entry can not exceed 
+    the largest value of the right one and the right entry can not be below 
+    the smallest of the left one. Once a single variable of the scope is 
+    unassigned each of its values is checked exactly.
+    '''
+
+    def __init__(self, name, left, right):
+        self.left = [entry if isinstance(entry, tuple) else (entry, None) for entry in left]
+        self.right = [entry if isinstance(entry, tuple) else (entry, None) for entry in right]
+        scope = []
+        for var, _ in self.left + self.right:
+            if var not in scope:
+                scope.append(var)
+        Constraint.__init__(self, name, scope)
+
+    def add_satisfying_tuples(self, tuples):
+        print("WARNING: Trying to add satisfying tuples to lex constraint ", self)
+
+    def compact_table(self):
+        return None
+
+    def check(self, vals):
+        value = dict(zip(self.scope, vals))
+        left = [m[value[var]] if m else value[var] for var, m in self.left]
+        right = [m[value[var]] if m else value[var] for var, m in self.right]
+        return left <= right
+
+    def has_support(self, var, val):
+        if not var.in_cur_domain(val):
+            return False
+        return self.feasible([[val] if v is var else v.cur_domain() 
+                              for v in self.scope])
+
+    def feasible(self, doms):
+        '''
+        Test if some values from doms can satisfy the constraint, treating 
+        the entries of a variable as independent (so it is exact when every 
+        variable that appears more than once has one value left).
+        '''
+        doms = dict(zip(self.scope, doms))
+        for (x, mx), (y, my) in zip(self.left, self.right):
+            a = [mx[v] for v in doms[x]] if mx else doms[x]
+            b = [my[v] for v in doms[y]] if my else doms[y]
+            if not a or not b:
+                return False
+            if min(a) < max(b):
+                return True
+            if min(a) > max(b):
+                return False
+            #only equal values are left for this position
+        return len(self.left) <= len(self.right)
+
+    def prune_unsupported(self, changed_vars=None):
+        if self.n_unasgn == 1:
+            var = self.scope[self.unasgn_xor]
+            changed = []
+            for d in var.cur_domain():
+                if not self.has_support(var, d):
+                    var.prune_value(d)
+                    changed = [var]
+            return changed
+        changed = []
+        for (x, mx), (y, my) in zip(self.left, self.right):
+            hi = max(my[v] for v in y.cur_domain()) if my else max(y.cur_domain())
+            for d in x.cur_domain():
+                if (mx[d] if mx else d) > hi:
+                    if x.is_assigned():
+                        return self.wipe_out()
+                    x.prune_value(d)
+                    if not changed or changed[-1] is not x:
+                        changed.append(x)
+            if x.cur_domain_size() == 0:
+                return changed
+            lo = min(mx[v] for v in x.cur_domain()) if mx else min(x.cur_domain())
+            for d in y.cur_domain():
+                if (my[d] if my else d) < lo:
+                    if y.is_assigned():
+                        return self.wipe_out()
+                    y.prune_value(d)
+                    if not changed or changed[-1] is not y:
+                        changed.append(y)
+            if y.cur_domain_size() == 0:
+                return changed
+            if x.cur_domain_size() > 1 or y.cur_domain_size() > 1:
+                break
+            if (mx[x.cur_domain()[0]] if mx else x.cur_domain()[0]) != \
+               (my[y.cur_domain()[0]] if my else y.cur_domain()[0]):
+                break
+        return changed
+
 class CSP:
     '''
     Class for packing up a set of variables into a CSP problem. Contains various 
@@ -330,6 +1442,7 @@ class CSP:
         self.vars = []
         self.cons = []
         self.vars_to_cons = dict()
+        self.rng = None #random.Random the orderings break ties with, or None
         for v in vars:
             self.add_var(v)
 
@@ -338,7 +1451,7 @@ class CSP:
         Add variable object to CSP while setting up an index to obtain the 
         constraints over this variable.
         '''
-        if not type(v) is Variable:
+        if not isinstance(v, Variable):
             print("WARNING: Trying to add non variable ", v, " to CSP object")
         elif v in self.vars_to_cons:
             print("WARNING: Trying to add variable ", v, " to CSP object that already has it")
@@ -351,7 +1464,7 @@ class CSP:
         Add constraint to CSP. Note that all variables in the constraints scope 
         must already have been added to the CSP.
         '''
-        if not type(c) is Constraint:
+        if not isinstance(c, Constraint):
             print("WARNING: Trying to add non constraint ", c, " to CSP object")
         else:
             for v in c.scope:
@@ -361,6 +1474,17 @@ class CSP:
                 self.vars_to_cons[v].append(c)
             self.cons.append(c)
 
+    def remove_constraint(self, c):
+        '''
+        Remove constraint c from the CSP and from the unassigned counters 
+        of its variables.
+        '''
+        if c in self.cons:
+            self.cons.remove(c)
+            for v in c.scope:
+                self.vars_to_cons[v].remove(c)
+                v.watchers = [w for w in v.watchers if w[0] is not c]
+
     def get_all_cons(self):
         '''
         Return list of all constraints in the CSP.
@@ -400,6 +1524,268 @@ class CSP:
 ########################################################
 # Backtracking Routine                                 #
 ########################################################
+class Trail:
+    '''
+    Undo log for value prunings made during search. Variables whose trail 
+    attribute points at a Trail record each pruned (Variable, Value) pair here. 
+    The solver calls checkpoint() before propagating a new decision and 
+    backtrack() to undo that decision's prunings, so propagators never need to 
+    keep track of what they pruned.
+
+    Other search state that must be undone with the prunings (e.g. the live 
+    tuples of a CompactTable) is trailed with save(obj, attr) before it is 
+    first changed at a level; stamp tells the owner whether it already saved 
+    at the current level.
+
+    When explaining is set (bt_search does so when it backjumps) every 
+    pruning also adds the current reason, the decision levels set by the 
+    last Constraint.blame(), to the expl of the pruned variable, and 
+    record_conflict leaves the conflict set of a dead-end in conflict.
+
+    When stats is a SearchStats, every pruning is counted for the last 
+    blamed constraint and every record_conflict as a wipeout.
+    '''
+
+    def __init__(self):
+        self.prunings = [] #(Variable, Value) pairs in the order they were pruned
+        self.saved    = [] #(object, attribute, old value) triples
+        self.levels   = [] #(len(prunings), len(saved)) at each checkpoint
+        self.stamp    = 0  #changes whenever the current level changes
+        self.explaining = False
+        self.reason   = 0  #decision levels explaining the prunings being made
+        self.conflict = None #decision levels of the last dead-end
+        self.stats    = None #SearchStats counting prunings and wipeouts, if any
+        self.blamed   = None #constraint of the last blame()
+        self.failed   = None #constraint of the last record_conflict()
+
+    def record(self, var, value):
+        '''Called by Variable.prune_value'''
+        self.prunings.append((var, value))
+        if self.stats is not None:
+            self.stats.pruned[self.blamed.name if self.blamed else None] += 1
+        if self.explaining and self.reason & ~var.expl:
+            self.save(var, 'expl')
+            var.expl |= self.reason
+
+    def save(self, obj, attr):
+        '''Remember the current value of obj.attr, to be put back on backtrack'''
+        self.saved.append((obj, attr, getattr(obj, attr)))
+
+    def checkpoint(self):
+        '''
+        Start a new decision level. Return the trail position it starts at, 
+        the prunings of the level are then prunings[mark:].
+        '''
+        mark = len(self.prunings)
+        self.levels.append((mark, len(self.saved)))
+        self.stamp += 1
+        return mark
+
+    def backtrack(self):
+        '''Restore everything changed since the last checkpoint and drop it'''
+        mark, saved_mark = self.levels.pop()
+        self.undo_to(mark, saved_mark)
+
+    def undo_to(self, mark, saved_mark=0):
+        '''
+        Restore every value pruned after trail position mark, and every saved 
+        attribute after position saved_mark of the save log.
+        '''
+        prunings = self.prunings
+        while len(prunings) > mark:
+            var, val = prunings.pop()
+            var.unprune_value(val)
+        saved = self.saved
+        while len(saved) > saved_mark:
+            obj, attr, old = saved.pop()
+            setattr(obj, attr, old)
+        self.stamp += 1
+
+    def undo_all(self):
+        '''Restore every recorded value, including those pruned at the root'''
+        self.levels = []
+        self.undo_to(0)
+
+    def depth(self):
+        '''Number of open checkpoints'''
+        return len(self.levels)
+
+    def __len__(self):
+        return len(self.prunings)
+
+class SearchStats:
+    '''
+    Statistics of one bt_search (or solutions/count_solutions) call, returned 
+    by bt_search and kept in BT.stats.
+
+        status          - True if a solution was found, False if there is 
+                          none, None if the search was paused or cut off
+        decisions, prunings, solutions
+        max_depth       - deepest decision level reached
+        time            - wall clock seconds spent searching
+        time_propagation, time_var_ord, time_val_ord 
+                        - the parts of time spent in the propagator, the 
+                          variable ordering and the value ordering
+        pruned          - Counter of values pruned by each constraint name, 
+                          as attributed by Constraint.blame (values pruned 
+                          before any constraint was blamed count under None)
+        wipeouts        - Counter of dead-ends (domain wipeouts or violated 
+                          checks) reported by each constraint name
+
+    Everything is counted with a few additions per decision or pruning, so 
+    it is always on. as_dict() and to_json() export it for comparing runs. 
+    Its truth value is that of status, so "if solver.bt_search(...)" tests 
+    whether a solution was found.
+    '''
+
+    def __init__(self):
+        self.status           = None
+        self.decisions        = 0
+        self.prunings         = 0
+        self.solutions        = 0
+        self.max_depth        = 0
+        self.time             = 0
+        self.time_propagation = 0
+        self.time_var_ord     = 0
+        self.time_val_ord     = 0
+        self.pruned           = collections.Counter()
+        self.wipeouts         = collections.Counter()
+
+    def __bool__(self):
+        return bool(self.status)
+
+    def decisions_per_second(self):
+        return self.decisions / self.time if self.time > 0 else 0.0
+
+    def as_dict(self):
+        '''The statistics as a dict of numbers, strings and dicts'''
+        d = dict(status=self.status, decisions=self.decisions, 
+                 prunings=self.prunings, solutions=self.solutions, 
+                 max_depth=self.max_depth, time=self.time,
+                 time_propagation=self.time_propagation,
+                 time_var_ord=self.time_var_ord, time_val_ord=self.time_val_ord,
+                 decisions_per_second=self.decisions_per_second())
+        d['pruned'] = dict((str(name), n) for name, n in self.pruned.most_common())
+        d['wipeouts'] = dict((str(name), n) for name, n in self.wipeouts.most_common())
+        return d
+
+    def to_json(self, file=None):
+        '''
+        Return the statistics as a JSON string, or write them to file (a 
+        path) if given.
+        '''
+        text = json.dumps(self.as_dict(), indent=1)
+        if file is None:
+            return text
+        with open(file, 'w') as f:
+            f.write(text)
+
+    def __str__(self):
+        return ("{} decisions ({:.0f}/s), {} prunings, {} solutions, max depth {}, "
+                "{:.4f}s (propagation {:.4f}s, var_ord {:.4f}s, val_ord {:.4f}s)").format(
+                    self.decisions, self.decisions_per_second(), self.prunings, 
+                    self.solutions, self.max_depth, self.time, self.time_propagation,
+                    self.time_var_ord, self.time_val_ord)
+
+class SearchTrace:
+    '''
+    Binary log of the search, a cheaper alternative to the printed trace of 
+    LOG_LEVEL 2. Give bt_search a trace_file path and every event is written 
+    as one fixed size record (event, depth, variable, value):
+
+        DECISION  - variable (index in csp.vars) assigned the value (index 
+                    in its domain) at depth
+        FAIL      - the propagator failed after the decision at depth; value 
+                    is the index in csp.cons of the constraint that reported 
+                    the dead-end, or -1
+        UNDO      - the decision at depth was undone
+        SOLUTION  - all variables are assigned, at depth
+
+    read() decodes a trace file and to_json() converts one for comparison.
+    '''
+
+    DECISION, FAIL, UNDO, SOLUTION = range(4)
+    EVENTS = ('decision', 'fail', 'undo', 'solution')
+    record = struct.Struct('<BIii')
+
+    def __init__(self, file, csp):
+        self.file = open(file, 'wb')
+        self.var_index = dict((var, i) for i, var in enumerate(csp.vars))
+        self.con_index = dict((c, i) for i, c in enumerate(csp.cons))
+
+    def decision(self, depth, var, val):
+        self.file.write(self.record.pack(self.DECISION, depth, self.var_index[var], 
+                                         var.value_index(val)))
+
+    def fail(self, depth, var, c):
+        self.file.write(self.record.pack(self.FAIL, depth, self.var_index[var], 
+                                         self.con_index.get(c, -1)))
+
+    def undo(self, depth, var):
+        self.file.write(self.record.pack(self.UNDO, depth, self.var_index[var], -1))
+
+    def solution(self, depth):
+        self.file.write(self.record.pack(self.SOLUTION, depth, -1, -1))
+
+    def close(self):
+        self.file.close()
+
+    @classmethod
+    def read(cls, file):
+        '''Generate the (event name, depth, variable, value) records of file'''
+        with open(file, 'rb') as f:
+            data = f.read()
+        for event, depth, var, val in cls.record.iter_unpack(data):
+            yield cls.EVENTS[event], depth, var, val
+
+    @classmethod
+    def to_json(cls, file, json_file=None):
+        '''
+        Return the records of trace file as a JSON list of lists, or write it 
+        to json_file if given.
+        '''
+        text = json.dumps([list(r) for r in cls.read(file)])
+        if json_file is None:
+            return text
+        with open(json_file, 'w') as f:
+            f.write(text)
+
+def luby_cutoffs(scale=32):
+    '''
+    Decision cutoffs scale * (1, 1, 2, 1, 1, 2, 4, 1, 1, 2, 1, 1, 2, 4, 8, ...), 
+    the Luby sequence, for the restarts of bt_search.
+    '''
+    i = 1
+    while True:
+        k = i
+        #luby(k) = 2^(j-1) if k = 2^j - 1, else luby(k - 2^(j-1) + 1)
+        while True:
+            j = k.bit_length()
+            if k == (1 << j) - 1:
+                yield scale << (j - 1)
+                break
+            k -= (1 << (j - 1)) - 1
+        i += 1
+
+def geometric_cutoffs(scale=32, factor=1.5):
+    '''Decision cutoffs scale, scale * factor, scale * factor^2, ...'''
+    cutoff = scale
+    while True:
+        yield int(cutoff)
+        cutoff *= factor
+
+class SearchCutoff(Exception):
+    '''
+    Raised by the search when a restarted run reaches its decision cutoff. 
+    branch holds the (variable, value, refuted values) entry of each level 
+    of the current branch, root first; the value of the deepest level is 
+    None.
+    '''
+
+    def __init__(self):
+        Exception.__init__(self)
+        self.branch = []
+
 class BT:
     '''
     Use a class to encapsulate things like statistics and bookeeping for 
@@ -415,9 +1801,17 @@ class BT:
         self.nDecisions  = 0 #nDecisions is the number of variable 
                             #assignments made during search
         self.nPrunings   = 0 #nPrunings is the number of value prunings during search
-        self.unasgn_vars = [] #used to track unassigned variables
+        self.unasgn_vars = dict() #unassigned variables, as an insertion ordered set
+        self.trail       = Trail() #undo log of prunings, see Trail
         self.LOG_LEVEL   = 1
         self.runtime     = 0
+        self.cutoff      = None #stop the run at this many decisions, see bt_search
+        self.runs        = [] #(decisions, prunings, nogoods learned) of each run
+        self.stack       = [] #open levels of the search, see search
+        self.engine      = None #search generator of a paused bt_search
+        self.pause_at    = None #pause the search at this many decisions
+        self.stats       = SearchStats() #statistics of the last search
+        self.trace       = None #SearchTrace of the search, if any
 
     def trace_on(self):
         '''Turn search trace on'''
@@ -435,6 +1829,7 @@ class BT:
         self.nDecisions = 0
         self.nPrunings = 0
         self.runtime = 0
+        self.stats = SearchStats()
 
     def print_stats(self):
         print("Search made {} variable assignments and pruned {} variable values".format(
@@ -455,16 +1850,31 @@ class BT:
                 var.unassign()
             var.restore_curdom()
 
+    def attach_trail(self):
+        '''Make every variable of the CSP record its prunings on our trail'''
+        self.trail = Trail()
+        self.trail.stats = self.stats
+        for var in self.csp.vars:
+            var.trail = self.trail
+
+    def detach_trail(self):
+        '''Restore all trailed prunings and stop recording'''
+        self.trail.undo_all()
+        for var in self.csp.vars:
+            var.trail = None
+
     def restoreUnasgnVar(self, var):
-        '''Add variable back to list of unassigned vars'''
-        self.unasgn_vars.append(var)
+        '''Add variable back to the unassigned vars'''
+        self.unasgn_vars[var] = None
         
-    def bt_search(self,propagator,var_ord=None,val_ord=None):
+    def bt_search(self,propagator,var_ord=None,val_ord=None,restarts=None,seed=None,
+                  backjump=False,max_decisions=None,trace_file=None):
         '''Try to solve the CSP using specified propagator routine
 
            propagator == a function with the following template
            propagator(csp, newly_instantiated_variable=None)
            ==> returns (True/False, [(Variable, Value), (Variable, Value) ...]
+           (the list may be empty, see below)
 
            csp is a CSP object---the propagator can use this to get access
            to the variables and constraints of the problem.
@@ -483,43 +1893,143 @@ class BT:
              in this case bt_search will backtrack
            return is true if we can continue.
 
-           The list of variable values pairs are all of the values
-           the propagator pruned (using the variable's prune_value method). 
-           bt_search NEEDS to know this in order to correctly restore these 
-           values when it undoes a variable assignment.
-
-           NOTE propagator SHOULD NOT prune a value that has already been 
-           pruned! Nor should it prune a value twice
+           The list of variable values pairs is kept for compatibility with 
+           older propagators and is ignored. While searching, every variable of 
+           the csp records the values it prunes (using the variable's 
+           prune_value method) on the solver's Trail, and bt_search restores 
+           them from there when it undoes a variable assignment. Propagators 
+           therefore do not need to track their prunings, and pruning a value 
+           that is already pruned is harmless.
 
            var_ord is the variable ordering function currently being used; 
-           val_ord is the value ordering function currently being used.
+           val_ord is the value ordering function currently being used. 
+           var_ord may also be an object called like a function, such as the 
+           incremental orderings of heuristics (e.g. DomWdegOrder()).
+
+           restarts is an optional iterable of decision cutoffs, e.g. 
+           luby_cutoffs() or geometric_cutoffs(). The search is then run 
+           repeatedly, each run stopping once it has made as many decisions 
+           as the next cutoff allows (the last run, when the cutoffs run out, 
+           is complete). During these runs csp.rng is a random.Random(seed), 
+           which the orderings of heuristics use to break ties randomly, so 
+           that runs explore different branches. When a run is stopped the 
+           nld-nogoods of its branch are learned: for every value refuted at 
+           some level, the decisions above that level together with the 
+           refuted value can not be extended to a solution. They are added to 
+           the csp as NogoodConstraints, propagated by the propagator in the 
+           later runs, and removed when the search ends. The decisions, 
+           prunings and nogoods of each run are kept in self.runs; 
+           nDecisions and nPrunings are the totals over all runs.
+
+           If backjump is True the search does conflict-directed backjumping 
+           (see search) instead of chronological backtracking. The 
+           propagators then explain their prunings (see Constraint.blame and 
+           record_conflict) and a dead-end jumps straight back to the 
+           deepest decision responsible for it, which saves the decisions 
+           chronological backtracking would spend on the levels in between.
+
+           If max_decisions is given (and there are no restarts) the search 
+           is paused once it has made that many decisions, keeping its 
+           place, and bt_search returns None. bt_resume continues it from 
+           there, exactly as if it had not stopped; stop abandons it.
+
+           Returns a SearchStats, whose status is True if a solution was 
+           found (it is left assigned to the variables), False if the csp has 
+           none, None if paused, and which is true only if a solution was 
+           found. It also has the time spent propagating and 
+           ordering, the prunings and wipeouts of each constraint and the 
+           maximum depth, and exports them with to_json().
+
+           If trace_file is given the search is logged to that file in the 
+           binary format of SearchTrace (the printed trace of trace_on is 
+           much slower).
            '''
 
+        self.stop()
         self.clear_stats()
+        self.runs = []
         stime = time.process_time()
 
-        self.restore_all_variable_domains()
-        
-        self.unasgn_vars = []
-        for v in self.csp.vars:
-            if not v.is_assigned():
-                self.unasgn_vars.append(v)
-
-        status, prunings = propagator(self.csp) #initial propagate no assigned variables.
-        self.nPrunings = self.nPrunings + len(prunings)
-
-        if self.LOG_LEVEL > 1:
-            print(len(self.unasgn_vars), " unassigned variables at start of search")
-            print("Root Prunings: ", prunings)
-
-        if status == False:
-            print("CSP{} detected contradiction at root".format(
-                self.csp.name))
-        else:
-            status = self.bt_recurse(propagator, var_ord, val_ord, 1)   #now do recursive search
+        if trace_file is not None:
+            self.trace = SearchTrace(trace_file, self.csp)
+        try:
+            if restarts is None:
+                status = self.bt_run(propagator, var_ord, val_ord, backjump, max_decisions)
+            else:
+                status = self.bt_restarts(propagator, var_ord, val_ord, restarts, seed,
+                                          backjump)
+        finally:
+            if self.engine is None:
+                #not paused
+                self.close_trace()
 
-        self.restoreValues(prunings)
+        self.report(status, stime)
+        return self.stats
 
+    def bt_run(self, propagator, var_ord, val_ord, backjump=False, max_decisions=None):
+        '''
+        One run of the search from scratch. Return True if a solution was 
+        found, False if there is none, None if it was paused after 
+        max_decisions decisions (see bt_resume). Raises SearchCutoff if 
+        self.cutoff is reached.
+        '''
+        self.engine = self.search(propagator, var_ord, val_ord, backjump, True)
+        if max_decisions is not None:
+            self.pause_at = self.nDecisions + max_decisions
+        return self.bt_continue()
+
+    def bt_continue(self):
+        '''Internal routine. Run the engine to its next solution or pause'''
+        status = False
+        try:
+            status = next(self.engine, False)
+        finally:
+            if status is not None:
+                #solved, exhausted or cut off, drop the engine (which restores 
+                #the prunings)
+                self.engine.close()
+                self.engine = None
+                self.pause_at = None
+        return status
+
+    def bt_resume(self, max_decisions=None):
+        '''
+        Continue a search that bt_search paused (see its max_decisions), from 
+        the decision where it stopped, for at most max_decisions more 
+        decisions (no limit if None). Reports and returns the SearchStats 
+        like bt_search, the statistics counting the whole search.
+        '''
+        if self.engine is None:
+            print("ERROR: no paused search to resume")
+            return None
+        stime = time.process_time()
+        self.pause_at = None if max_decisions is None else self.nDecisions + max_decisions
+        try:
+            status = self.bt_continue()
+        finally:
+            if self.engine is None:
+                self.close_trace()
+        self.report(status, stime)
+        return self.stats
+
+    def stop(self):
+        '''Abandon a paused search, restoring what it pruned and assigned'''
+        if self.engine is not None:
+            self.engine.close()
+            self.engine = None
+            self.restore_all_variable_domains()
+        self.pause_at = None
+        self.close_trace()
+
+    def close_trace(self):
+        if self.trace is not None:
+            self.trace.close()
+            self.trace = None
+
+    def report(self, status, stime):
+        '''Record the outcome of the search and print it as bt_search does'''
+        self.stats.status = status
+        self.runtime += time.process_time() - stime
         if self.LOG_LEVEL > 0:
             if status == False:
                 print("CSP{} unsolved. Has no solutions".format(self.csp.name))
@@ -527,61 +2037,311 @@ class BT:
                 print("CSP {} solved. CPU Time used = {}".format(self.csp.name,
                                                                 time.process_time() - stime))
                 self.csp.print_soln()
-
-            print("bt_search finished")
+            if status is None:
+                print("CSP {} search paused after {} variable assignments, bt_resume continues it".format(
+                    self.csp.name, self.nDecisions))
+            else:
+                print("bt_search finished")
             self.print_stats()
 
-    def bt_recurse(self, propagator, var_ord, val_ord, level):
-        '''Return true if found solution. False if still need to search.
-           If top level returns false--> no solution'''
-
-        if self.LOG_LEVEL > 1:
-            print('  ' * level, "bt_recurse level ", level)
-           
-        if not self.unasgn_vars:
-            #all variables assigned
-            return True
-        else:
-            ##Figure out which variable to assign,
-            ##Then remove it from the list of unassigned vars
-            if var_ord:
-              var = var_ord(self.csp)
-            else:
-              var = self.unasgn_vars[0]
-            self.unasgn_vars.remove(var) 
+    def start_search(self):
+        '''Unassign every variable, restore all domains and reset unasgn_vars'''
+        self.restore_all_variable_domains()
+        self.unasgn_vars = dict()
+        for v in self.csp.vars:
+            if not v.is_assigned():
+                self.unasgn_vars[v] = None
 
-            if self.LOG_LEVEL > 1:
-                print('  ' * level, "bt_recurse var = ", var)
+    def solutions(self, propagator, var_ord=None, val_ord=None):
+        '''
+        Generate every solution of the CSP, each as a tuple of values ordered 
+        like the variables of the csp, searching with propagator, var_ord and 
+        val_ord as bt_search does. Nothing is printed. While a solution is 
+        being yielded the variables are assigned to it; the search resumes 
+        when the next one is asked for. When the generator is exhausted or 
+        closed the variables are unassigned and their domains restored.
 
-            if val_ord:
-              value_order = val_ord(self.csp,var)
-            else:
-              value_order = var.cur_domain()
+            for soln in solver.solutions(prop_GAC, ord_mrv):
+                ...
 
-            for val in value_order:
+        nDecisions and nPrunings count the search so far.
+        '''
+        self.stop()
+        self.clear_stats()
+        engine = self.search(propagator, var_ord, val_ord)
+        try:
+            for _ in engine:
+                yield tuple(v.assignedValue for v in self.csp.vars)
+        finally:
+            engine.close()
+            self.restore_all_variable_domains()
+
+    def count_solutions(self, propagator, var_ord=None, val_ord=None, limit=None):
+        '''
+        Return the number of solutions of the CSP, without building them. 
+        The search tree is explored with propagator, var_ord and val_ord as 
+        bt_search would, nothing is printed and the variables are left 
+        unassigned. nDecisions and nPrunings count the whole search. 
 
-                if self.LOG_LEVEL > 1:
-                    print('  ' * level, "bt_recurse trying", var, "=", val)
+        If limit is given the search stops as soon as limit solutions are 
+        found, e.g. limit=2 to check that a board has a unique solution.
+        '''
+        self.stop()
+        self.clear_stats()
+        count = 0
+        engine = self.search(propagator, var_ord, val_ord)
+        try:
+            for _ in engine:
+                count += 1
+                if limit is not None and count >= limit:
+                    break
+        finally:
+            engine.close()
+            self.restore_all_variable_domains()
+        return count
+
+    def search(self, propagator, var_ord=None, val_ord=None, backjump=False,
+               report_root=False):
+        '''
+        The search engine behind bt_search, solutions and count_solutions. A 
+        generator that restores the domains, propagates at the root and then 
+        explores the search tree depth first, yielding True at each solution 
+        (with the variables assigned to it) and None whenever the search is 
+        paused because self.pause_at decisions were made. Asking for the next 
+        item continues from where it stopped. Closing the generator restores 
+        every pruned value, leaving the variables as they are.
+
+        The tree is walked iteratively, so its depth is not limited by the 
+        recursion limit. Each open level is a frame [variable, value order, 
+        index of the next value to try, conflict set] on self.stack, and the 
+        decisions of the current branch are the values before the index of 
+        each frame. With backjump the propagators explain their prunings 
+        (see Constraint.blame and record_conflict) and each frame collects 
+        the conflict set (bitmask of decision levels, bit L for level L) of 
+        its failed values. If a value fails for reasons that do not include 
+        its level, the other values would fail the same way, so the frame is 
+        given up at once and the search jumps back to the deepest level of 
+        that conflict set.
+
+        Raises SearchCutoff once self.cutoff decisions were made. If 
+        report_root, a contradiction found at the root is printed.
+        '''
+        self.start_search()
+        self.attach_trail()
+        self.trail.explaining = backjump
+        self.stack = stack = []
+        trail = self.trail
+        stats = self.stats
+        trace = self.trace
+        clock = time.perf_counter
+        start = clock()
+        try:
+            status, _ = propagator(self.csp) #initial propagate no assigned variables.
+            self.nPrunings = self.nPrunings + len(trail)
+            stats.time_propagation += clock() - start
 
-                var.assign(val)
-                self.nDecisions = self.nDecisions+1
+            if self.LOG_LEVEL > 1:
+                print(len(self.unasgn_vars), " unassigned variables at start of search")
+                print("Root Prunings: ", trail.prunings)
 
-                status, prunings = propagator(self.csp, var)
-                self.nPrunings = self.nPrunings + len(prunings)
+            if status == False:
+                if report_root:
+                    print("CSP{} detected contradiction at root".format(
+                        self.csp.name))
+                return
+
+            failed = None #conflict set of the decision being undone, None when going down
+            while True:
+                if failed is None:
+                    if not self.unasgn_vars:
+                        #all variables assigned
+                        stats.solutions += 1
+                        if trace:
+                            trace.solution(len(stack))
+                        start = self.tally(start)
+                        yield True
+                        start = clock()
+                        if not stack:
+                            return
+                        #look for the next solution, which no level can be 
+                        #jumped over for
+                        failed = (2 << len(stack)) - 1
+                    else:
+                        ##Figure out which variable to assign,
+                        ##Then remove it from the unassigned vars
+                        t = clock()
+                        if var_ord:
+                          var = var_ord(self.csp)
+                        else:
+                          var = next(iter(self.unasgn_vars))
+                        del self.unasgn_vars[var]
+                        t2 = clock()
+                        if val_ord:
+                          value_order = val_ord(self.csp,var)
+                        else:
+                          value_order = var.cur_domain()
+                        stats.time_var_ord += t2 - t
+                        stats.time_val_ord += clock() - t2
+                        #the values pruned before this level are part of its conflict set
+                        stack.append([var, value_order, 0, var.expl])
+                        if len(stack) > stats.max_depth:
+                            stats.max_depth = len(stack)
+
+                        if self.LOG_LEVEL > 1:
+                            print('  ' * len(stack), "search level ", len(stack), "var = ", var)
+
+                if failed is not None:
+                    #undo the decision of the top frame, which failed
+                    frame = stack[-1]
+                    if self.LOG_LEVEL > 1:
+                        print('  ' * len(stack), "search restoring ", trail.prunings[trail.levels[-1][0]:])
+                    trail.backtrack()
+                    frame[0].unassign()
+                    if trace:
+                        trace.undo(len(stack), frame[0])
+                    bit = 1 << len(stack)
+                    if backjump and not failed & bit:
+                        #the variable plays no part in the failure, jump over its level
+                        if self.LOG_LEVEL > 1:
+                            print('  ' * len(stack), "search jumping back from", frame[0])
+                        stack.pop()
+                        self.restoreUnasgnVar(frame[0])
+                        if not stack:
+                            return
+                        continue
+                    frame[3] |= failed & ~bit
+                    failed = None
+
+                #try the next value of the top frame
+                frame = stack[-1]
+                var, value_order, n, conflict = frame
+                if n == len(value_order):
+                    #all values failed, the level above failed with our conflict set
+                    stack.pop()
+                    self.restoreUnasgnVar(var)
+                    if not stack:
+                        return
+                    failed = conflict
+                    continue
+
+                if self.cutoff is not None and self.nDecisions >= self.cutoff:
+                    cut = SearchCutoff()
+                    for f in stack[:-1]:
+                        cut.branch.append((f[0], f[1][f[2] - 1], f[1][:f[2] - 1]))
+                    cut.branch.append((var, None, value_order[:n]))
+                    raise cut
+                while self.pause_at is not None and self.nDecisions >= self.pause_at:
+                    start = self.tally(start)
+                    yield None
+                    start = clock()
+
+                val = value_order[n]
+                frame[2] = n + 1
+                level = len(stack)
 
                 if self.LOG_LEVEL > 1:
-                    print('  ' * level, "bt_recurse prop status = ", status)
-                    print('  ' * level, "bt_recurse prop pruned = ", prunings)
+                    print('  ' * level, "search trying", var, "=", val)
 
-                if status:
-                    if self.bt_recurse(propagator, var_ord,val_ord, level+1):
-                        return True
+                var.assign(val)
+                var.level = level
+                self.nDecisions = self.nDecisions+1
+                if trace:
+                    trace.decision(level, var, val)
+
+                mark = trail.checkpoint()
+                #until the propagator blames a constraint, blame every level
+                trail.reason = (2 << level) - 1
+                trail.conflict = None
+                trail.blamed = trail.failed = None
+                t = clock()
+                status, _ = propagator(self.csp, var)
+                stats.time_propagation += clock() - t
+                self.nPrunings = self.nPrunings + len(trail) - mark
 
                 if self.LOG_LEVEL > 1:
-                    print('  ' * level, "bt_recurse restoring ", prunings)
-                self.restoreValues(prunings)
-                var.unassign()
-
-            self.restoreUnasgnVar(var)
-            return False
+                    print('  ' * level, "search prop status = ", status)
+                    print('  ' * level, "search prop pruned = ", trail.prunings[mark:])
+
+                if not status:
+                    if trace:
+                        trace.fail(level, var, trail.failed)
+                    failed = trail.conflict
+                    if failed is None:
+                        #the propagator did not explain the dead-end, blame every level
+                        failed = (2 << level) - 1
+        finally:
+            self.tally(start)
+            #stop notifying an incremental ordering (see heuristics.VarHeap), 
+            #which rebuilds itself if it is used again
+            for var in self.csp.vars:
+                var.order = None
+            self.detach_trail()
+
+    def tally(self, start):
+        '''
+        Internal routine. Bring self.stats up to date, searching since start. 
+        Return the time it was brought up to.
+        '''
+        now = time.perf_counter()
+        self.stats.time += now - start
+        self.stats.decisions = self.nDecisions
+        self.stats.prunings = self.nPrunings
+        return now
 
+    def bt_restarts(self, propagator, var_ord, val_ord, restarts, seed, backjump=False):
+        '''
+        Internal routine. Run the search with each cutoff of restarts in turn 
+        (see bt_search), learning nogoods from every interrupted run.
+        '''
+        cutoffs = iter(restarts)
+        rng = self.csp.rng
+        self.csp.rng = random.Random(seed)
+        nogoods = []
+        try:
+            while True:
+                cutoff = next(cutoffs, None)
+                if cutoff is not None:
+                    self.cutoff = self.nDecisions + cutoff
+                else:
+                    self.cutoff = None
+                decisions, prunings = self.nDecisions, self.nPrunings
+                learned = []
+                #make incremental orderings rebuild, with new random ties
+                for var in self.csp.vars:
+                    var.order = None
+                try:
+                    status = self.bt_run(propagator, var_ord, val_ord, backjump)
+                except SearchCutoff as e:
+                    status = None
+                    for literals in self.nld_nogoods(e.branch):
+                        c = NogoodConstraint("Nogood{}".format(len(nogoods)), literals)
+                        self.csp.add_constraint(c)
+                        nogoods.append(c)
+                        learned.append(c)
+                self.runs.append((self.nDecisions - decisions, 
+                                  self.nPrunings - prunings, len(learned)))
+                if self.LOG_LEVEL > 0:
+                    print("Run {} made {} variable assignments, pruned {} variable values and learned {} nogoods".format(
+                        len(self.runs), *self.runs[-1]))
+                if status is not None:
+                    return status
+        finally:
+            for c in nogoods:
+                self.csp.remove_constraint(c)
+            self.csp.rng = rng
+            self.cutoff = None
+
+    def nld_nogoods(self, branch):
+        '''
+        Return the nogoods, as lists of (Variable, Value) literals, of the 
+        branch of an interrupted run given from the root down: each refuted 
+        value with the decisions above it.
+        '''
+        nogoods = []
+        decisions = []
+        for var, val, refuted in branch:
+            for r in refuted:
+                nogoods.append(decisions + [(var, r)])
+            if val is not None:
+                decisions.append((var, val))
+        return nogoods
@@ -12,30 +12,50 @@ bt_search.
     - Takes in a CSP object (csp), and a Variable object (var)
     - Returns a list of all of var's potential values, ordered from best value 
       choice to worst value choice according to the LCV heuristic.
+4. val_lcv_counts(csp, var)
+    - Same as val_lcv, but reads the support counts of each value off the 
+      constraints (bitsets for table constraints) instead of trial assigning 
+      every value of var.
+5. MRVOrder(), DHOrder()
+    - Incremental versions of ord_mrv and ord_dh. An instance is passed as 
+      var_ord and keeps the unassigned variables in an indexed heap (VarHeap) 
+      that is updated as domains shrink and grow and as variables are 
+      assigned, so choosing a variable is O(1) plus O(log n) per update.
+6. DomWdegOrder()
+    - The dom/wdeg heuristic on the same heap: smallest current domain over 
+      the summed conflict weights of the variable's constraints, where a 
+      constraint's weight grows each time it causes a wipeout.
 
 The heuristics can use the csp argument (CSP object) to get access to the 
 variables and constraints of the problem. The assigned variables and values can 
 be accessed via methods.
+
+When csp.rng is set (bt_search does this when it restarts) the heuristics break 
+ties uniformly at random with it instead of by position.
 '''
 
 import random
 from copy import deepcopy
 
 def ord_dh(csp):
-    # TODO! IMPLEMENT THIS!
-    #pass
+    '''
+    Return the unassigned variable involved in the most constraints with 
+    unassigned variables, each constraint weighted by its number of 
+    unassigned variables. Linear in the total size of the scopes, as the 
+    constraints keep their unassigned counts up to date.
+    '''
     lookup = {} #dictionary to store constraints' number of unassigned variables
     for c in csp.get_all_cons():
         #cycle through all constraints
-        for var in c.get_scope():
-            #cycle through all variables within each constraint c
-            if c.get_unasgn_vars().count(var) != 0:
-                #as long as constraint c doesn't have variable var unassigned
-                #update number of constraints involved with each variable
-                if var not in lookup:
-                    lookup[var] = len(c.get_unasgn_vars())
-                else:
-                    lookup[var] += len(c.get_unasgn_vars())        
+        n = c.get_n_unasgn()
+        if n == 0:
+            continue
+        for var in c.get_unasgn_vars():
+            #update number of constraints involved with each unassigned variable
+            lookup[var] = lookup.get(var, 0) + n
+    if csp.rng is not None:
+        best = max(lookup.values())
+        return csp.rng.choice([var for var in lookup if lookup[var] == best])
     return max(lookup, key=lookup.get) #variable with most number of contraints with other unassigned variables
   
 def ord_mrv(csp):
@@ -43,19 +63,30 @@ def ord_mrv(csp):
     #pass
     num_legal_d = 9999999999999999999999999
     min_var = None
+    ties = 0
     for var in csp.get_all_unasgn_vars():
         #cycle through all variables that are unassigned
         if var.cur_domain_size() < num_legal_d:
             #choosing the variable only if its values remaining is smaller than the current smallest
             num_legal_d = var.cur_domain_size()
             min_var = var
+            ties = 1
+        elif csp.rng is not None and var.cur_domain_size() == num_legal_d:
+            #random tie-breaking, each tied variable is kept with probability 1/ties
+            ties += 1
+            if csp.rng.randrange(ties) == 0:
+                min_var = var
     return min_var    
 
 def val_lcv(csp, var):
     # TODO! IMPLEMENT THIS!
     #pass
     lookup = {} #dictionary to store how constraining each variable is
-    for value in var.cur_domain():
+    values = var.cur_domain()
+    if csp.rng is not None:
+        #the sort below is stable, so ties stay in this random order
+        csp.rng.shuffle(values)
+    for value in values:
         #cycle through all values of variable var
         count = 0
         var.assign(value) #assign it all the values seqentially and then see how constraining it is
@@ -72,3 +103,267 @@ def val_lcv(csp, var):
         #unassigned to reassign another value
         lookup[value] = count
     return sorted(lookup, key=lookup.get, reverse=True) #get the least constraining variable, reverse for the highest value (i.e. LCV)
+
+def val_lcv_counts(csp, var):
+    '''
+    Same ordering as val_lcv, from the support counts of the constraints of 
+    var (see Constraint.support_counts) instead of assigning each value and 
+    calling has_support for every neighbouring variable/value pair.
+    '''
+    values = var.cur_domain()
+    if csp.rng is not None:
+        csp.rng.shuffle(values)
+    lookup = dict.fromkeys(values, 0)
+    for c in csp.get_cons_with_var(var):
+        if c.get_n_unasgn() < 2:
+            #no other unassigned variable to constrain
+            continue
+        for value, count in c.support_counts(var).items():
+            lookup[value] += count
+    return sorted(lookup, key=lookup.get, reverse=True)
+
+class VarHeap:
+    '''
+    Variable ordering that keeps the unassigned variables of the csp in an 
+    indexed binary heap, so the next variable is read off the top instead of 
+    scanning every variable at each decision. 
+
+    An instance is passed as the var_ord of bt_search and called like the 
+    ord_ functions. On its first call for a csp it sets itself as the order 
+    of every variable, which then notify it of each prune, restore, assign 
+    and unassign (see Variable), and record_conflict of the constraints 
+    notifies it of wipeouts. Each notification updates the heap position of 
+    the variables whose key changed in O(log n). The search detaches it from 
+    the variables when it ends, and it rebuilds itself if it is called again 
+    or if another ordering has since been attached to the variables.
+
+    The variable with the smallest key(var) is chosen. The default key is 
+    that of MRV (the current domain size), and subclasses redefine it. Keys 
+    end with the position of the variable in the csp so that ties go to the 
+    first variable, like ord_mrv. If csp.rng is set the positions are 
+    shuffled when the heap is built, so ties are broken at random.
+    '''
+
+    def __init__(self):
+        self.csp = None
+        self.heap = [] #unassigned variables, heap ordered by key
+        self.pos = dict() #variable -> index in heap
+        self.keys = dict() #variable -> key it is ordered by
+        self.index = dict() #variable -> position in csp.vars, the tie-breaker
+
+    def __call__(self, csp):
+        if self.csp is not csp or (csp.vars and csp.vars[0].order is not self):
+            self.attach(csp)
+        return self.heap[0] if self.heap else None
+
+    def attach(self, csp):
+        '''Start following the variables of csp and build the heap'''
+        self.csp = csp
+        self.heap = []
+        self.pos = dict()
+        self.keys = dict()
+        self.index = dict()
+        rank = list(range(len(csp.vars)))
+        if csp.rng is not None:
+            csp.rng.shuffle(rank)
+        for i, var in zip(rank, csp.vars):
+            self.index[var] = i
+            var.order = self
+        for var in csp.vars:
+            if not var.is_assigned():
+                self.insert(var)
+
+    def detach(self):
+        '''Stop following the variables'''
+        if self.csp is not None:
+            for var in self.csp.vars:
+                if var.order is self:
+                    var.order = None
+        self.csp = None
+
+    def key(self, var):
+        '''Smallest current domain first'''
+        return (var.cur_domain_size(), self.index[var])
+
+    #notifications
+    def changed(self, var):
+        '''Current domain of var changed'''
+        if var in self.pos:
+            self.update(var)
+
+    def assigned(self, var):
+        self.remove(var)
+
+    def unassigned(self, var):
+        self.insert(var)
+
+    def conflict(self, c):
+        '''Constraint c caused a wipeout'''
+        pass
+
+    #heap operations
+    def insert(self, var):
+        if var in self.pos or var not in self.index:
+            return
+        self.keys[var] = self.key(var)
+        self.heap.append(var)
+        self.pos[var] = len(self.heap) - 1
+        self.sift_up(len(self.heap) - 1)
+
+    def remove(self, var):
+        i = self.pos.pop(var, None)
+        if i is None:
+            return
+        del self.keys[var]
+        last = self.heap.pop()
+        if i < len(self.heap):
+            self.heap[i] = last
+            self.pos[last] = i
+            self.sift_down(self.sift_up(i))
+
+    def update(self, var):
+        '''Recompute the key of var and restore the heap order'''
+        key = self.key(var)
+        old = self.keys[var]
+        if key != old:
+            self.keys[var] = key
+            if key < old:
+                self.sift_up(self.pos[var])
+            else:
+                self.sift_down(self.pos[var])
+
+    def sift_up(self, i):
+        heap, pos, keys = self.heap, self.pos, self.keys
+        var = heap[i]
+        key = keys[var]
+        while i > 0:
+            parent = (i - 1) >> 1
+            if keys[heap[parent]] <= key:
+                break
+            heap[i] = heap[parent]
+            pos[heap[i]] = i
+            i = parent
+        heap[i] = var
+        pos[var] = i
+        return i
+
+    def sift_down(self, i):
+        heap, pos, keys = self.heap, self.pos, self.keys
+        n = len(heap)
+        var = heap[i]
+        key = keys[var]
+        while True:
+            child = 2 * i + 1
+            if child >= n:
+                break
+            if child + 1 < n and keys[heap[child + 1]] < keys[heap[child]]:
+                child += 1
+            if key <= keys[heap[child]]:
+                break
+            heap[i] = heap[child]
+            pos[heap[i]] = i
+            i = child
+        heap[i] = var
+        pos[var] = i
+        return i
+
+class MRVOrder(VarHeap):
+    '''
+    Incremental ord_mrv: smallest current domain first, ties to the first 
+    variable of the csp (the key of VarHeap). Chooses the same variables as 
+    ord_mrv.
+    '''
+
+class DHOrder(VarHeap):
+    '''
+    Incremental ord_dh: the variable involved in the most constraints with 
+    unassigned variables, each constraint weighted by its number of 
+    unassigned variables. The scores are updated as variables are assigned 
+    and unassigned. Ties go to the first variable of the csp, which ord_dh 
+    does not guarantee.
+    '''
+
+    def attach(self, csp):
+        self.score = dict()
+        VarHeap.attach(self, csp)
+
+    def key(self, var):
+        return (-self.score[var], self.index[var])
+
+    def insert(self, var):
+        if var in self.index:
+            self.score[var] = sum(c.get_n_unasgn() 
+                                  for c in self.csp.get_cons_with_var(var))
+        VarHeap.insert(self, var)
+
+    def assigned(self, var):
+        self.remove(var)
+        for c in self.csp.get_cons_with_var(var):
+            #each remaining variable of c loses var from c's count
+            for other in c.get_unasgn_vars():
+                self.score[other] -= 1
+                self.update(other)
+
+    def unassigned(self, var):
+        for c in self.csp.get_cons_with_var(var):
+            for other in c.get_unasgn_vars():
+                if other is not var and other in self.pos:
+                    self.score[other] += 1
+                    self.update(other)
+        self.insert(var)
+
+    def changed(self, var):
+        pass
+
+class DomWdegOrder(VarHeap):
+    '''
+    Conflict-directed dom/wdeg ordering: the variable with the smallest ratio 
+    of current domain size to weighted degree is chosen. The weighted degree 
+    of a variable is the sum of the weights of its constraints that still 
+    have another unassigned variable, and the weight of a constraint grows 
+    each time a propagator reports a wipeout on it (see record_conflict), so 
+    search focuses on the hard parts of the problem. Before any conflict this 
+    is dom/deg.
+
+    Weights are kept on the constraints and are not reset between searches.
+    '''
+
+    def attach(self, csp):
+        self.wdeg = dict()
+        VarHeap.attach(self, csp)
+
+    def key(self, var):
+        wdeg = self.wdeg[var]
+        size = var.cur_domain_size()
+        return (size / wdeg if wdeg else float('inf'), self.index[var])
+
+    def insert(self, var):
+        if var in self.index:
+            self.wdeg[var] = sum(c.weight for c in self.csp.get_cons_with_var(var) 
+                                 if c.get_n_unasgn() >= 2)
+        VarHeap.insert(self, var)
+
+    def assigned(self, var):
+        self.remove(var)
+        for c in self.csp.get_cons_with_var(var):
+            #c no longer counts for its last unassigned variable
+            other = c.get_last_unasgn_var()
+            if other is not None and other in self.pos:
+                self.wdeg[other] -= c.weight
+                self.update(other)
+
+    def unassigned(self, var):
+        for c in self.csp.get_cons_with_var(var):
+            if c.get_n_unasgn() == 2:
+                for other in c.get_unasgn_vars():
+                    if other is not var and other in self.pos:
+                        self.wdeg[other] += c.weight
+                        self.update(other)
+        self.insert(var)
+
+    def conflict(self, c):
+        if c.get_n_unasgn() >= 2:
+            for var in c.get_unasgn_vars():
+                if var in self.pos:
+                    self.wdeg[var] += 1
+                    self.update(var)
@@ -0,0 +1,189 @@
+'''
+KenKen boards of any size: a random board generator and a corpus of generated
+boards for benchmarks.
+
+    board = generate_board(8, random.Random(1))  #an 8x8 board
+    boards = corpus()                             #boards from 4x4 to 15x15
+    save_boards("boards.json", boards)
+    boards = load_boards("boards.json")
+
+Boards are in the format of kenken_csp: [[n], cage, cage, ...] where a cage
+is [cell, ..., cell, target, operation] or [cell, value] for a given cell,
+with the cells written as described in cell_position (boards larger than 9x9
+have cells of 4 digits).
+
+generate_board shuffles a Latin square, cuts it into random connected cages
+and gives each cage an operation and the target its cells make. The board is
+then solved and, while it has another solution, a cell where that solution
+differs is split off its cage as a given value, so every generated board has
+exactly one solution.
+'''
+
+import json
+import random
+
+from cspbase import *
+from propagators import *
+from heuristics import *
+from kenken_csp import *
+
+#relative frequency of each cage size
+CAGE_SIZES = {1: 1, 2: 6, 3: 5, 4: 2}
+
+def latin_square(n, rng):
+    '''A random n x n Latin square with values 1..n, as a list of rows'''
+    rows = list(range(n))
+    cols = list(range(n))
+    symbols = list(range(1, n + 1))
+    rng.shuffle(rows)
+    rng.shuffle(cols)
+    rng.shuffle(symbols)
+    return [[symbols[(r + c) % n] for c in cols] for r in rows]
+
+def neighbours(cell, n):
+    i, j = cell
+    for a, b in ((i - 1, j), (i + 1, j), (i, j - 1), (i, j + 1)):
+        if 0 <= a < n and 0 <= b < n:
+            yield (a, b)
+
+def random_cages(n, rng, sizes=CAGE_SIZES):
+    '''
+    Partition the cells of an n x n grid into connected cages, each grown
+    from a random cell to a size drawn from sizes (or less, when it runs out
+    of free neighbours). Return a list of lists of (row, column) cells.
+    '''
+    free = set((i, j) for i in range(n) for j in range(n))
+    order = sorted(free)
+    rng.shuffle(order)
+    cages = []
+    for start in order:
+        if start not in free:
+            continue
+        size = rng.choices(list(sizes), list(sizes.values()))[0]
+        cage = [start]
+        free.discard(start)
+        while len(cage) < size:
+            frontier = sorted(set(nb for cell in cage for nb in neighbours(cell, n)
+                                  if nb in free))
+            if not frontier:
+                break
+            cell = rng.choice(frontier)
+            cage.append(cell)
+            free.discard(cell)
+        cages.append(cage)
+    return cages
+
+def cage_clue(cells, square, rng, operation=None):
+    '''
+    Return the cage of the board format for cells of square, with a random
+    operation that suits the values, or with operation if given (it must
+    suit them, e.g. addition or multiplication).
+    '''
+    n = len(square)
+    codes = [cell_code(i + 1, j + 1, n) for i, j in cells]
+    values = [square[i][j] for i, j in cells]
+    if len(cells) == 1:
+        return codes + values
+    if operation is None:
+        if len(cells) == 2:
+            big, small = max(values), min(values)
+            choices = [SUBTRACTION, ADDITION, MULTIPLICATION]
+            if big % small == 0:
+                choices.append(DIVISION)
+            operation = rng.choice(choices)
+        else:
+            operation = rng.choice([ADDITION, MULTIPLICATION])
+    if operation == ADDITION:
+        target = sum(values)
+    elif operation == MULTIPLICATION:
+        target = 1
+        for v in values:
+            target *= v
+    elif operation == SUBTRACTION:
+        target = max(values) - min(values)
+    else:
+        target = max(values) // min(values)
+    return codes + [target, operation]
+
+def components(cells, n):
+    '''Split cells into its connected groups'''
+    left = set(cells)
+    groups = []
+    for cell in cells:
+        if cell not in left:
+            continue
+        group = [cell]
+        left.discard(cell)
+        for c in group:
+            for nb in neighbours(c, n):
+                if nb in left:
+                    left.discard(nb)
+                    group.append(nb)
+        groups.append(group)
+    return groups
+
+def two_solutions(board):
+    '''
+    Return up to two solutions of board, each a list of rows, searching with
+    prop_GAC and ord_mrv on kenken_csp_model_nary.
+    '''
+    csp, var_array = kenken_csp_model_nary([list(cage) for cage in board])
+    solver = BT(csp)
+    solver.quiet()
+    found = []
+    for _ in solver.solutions(prop_GAC, ord_mrv):
+        found.append([[var.get_assigned_value() for var in row] for row in var_array])
+        if len(found) == 2:
+            break
+    return found
+
+def generate_board(n, rng=None, sizes=CAGE_SIZES, unique=True):
+    '''
+    Return a random n x n KenKen board. The cage sizes are drawn from sizes,
+    a dict of relative frequencies. If unique, cells are turned into givens
+    until the board has exactly one solution.
+    '''
+    if rng is None:
+        rng = random.Random()
+    square = latin_square(n, rng)
+    #(cells, clue) of each cage
+    cages = [(cells, cage_clue(cells, square, rng)) for cells in random_cages(n, rng, sizes)]
+    while unique:
+        board = [[n]] + [clue for _, clue in cages]
+        solutions = [s for s in two_solutions(board) if s != square]
+        if not solutions:
+            break
+        #give the value of a cell where the other solution differs, the 
+        #rest of its cage keeps the operation
+        other = solutions[0]
+        cell = next((i, j) for i in range(n) for j in range(n)
+                    if other[i][j] != square[i][j])
+        k = next(k for k, (cells, _) in enumerate(cages) if cell in cells)
+        cells, clue = cages.pop(k)
+        cages.append(([cell], cage_clue([cell], square, rng)))
+        for group in components([c for c in cells if c != cell], n):
+            cages.append((group, cage_clue(group, square, rng, clue[-1])))
+    return [[n]] + [clue for _, clue in cages]
+
+def corpus(sizes=range(4, 16), per_size=2, seed=0):
+    '''
+    A list of per_size generated boards of each size in sizes, the same for
+    the same seed.
+    '''
+    rng = random.Random(seed)
+    boards = []
+    for n in sizes:
+        for _ in range(per_size):
+            boards.append(generate_board(n, rng))
+    return boards
+
+def save_boards(file, boards):
+    '''Write boards to file as JSON, one board per line'''
+    with open(file, 'w') as f:
+        for board in boards:
+            f.write(json.dumps(board) + '\n')
+
+def load_boards(file):
+    '''Read the boards of a file written by save_boards'''
+    with open(file) as f:
+        return [json.loads(line) for line in f if line.strip()]
@@ -14,6 +14,11 @@ cell of the KenKen puzzle.
 
 The grid-only models do not need to encode the cage constraints.
 
+Cells of the board are written as their row and column run together (see 
+cell_position), e.g. 23 for row 2 column 3, and boards of 10x10 and more use 
+two digits for each, e.g. 1012 for row 10 column 12. kenken_boards generates 
+boards of any size.
+
 1. binary_ne_grid (worth 10/100 marks)
     - A model of a KenKen grid (without cage constraints) built using only 
       binary not-equal constraints for both the row and column constraints.
@@ -26,10 +31,121 @@ The grid-only models do not need to encode the cage constraints.
     - A model built using your choice of (1) binary binary not-equal, or (2) 
       m-ary all-different constraints for the grid.
     - Together with KenKen cage constraints.
+    - The tables of the cage constraints are generated by cage_tuples, which 
+      enumerates only the satisfying tuples of each cage and is shared with 
+      kenken_csp_model_nary. Large addition and multiplication cages are not 
+      enumerated: cage_constraint makes them a SumConstraint or a 
+      ProductConstraint of cspbase. The size limits can be given to the 
+      model (arithmetic_size, domain_size), see ARITHMETIC_CAGE_SIZE.
 
 '''
 from cspbase import *
 import itertools
+import functools
+
+#cage operations of the board format
+ADDITION, SUBTRACTION, DIVISION, MULTIPLICATION = range(4)
+
+def cell_position(cell, n):
+    '''
+    Return the (row, column) indices, from 0, of a cell of an n x n board. 
+    The board format writes a cell as its row and column, numbered from 1, 
+    run together with as many digits each as n has: 23 is row 2 column 3 on 
+    boards up to 9x9, and on boards from 10x10 to 99x99 1012 is row 10 
+    column 12 and 203 is row 2 column 3.
+    '''
+    base = 10 ** len(str(n))
+    cell = int(cell)
+    return cell // base - 1, cell % base - 1
+
+def cell_code(row, col, n):
+    '''The cell of the board format at row and col, numbered from 1'''
+    return row * 10 ** len(str(n)) + col
+
+@functools.lru_cache(maxsize=None)
+def cage_tuples(operation, target, size, n):
+    '''
+    Return the satisfying tuples of a cage of size cells, each with the 
+    domain 1..n, whose values combine to target with operation:
+        ADDITION        - the values add up to target
+        MULTIPLICATION  - their product is target
+        SUBTRACTION     - some value minus all the others is target
+        DIVISION        - some value divided by all the others is target
+    The tuples are listed in the order of itertools.product, without 
+    repeats. Only satisfying tuples are generated, sums as bounded 
+    compositions and products from the divisors of target, instead of 
+    testing all n^size combinations (and their permutations). Results are 
+    memoized and shared by every cage with the same arguments, so they are 
+    returned as a tuple of tuples.
+    '''
+    if operation == ADDITION:
+        return tuple(sum_tuples(target, size, n))
+    if operation == MULTIPLICATION:
+        return tuple(product_tuples(target, size, n))
+    tuples = []
+    for x in range(1, n + 1):
+        if operation == SUBTRACTION:
+            #x - (total - x) == target
+            total = 2 * x - target
+            tuples.extend(t for t in sum_tuples(total, size, n) if x in t)
+        elif operation == DIVISION and target > 0 and (x * x) % target == 0:
+            #x / (total / x) == target
+            total = x * x // target
+            tuples.extend(t for t in product_tuples(total, size, n) if x in t)
+    #each tuple has one total, so it appears once
+    return tuple(sorted(tuples))
+
+def sum_tuples(total, size, n):
+    '''Generate the tuples of size values in 1..n adding up to total, in order'''
+    if size == 0:
+        if total == 0:
+            yield ()
+        return
+    rest = size - 1
+    #leave the other cells a total they can make
+    for v in range(max(1, total - rest * n), min(n, total - rest) + 1):
+        for t in sum_tuples(total - v, rest, n):
+            yield (v,) + t
+
+def product_tuples(total, size, n):
+    '''Generate the tuples of size values in 1..n multiplying to total, in order'''
+    if size == 0:
+        if total == 1:
+            yield ()
+        return
+    rest = size - 1
+    for v in range(1, min(n, total) + 1):
+        if total % v == 0 and total // v <= n ** rest:
+            for t in product_tuples(total // v, rest, n):
+                yield (v,) + t
+
+#addition and multiplication cages of at least ARITHMETIC_CAGE_SIZE cells are 
+#SumConstraints and ProductConstraints instead of tables, filtered with domain 
+#consistency up to DOMAIN_CAGE_SIZE cells and bounds consistency above
+ARITHMETIC_CAGE_SIZE = 5
+DOMAIN_CAGE_SIZE = 8
+
+def cage_constraint(name, scope, operation, target, n, 
+                    arithmetic_size=ARITHMETIC_CAGE_SIZE, domain_size=DOMAIN_CAGE_SIZE):
+    '''
+    Return the constraint of a cage of an n x n board over the variables of 
+    scope: an arithmetic constraint for addition and multiplication cages of 
+    at least arithmetic_size cells, with domain consistency up to 
+    domain_size cells (see ARITHMETIC_CAGE_SIZE), otherwise a table of 
+    cage_tuples.
+    '''
+    if operation in (ADDITION, MULTIPLICATION) and len(scope) >= arithmetic_size:
+        arithmetic = SumConstraint if operation == ADDITION else ProductConstraint
+        return arithmetic(name, scope, target, len(scope) <= domain_size)
+    c = Constraint(name, scope)
+    satisfying_tuples = cage_tuples(operation, target, len(scope), n)
+    domains = [var.domain() for var in scope]
+    if any(len(d) != n for d in domains):
+        #a cell was fixed by another cage, keep the tuples it allows
+        satisfying_tuples = [t for t in satisfying_tuples 
+                             if all(v in d for v, d in zip(t, domains))]
+    c.add_satisfying_tuples(satisfying_tuples)
+    return c
 
 def binary_ne_grid(kenken_grid):
     # TODO! IMPLEMENT THIS!
@@ -44,10 +160,18 @@ def binary_ne_grid(kenken_grid):
     for i in domain:
         row = []
         for j in domain:
-            row.append(Variable('Cell{}{}'.format(i, j), domain))
+            row.append(Variable('Cell{}'.format(cell_code(i, j, len(domain))), domain))
         variables.append(row)
         #variables to become a list of lists, out list holding the rows, inner holding the ith, jth cell
     
+    #every pair of cells has the same not-equal table, build it once and share it
+    not_equal = []
+    for permutations in itertools.product(domain, repeat=2):
+        #all permutations of two values within valid domain that has bne values
+        if permutations[0] != permutations[1]:
+            not_equal.append(permutations)
+    not_equal = Relation.intern(not_equal)
+
     constraints = []
     for i in range(len(domain)): #cycle through each row
         for j in range(len(domain)): #cycle through each element in each row
@@ -57,13 +181,8 @@ def binary_ne_grid(kenken_grid):
                 #binary constraints between two variables in the same row
                 first_var = variables[i][j]
                 second_var = variables[i][k]
-                c = Constraint('Constraint(Cell{}{},Cell{}{})'.format(i+1, j+1, i+1, k+1), [first_var, second_var])
-                satisfying_tuples = []
-                for permutations in itertools.product(domain, repeat=2):
-                    #all permutations of two values within valid domain that has bne values
-                    if permutations[0] != permutations[1]:
-                        satisfying_tuples.append(permutations)
-                c.add_satisfying_tuples(satisfying_tuples)
+                c = Constraint('Constraint(Cell{},Cell{})'.format(cell_code(i+1, j+1, len(domain)), cell_code(i+1, k+1, len(domain))), [first_var, second_var])
+                c.add_satisfying_tuples(not_equal)
                 constraints.append(c)
             #same process but now for columns, i.e. moving down columns for the second variable to form bne
             for k in range(len(variables[i])):
@@ -71,12 +190,8 @@ def binary_ne_grid(kenken_grid):
                     continue
                 first_var = variables[i][j]
                 second_var = variables[k][j]        
-                c = Constraint('Constraint(Cell{}{},Cell{}{})'.format(i+1, j+1, k+1, j+1), [first_var, second_var])
-                satisfying_tuples = []
-                for permutations in itertools.product(domain, repeat=2):
-                    if permutations[0] != permutations[1]:
-                        satisfying_tuples.append(permutations)
-                c.add_satisfying_tuples(satisfying_tuples)
+                c = Constraint('Constraint(Cell{},Cell{})'.format(cell_code(i+1, j+1, len(domain)), cell_code(k+1, j+1, len(domain))), [first_var, second_var])
+                c.add_satisfying_tuples(not_equal)
                 constraints.append(c)
     
     for row in variables:
@@ -103,7 +218,7 @@ def nary_ad_grid(kenken_grid):
     for i in domain:
         row = []
         for j in domain:
-            row.append(Variable('Cell{}{}'.format(i, j), domain))
+            row.append(Variable('Cell{}'.format(cell_code(i, j, len(domain))), domain))
         variables.append(row)
         #same variable determination as bne
         
@@ -112,21 +227,9 @@ def nary_ad_grid(kenken_grid):
         var=[]
         for k in range(len(variables[i])):
             var.append(variables[i][k])
-        c = Constraint('Constraint(Row{})'.format(i+1), var)
-        satisfying_tuples = []
-        var_length=len(var)
-        #contraints involve all variables of a row, permutate over all variables and values of a row
-        for permutations in itertools.product(domain, repeat=var_length):
-            satisfied = True
-            for l in range(var_length):
-                for m in range(var_length):
-                    if l != (var_length-1):
-                        #checking that none of the variables in a row are equal
-                        if l != m and permutations[l] == permutations[m]:
-                            satisfied = False
-                if l == (var_length-1) and satisfied:
-                    satisfying_tuples.append(permutations)
-        c.add_satisfying_tuples(satisfying_tuples)
+        #contraints involve all variables of a row, a native all-different 
+        #constraint rather than a table of the n! satisfying tuples
+        c = AllDiffConstraint('Constraint(Row{})'.format(i+1), var)
         constraints.append(c)
     #same process, but now for columns contraints
     constraints_column = []
@@ -134,19 +237,7 @@ def nary_ad_grid(kenken_grid):
         var=[]
         for k in range(len(variables[i])):
             var.append(variables[k][i])
-        c = Constraint('Constraint(Column{})'.format(i+1), var)
-        satisfying_tuples = []
-        var_length=len(var)
-        for permutations in itertools.product(domain, repeat=var_length):
-            satisfied = True
-            for l in range(var_length):
-                for m in range(var_length):
-                    if l != (var_length-1):
-                        if l != m and permutations[l] == permutations[m]:
-                            satisfied = False
-                if l == (var_length-1) and satisfied:
-                    satisfying_tuples.append(permutations)
-        c.add_satisfying_tuples(satisfying_tuples)
+        c = AllDiffConstraint('Constraint(Column{})'.format(i+1), var)
         constraints_column.append(c)
     
     for row in variables:
@@ -165,7 +256,8 @@ def nary_ad_grid(kenken_grid):
     return csp, variables
 
 #use binary model, as faster than unary when I checked
-def kenken_csp_model(kenken_grid):
+def kenken_csp_model(kenken_grid, arithmetic_size=ARITHMETIC_CAGE_SIZE, 
+                     domain_size=DOMAIN_CAGE_SIZE):
     #using binary not equal
     # TODO! IMPLEMENT THIS!
     #pass
@@ -179,7 +271,7 @@ def kenken_csp_model(kenken_grid):
     for i in domain:
         row = []
         for j in domain:
-            row.append(Variable('Cell{}{}'.format(i, j), domain))
+            row.append(Variable('Cell{}'.format(cell_code(i, j, len(domain))), domain))
         variables.append(row)  
         #getting all cell variables as a list of cells inside a list of rows
         
@@ -189,58 +281,30 @@ def kenken_csp_model(kenken_grid):
         if(len(kenken_grid[cage]) > 2):
             #case where the cage has more than two values
             var = []
-            var_domain = []
             operation = kenken_grid[cage][-1]  
             target = kenken_grid[cage][-2]
             for cell in range(len(kenken_grid[cage]) - 2):
                 #determining the ith and jth cell coordinate from the variable name
-                i = int(str(kenken_grid[cage][cell])[0]) - 1
-                j = int(str(kenken_grid[cage][cell])[1]) - 1
+                i, j = cell_position(kenken_grid[cage][cell], len(domain))
                 var.append(variables[i][j])
-                var_domain.append(variables[i][j].domain())
-            c = Constraint('Constraint(Cage{})'.format(cage), var)
-            satisfying_tuples = []
-            for permutations in itertools.product(*var_domain): #all permutations of the n values inside a cage
-                if(operation == 0):
-                    #addition
-                    current_value = 0
-                    for perm in permutations:
-                        current_value += perm
-                    if (current_value == target):
-                        satisfying_tuples.append(permutations)
-                elif(operation == 1):
-                    #subtraction
-                    for perm in itertools.permutations(permutations):
-                        current_value = perm[0]
-                        for m in range(1, len(perm)):
-                            current_value -= perm[m]
-                        if(current_value == target):
-                            satisfying_tuples.append(permutations)
-                elif(operation == 2):
-                    #division
-                    for perm in itertools.permutations(permutations):
-                        current_value = perm[0]
-                        for m in range(1, len(perm)):
-                            current_value /= perm[m]
-                        if(current_value == target):
-                            satisfying_tuples.append(permutations)
-                elif(operation == 3):
-                    #multiplication
-                    current_value = 1
-                    for perm in permutations:
-                        current_value *= perm
-                    if (current_value == target):
-                        satisfying_tuples.append(permutations)
-            c.add_satisfying_tuples(satisfying_tuples)
+            c = cage_constraint('Constraint(Cage{})'.format(cage), var, operation, 
+                                target, len(domain), arithmetic_size, domain_size)
             constraints.append(c)
         else:
             #case where each cage has only two values, one for the cell variable and second for the value enforced in that cell
-            i = int(str(kenken_grid[cage][0])[0]) - 1 #ith cell coordinate
-            j = int(str(kenken_grid[cage][0])[1]) - 1 #jth cell coordinate
+            i, j = cell_position(kenken_grid[cage][0], len(domain)) #ith and jth cell coordinates
             value_enforced = kenken_grid[cage][1] #value assigned to that cell
-            variables[i][j] = Variable('Cell{}{}'.format(i, j), [value_enforced])
+            variables[i][j] = Variable('Cell{}'.format(cell_code(i+1, j+1, len(domain))), [value_enforced])
             
     #using binary constraints developed from the bne function
+    #every pair of cells has the same not-equal table, build it once and share it
+    not_equal = []
+    for permutations in itertools.product(domain, repeat=2):
+        #all permutations of two values within valid domain that has bne values
+        if permutations[0] != permutations[1]:
+            not_equal.append(permutations)
+    not_equal = Relation.intern(not_equal)
+
     for i in range(len(domain)): #cycle through each row
         for j in range(len(domain)): #cycle through each element in each row
             for k in range(len(variables[i])):#comparing bne in rows
@@ -249,13 +313,8 @@ def kenken_csp_model(kenken_grid):
                 #binary constraints between two variables in the same row
                 first_var = variables[i][j]
                 second_var = variables[i][k]
-                c = Constraint('Constraint(Cell{}{},Cell{}{})'.format(i+1, j+1, i+1, k+1), [first_var, second_var])
-                satisfying_tuples = []
-                for permutations in itertools.product(domain, repeat=2):
-                    #all permutations of two values within valid domain that has bne values
-                    if permutations[0] != permutations[1]:
-                        satisfying_tuples.append(permutations)
-                c.add_satisfying_tuples(satisfying_tuples)
+                c = Constraint('Constraint(Cell{},Cell{})'.format(cell_code(i+1, j+1, len(domain)), cell_code(i+1, k+1, len(domain))), [first_var, second_var])
+                c.add_satisfying_tuples(not_equal)
                 constraints.append(c)
             #same process but now for columns, i.e. moving down columns for the second variable to form bne
             for k in range(len(variables[i])):
@@ -263,12 +322,8 @@ def kenken_csp_model(kenken_grid):
                     continue
                 first_var = variables[i][j]
                 second_var = variables[k][j]        
-                c = Constraint('Constraint(Cell{}{},Cell{}{})'.format(i+1, j+1, k+1, j+1), [first_var, second_var])
-                satisfying_tuples = []
-                for permutations in itertools.product(domain, repeat=2):
-                    if permutations[0] != permutations[1]:
-                        satisfying_tuples.append(permutations)
-                c.add_satisfying_tuples(satisfying_tuples)
+                c = Constraint('Constraint(Cell{},Cell{})'.format(cell_code(i+1, j+1, len(domain)), cell_code(k+1, j+1, len(domain))), [first_var, second_var])
+                c.add_satisfying_tuples(not_equal)
                 constraints.append(c)
     
     for row in variables:
@@ -283,7 +338,8 @@ def kenken_csp_model(kenken_grid):
     return csp, variables
 
 #ken ken model using nary model, not to be used as slower than binary model. Same priciples as kenken_csp_model 
-def kenken_csp_model_nary(kenken_grid):
+def kenken_csp_model_nary(kenken_grid, arithmetic_size=ARITHMETIC_CAGE_SIZE, 
+                          domain_size=DOMAIN_CAGE_SIZE):
     #using nary all diff
     # TODO! IMPLEMENT THIS!
     #pass
@@ -296,75 +352,31 @@ def kenken_csp_model_nary(kenken_grid):
     for i in domain:
         row = []
         for j in domain:
-            row.append(Variable('Cell{}{}'.format(i, j), domain))
+            row.append(Variable('Cell{}'.format(cell_code(i, j, len(domain))), domain))
         variables.append(row)  
 
     constraints = []
     for cage in range(1, len(kenken_grid)):
         if(len(kenken_grid[cage]) > 2):
             var = []
-            var_domain = []
             operation = kenken_grid[cage][-1]  
             target = kenken_grid[cage][-2]
             for cell in range(len(kenken_grid[cage]) - 2):
-                i = int(str(kenken_grid[cage][cell])[0]) - 1
-                j = int(str(kenken_grid[cage][cell])[1]) - 1
+                i, j = cell_position(kenken_grid[cage][cell], len(domain))
                 var.append(variables[i][j])
-                var_domain.append(variables[i][j].domain())
-            c = Constraint('Constraint(Cage{})'.format(cage), var)
-            satisfying_tuples = []
-            for permutations in itertools.product(*var_domain):
-                if(operation == 0):
-                    current_value = 0 
-                    for perm in permutations:
-                        current_value += perm
-                    if (current_value == target):
-                        satisfying_tuples.append(permutations)
-                elif(operation == 1):
-                    for perm in itertools.permutations(permutations):
-                        current_value = perm[0]
-                        for m in range(1, len(perm)):
-                            current_value -= perm[m]
-                        if(current_value == target):
-                            satisfying_tuples.append(permutations)
-                elif(operation == 2):
-                    for perm in itertools.permutations(permutations):
-                        current_value = perm[0]
-                        for m in range(1, len(perm)):
-                            current_value /= perm[m]
-                        if(current_value == target):
-                            satisfying_tuples.append(permutations)
-                elif(operation == 3):
-                    current_value = 1
-                    for perm in permutations:
-                        current_value *= perm
-                    if (current_value == target):
-                        satisfying_tuples.append(permutations)
-            c.add_satisfying_tuples(satisfying_tuples)
+            c = cage_constraint('Constraint(Cage{})'.format(cage), var, operation, 
+                                target, len(domain), arithmetic_size, domain_size)
             constraints.append(c)
         else:
-            i = int(str(kenken_grid[cage][0])[0]) - 1
-            j = int(str(kenken_grid[cage][0])[1]) - 1
+            i, j = cell_position(kenken_grid[cage][0], len(domain))
             value_enforced = kenken_grid[cage][1]
-            variables[i][j] = Variable('Cell{}{}'.format(i, j), [value_enforced])
+            variables[i][j] = Variable('Cell{}'.format(cell_code(i+1, j+1, len(domain))), [value_enforced])
 
     for i in range(len(domain)):
         var=[]
         for k in range(len(variables[i])):
             var.append(variables[i][k])
-        c = Constraint('Constraint(Row{})'.format(i+1), var)
-        satisfying_tuples = []
-        var_length=len(var)
-        for permutations in itertools.product(domain, repeat=var_length):
-            satisfied = True
-            for l in range(var_length):
-                for m in range(var_length):
-                    if l != (var_length-1):
-                        if l != m and permutations[l] == permutations[m]:
-                            satisfied = False
-                if l == (var_length-1) and satisfied:
-                    satisfying_tuples.append(permutations)
-        c.add_satisfying_tuples(satisfying_tuples)
+        c = AllDiffConstraint('Constraint(Row{})'.format(i+1), var)
         constraints.append(c)
     
     constraints_column = []
@@ -372,19 +384,7 @@ def kenken_csp_model_nary(kenken_grid):
         var=[]
         for k in range(len(variables[i])):
             var.append(variables[k][i])
-        c = Constraint('Constraint(Column{})'.format(i+1), var)
-        satisfying_tuples = []
-        var_length=len(var)
-        for permutations in itertools.product(domain, repeat=var_length):
-            satisfied = True
-            for l in range(var_length):
-                for m in range(var_length):
-                    if l != (var_length-1):
-                        if l != m and permutations[l] == permutations[m]:
-                            satisfied = False
-                if l == (var_length-1) and satisfied:
-                    satisfying_tuples.append(permutations)
-        c.add_satisfying_tuples(satisfying_tuples)
+        c = AllDiffConstraint('Constraint(Column{})'.format(i+1), var)
         constraints_column.append(c)
 
     for row in variables:
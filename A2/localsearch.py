@@ -0,0 +1,363 @@
+'''
+Local search over the CSP objects of cspbase: min-conflicts with a tabu list
+and random walk. It does not prove that a CSP has no solution, but on large
+problems with many solutions (n-Queens with 1000+ queens, large Latin
+squares) it finds one long before backtracking would.
+
+    solver = MinConflicts(csp)
+    solver.quiet()
+    if solver.search(max_steps=100000, seed=1):
+        var_array[0][0].get_assigned_value()   #the solution is assigned
+
+Every variable of the CSP gets a value from its current domain, and at each
+step a variable in conflict (in some violated constraint) is picked at random
+and moved to the value that lowers the number of conflicts most (ties broken
+at random). A variable is not moved back to the value it left for
+tabu_tenure steps, unless that leads to fewer conflicts than ever before, and
+with probability walk_prob the new value is picked at random instead, to get
+out of local minima.
+
+The conflicts are kept incrementally, so a step only looks at the
+constraints of the variable moved:
+    - an AllDiffConstraint keeps the variables holding each (shifted) value,
+      and a variable is in conflict with every other variable holding its
+      value,
+    - any other constraint is checked when one of its variables moves, and
+      every variable of its scope is in conflict while it is violated.
+
+When a solution is found it is assigned to the variables with
+Variable.assign, as bt_search leaves it, so it can be read and checked the
+same way. queens_csp builds an n-Queens CSP of three all-different
+constraints that scales to thousands of queens.
+'''
+
+import random
+import time
+
+from cspbase import *
+
+def queens_csp(n):
+    '''
+    Return an n-Queens CSP with variables Q1..Qn, the column of the queen of
+    each row, and all-different constraints on the columns and on the two
+    diagonals (the columns plus and minus the rows).
+    '''
+    dom = list(range(1, n + 1))
+    vars = [Variable('Q{}'.format(i), dom) for i in dom]
+    csp = CSP("{}-Queens".format(n), vars)
+    csp.add_constraint(AllDiffConstraint("Columns", vars))
+    csp.add_constraint(AllDiffConstraint("Diagonals", vars, range(n)))
+    csp.add_constraint(AllDiffConstraint("AntiDiagonals", vars, range(0, -n, -1)))
+    return csp
+
+class IndexedSet:
+    '''A set with O(1) add, discard and uniform random choice'''
+
+    def __init__(self):
+        self.items = []
+        self.index = dict()
+
+    def add(self, x):
+        if x not in self.index:
+            self.index[x] = len(self.items)
+            self.items.append(x)
+
+    def discard(self, x):
+        i = self.index.pop(x, None)
+        if i is not None:
+            last = self.items.pop()
+            if last is not x:
+                self.items[i] = last
+                self.index[last] = i
+
+    def choice(self, rng):
+        return self.items[rng.randrange(len(self.items))]
+
+    def __len__(self):
+        return len(self.items)
+
+class MinConflicts:
+    '''
+    Min-conflicts local search on a CSP, with the statistics of the last
+    search: nSteps (moves made) and runtime.
+    '''
+
+    def __init__(self, csp):
+        '''csp is the CSP object to solve'''
+        self.csp       = csp
+        self.nSteps    = 0
+        self.LOG_LEVEL = 1
+        self.runtime   = 0
+
+    def quiet(self):
+        self.LOG_LEVEL = 0
+
+    def print_stats(self):
+        print("Search made {} moves".format(self.nSteps))
+
+    def search(self, max_steps=100000, tabu_tenure=10, walk_prob=0.02, seed=None):
+        '''
+        Look for a solution for at most max_steps moves. If one is found
+        assign it to the variables and return True, otherwise leave them
+        unassigned and return False (which does not mean there is no
+        solution). seed makes the search repeatable.
+        '''
+        stime = time.process_time()
+        self.rng = random.Random(seed)
+        self.nSteps = 0
+        for var in self.csp.get_all_vars():
+            if var.is_assigned():
+                var.unassign()
+        if not all(var.cur_domain_size() for var in self.csp.get_all_vars()):
+            print("ERROR: a variable of CSP {} has an empty domain".format(self.csp.name))
+            return False
+        self.start()
+        best = self.total
+        tabu = dict() #(variable, value) -> first step it can be taken again
+        while self.conflicted and self.nSteps < max_steps:
+            self.nSteps += 1
+            var = self.conflicted.choice(self.rng)
+            current = self.value[var]
+            if var in self.swaps:
+                self.swap_step(var, tabu, best, walk_prob, tabu_tenure)
+                best = min(best, self.total)
+                continue
+            options = [d for d in self.doms[var] if d != current]
+            if not options:
+                continue
+            if self.rng.random() < walk_prob:
+                val = self.rng.choice(options)
+            else:
+                val = None
+                least = None
+                ties = 0
+                for d in options:
+                    delta = self.delta(var, d)
+                    if tabu.get((var, d), 0) > self.nSteps and self.total + delta >= best:
+                        continue
+                    if least is None or delta < least:
+                        least, val, ties = delta, d, 1
+                    elif delta == least:
+                        #choose uniformly among the ties
+                        ties += 1
+                        if self.rng.randrange(ties) == 0:
+                            val = d
+                if val is None:
+                    val = self.rng.choice(options)
+            tabu[(var, current)] = self.nSteps + tabu_tenure
+            self.move(var, val)
+            best = min(best, self.total)
+        self.runtime = time.process_time() - stime
+        solved = not self.conflicted
+        if solved:
+            for var in self.csp.get_all_vars():
+                var.assign(self.value[var])
+        if self.LOG_LEVEL > 0:
+            if solved:
+                print("CSP {} solved. CPU Time used = {}".format(self.csp.name, self.runtime))
+                self.csp.print_soln()
+            else:
+                print("CSP {} unsolved after {} moves, {} conflicts left".format(
+                    self.csp.name, self.nSteps, self.total))
+            self.print_stats()
+        return solved
+
+    def start(self):
+        '''
+        Internal routine. Give every variable a random value of its current
+        domain, then move each in turn to its best value, and set up the
+        conflict counts.
+        '''
+        self.doms = dict()
+        self.value = dict()
+        for var in self.csp.get_all_vars():
+            self.doms[var] = var.cur_domain()
+            self.value[var] = self.rng.choice(self.doms[var])
+        #all-different constraints that are permutations of at least two 
+        #free variables, not in another one, start satisfied and only swap 
+        #values
+        self.swaps = dict() #variable -> the variables it swaps values with
+        for c in self.csp.get_all_cons():
+            if not isinstance(c, AllDiffConstraint) or any(c.offsets) or \
+               len(set(c.scope)) < len(c.scope) or any(v in self.swaps for v in c.scope):
+                continue
+            free = [v for v in c.scope if len(self.doms[v]) > 1]
+            fixed = set(self.doms[v][0] for v in c.scope if len(self.doms[v]) == 1)
+            if len(fixed) + len(free) < len(c.scope) or len(free) < 2:
+                continue
+            values = set(self.doms[free[0]]) - fixed
+            if len(values) != len(free) or \
+               not all(values <= set(self.doms[v]) for v in free):
+                continue
+            values = sorted(values)
+            self.rng.shuffle(values)
+            for v, val in zip(free, values):
+                self.value[v] = val
+                self.swaps[v] = [other for other in free if other is not v]
+        #(constraint, offset of the variable) of the all-different
+        #constraints of each variable, and its other constraints
+        self.alldiffs = dict((var, []) for var in self.doms)
+        self.others = dict((var, []) for var in self.doms)
+        self.holders = dict() #all-different constraint -> shifted value -> variables
+        self.violated = set() #violated constraints other than all-different
+        self.conflicts = dict((var, 0) for var in self.doms)
+        self.conflicted = IndexedSet()
+        self.total = 0 #sum of the conflicts of all variables
+        for c in self.csp.get_all_cons():
+            scope = c.get_scope()
+            if isinstance(c, AllDiffConstraint):
+                holders = self.holders[c] = dict()
+                for var, o in zip(scope, c.offsets):
+                    self.alldiffs[var].append((c, o))
+                    key = self.value[var] + o
+                    for other in holders.setdefault(key, set()):
+                        self.conflicts[other] += 1
+                        self.conflicts[var] += 1
+                        self.total += 2
+                    holders[key].add(var)
+            else:
+                for var in set(scope):
+                    self.others[var].append(c)
+                if not c.check([self.value[var] for var in scope]):
+                    self.violated.add(c)
+                    for var in scope:
+                        self.conflicts[var] += 1
+                    self.total += len(scope)
+        for var, n in self.conflicts.items():
+            if n:
+                self.conflicted.add(var)
+        for var in self.csp.get_all_vars():
+            if var in self.swaps:
+                continue
+            deltas = [(self.delta(var, d), d) for d in self.doms[var] if d != self.value[var]]
+            if deltas:
+                delta, val = min(deltas, key=lambda x: x[0])
+                if delta < 0:
+                    self.move(var, val)
+
+    def swap_step(self, var, tabu, best, walk_prob, tabu_tenure):
+        '''
+        Internal routine. Swap the value of var with that of the variable of 
+        its permutation constraint that lowers the conflicts most, or of a 
+        random one with probability walk_prob.
+        '''
+        current = self.value[var]
+        others = self.swaps[var]
+        if self.rng.random() < walk_prob:
+            other = self.rng.choice(others)
+        else:
+            other = None
+            least = None
+            ties = 0
+            for y in others:
+                val = self.value[y]
+                delta = self.swap_delta(var, y)
+                if tabu.get((var, val), 0) > self.nSteps and self.total + delta >= best:
+                    continue
+                if least is None or delta < least:
+                    least, other, ties = delta, y, 1
+                elif delta == least:
+                    ties += 1
+                    if self.rng.randrange(ties) == 0:
+                        other = y
+            if other is None:
+                other = self.rng.choice(others)
+        val = self.value[other]
+        tabu[(var, current)] = tabu[(other, val)] = self.nSteps + tabu_tenure
+        self.move(var, val)
+        self.move(other, current)
+
+    def swap_delta(self, x, y):
+        '''Internal routine. Change of total if x and y swapped values'''
+        a, b = self.value[x], self.value[y]
+        if self.others[x] or self.others[y]:
+            #moving x breaks the permutation until y moves too
+            delta = self.delta(x, b)
+            self.move(x, b)
+            delta += self.delta(y, a)
+            self.move(x, a)
+            return delta
+        ys = dict(self.alldiffs[y])
+        delta = 0
+        for c, ox in self.alldiffs[x]:
+            #change of the number of variables holding each key of c
+            change = {a + ox: -1}
+            change[b + ox] = change.get(b + ox, 0) + 1
+            oy = ys.pop(c, None)
+            if oy is not None:
+                change[b + oy] = change.get(b + oy, 0) - 1
+                change[a + oy] = change.get(a + oy, 0) + 1
+            delta += self.key_delta(self.holders[c], change)
+        for c, oy in ys.items():
+            delta += self.key_delta(self.holders[c], {b + oy: -1, a + oy: 1})
+        return delta
+
+    def key_delta(self, holders, change):
+        '''
+        Internal routine. Change of total if the number of variables holding 
+        each key of an all-different constraint changed by change[key].
+        '''
+        delta = 0
+        for key, d in change.items():
+            if d:
+                n = len(holders.get(key, ()))
+                #n variables holding a key are n * (n - 1) conflicts
+                delta += d * (2 * n + d - 1)
+        return delta
+
+    def delta(self, var, val):
+        '''Internal routine. Change of total if var moved to val'''
+        current = self.value[var]
+        delta = 0
+        for c, o in self.alldiffs[var]:
+            holders = self.holders[c]
+            #the variables var would leave and join, counted on both sides
+            delta += 2 * (len(holders.get(val + o, ())) - len(holders[current + o]) + 1)
+        if self.others[var]:
+            self.value[var] = val
+            for c in self.others[var]:
+                now = not c.check([self.value[v] for v in c.scope])
+                if now != (c in self.violated):
+                    delta += len(c.scope) if now else -len(c.scope)
+            self.value[var] = current
+        return delta
+
+    def move(self, var, val):
+        '''Internal routine. Give var the value val and update the conflicts'''
+        current = self.value[var]
+        conflicts = self.conflicts
+        touched = [var]
+        for c, o in self.alldiffs[var]:
+            holders = self.holders[c]
+            left = holders[current + o]
+            left.discard(var)
+            for other in left:
+                conflicts[other] -= 1
+                touched.append(other)
+            conflicts[var] -= len(left)
+            joined = holders.setdefault(val + o, set())
+            for other in joined:
+                conflicts[other] += 1
+                touched.append(other)
+            conflicts[var] += len(joined)
+            self.total += 2 * (len(joined) - len(left))
+            joined.add(var)
+        self.value[var] = val
+        for c in self.others[var]:
+            scope = c.scope
+            now = not c.check([self.value[v] for v in scope])
+            if now != (c in self.violated):
+                step = 1 if now else -1
+                if now:
+                    self.violated.add(c)
+                else:
+                    self.violated.discard(c)
+                for v in scope:
+                    conflicts[v] += step
+                    touched.append(v)
+                self.total += step * len(scope)
+        for v in touched:
+            if conflicts[v]:
+                self.conflicted.add(v)
+            else:
+                self.conflicted.discard(v)
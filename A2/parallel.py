@@ -0,0 +1,239 @@
+'''
+Parallel backtracking search over several processes.
+
+ParallelBT has the same entry point as BT:
+
+    solver = ParallelBT(csp, processes=4)
+    solver.bt_search(prop_GAC, ord_mrv)        #first solution, assigned to csp
+    solver.count_solutions(prop_GAC, ord_mrv)  #number of solutions
+
+The search tree is split into independent subproblems: the parent process
+expands the first levels of the tree, choosing variables with var_ord and
+propagating after each decision as bt_search does, until there are about
+split_factor open nodes per process. Each open node is a list of decisions.
+The nodes go to a pool of worker processes through one shared queue, in search
+order, and an idle worker takes the next node, so the workers stay busy even
+when subtrees differ a lot in size. Every worker solves with its own copy of
+the CSP (inherited when the pool forks, or pickled otherwise). It fixes the
+decisions of a node with unary constraints and runs BT on it.
+
+In first solution mode the first solution found is returned and the remaining
+workers are terminated. In counting mode the counts of all the nodes are added.
+'''
+
+import multiprocessing
+import time
+
+from cspbase import *
+
+#state of a worker process, set by init_worker
+_worker = dict()
+
+def init_worker(csp, propagator, var_ord, val_ord):
+    _worker['csp'] = csp
+    _worker['search'] = (propagator, var_ord, val_ord)
+
+def solve_node(task):
+    '''
+    Worker routine. Solve the subproblem given by a list of (variable index,
+    value) decisions. Return (solution values or count, decisions, prunings).
+    '''
+    decisions, count = task
+    csp = _worker['csp']
+    vars = csp.get_all_vars()
+    fixed = []
+    for i, val in decisions:
+        c = Constraint("Split-{}".format(vars[i].name), [vars[i]])
+        c.add_satisfying_tuples([[val]])
+        csp.add_constraint(c)
+        fixed.append(c)
+    try:
+        solver = BT(csp)
+        solver.quiet()
+        if count:
+            result = solver.count_solutions(*_worker['search'])
+        else:
+            solver.bt_search(*_worker['search'])
+            result = None
+            if all(var.is_assigned() for var in vars):
+                result = [var.get_assigned_value() for var in vars]
+            solver.restore_all_variable_domains()
+    finally:
+        for c in fixed:
+            csp.remove_constraint(c)
+    return result, solver.nDecisions, solver.nPrunings
+
+class ParallelBT:
+    '''
+    Splits the search of bt_search over processes. nDecisions and nPrunings
+    add up the work of the parent process and of the workers that reported
+    back (in first solution mode, the work of terminated workers is lost).
+    '''
+
+    def __init__(self, csp, processes=None, split_factor=8):
+        '''
+        csp is the CSP object to solve. processes defaults to the number of
+        CPUs, and the tree is split into about split_factor nodes per process.
+        '''
+        self.csp          = csp
+        self.processes    = processes or multiprocessing.cpu_count()
+        self.split_factor = split_factor
+        self.nDecisions   = 0
+        self.nPrunings    = 0
+        self.nNodes       = 0 #number of subproblems the tree was split into
+        self.LOG_LEVEL    = 1
+        self.runtime      = 0
+
+    def quiet(self):
+        self.LOG_LEVEL = 0
+
+    def print_stats(self):
+        print("Search made {} variable assignments and pruned {} variable values in {} subproblems".format(
+            self.nDecisions, self.nPrunings, self.nNodes))
+
+    def bt_search(self, propagator, var_ord=None, val_ord=None):
+        '''
+        Find a solution as BT.bt_search does, leaving it assigned to the
+        variables of csp. Return a SearchStats whose status is True if one
+        was found, False if there is none, with the decisions and prunings
+        of the parent process and of the workers that reported back.
+        '''
+        stime = time.perf_counter()
+        solution = None
+        for result in self.run(propagator, var_ord, val_ord, False):
+            if result is not None:
+                solution = result
+                break
+        self.runtime = time.perf_counter() - stime
+        if solution is not None:
+            for var, val in zip(self.csp.get_all_vars(), solution):
+                var.assign(val)
+        if self.LOG_LEVEL > 0:
+            if solution is None:
+                print("CSP{} unsolved. Has no solutions".format(self.csp.name))
+            else:
+                print("CSP {} solved. Time used = {}".format(self.csp.name, self.runtime))
+                self.csp.print_soln()
+            print("bt_search finished")
+            self.print_stats()
+        stats = SearchStats()
+        stats.status = solution is not None
+        stats.decisions = self.nDecisions
+        stats.prunings = self.nPrunings
+        stats.solutions = int(stats.status)
+        stats.time = self.runtime
+        return stats
+
+    def count_solutions(self, propagator, var_ord=None, val_ord=None):
+        '''Return the number of solutions, as BT.count_solutions does'''
+        stime = time.perf_counter()
+        count = sum(self.run(propagator, var_ord, val_ord, True))
+        self.runtime = time.perf_counter() - stime
+        return count
+
+    def run(self, propagator, var_ord, val_ord, count):
+        '''
+        Internal routine. Split the tree and generate the result of each
+        subproblem as the workers finish them. Stopping the generator
+        terminates the workers.
+        '''
+        self.nDecisions = self.nPrunings = 0
+        nodes = self.split(propagator, var_ord, val_ord)
+        self.nNodes = len(nodes)
+        if not nodes:
+            return
+        context = multiprocessing.get_context('fork') \
+            if 'fork' in multiprocessing.get_all_start_methods() else multiprocessing
+        with context.Pool(min(self.processes, len(nodes)), init_worker,
+                          (self.csp, propagator, var_ord, val_ord)) as pool:
+            for result, decisions, prunings in pool.imap_unordered(
+                    solve_node, [(node, count) for node in nodes]):
+                self.nDecisions += decisions
+                self.nPrunings += prunings
+                yield result
+
+    def split(self, propagator, var_ord, val_ord):
+        '''
+        Return the open nodes, as lists of (variable index, value) decisions,
+        of the shallowest complete expansion of the tree with at least
+        split_factor nodes per process (or the deepest one possible).
+        '''
+        target = self.processes * self.split_factor
+        index = dict((var, i) for i, var in enumerate(self.csp.get_all_vars()))
+        solver = BT(self.csp)
+        solver.quiet()
+        solver.restore_all_variable_domains()
+        solver.attach_trail()
+        try:
+            status, _ = propagator(self.csp)
+            self.nPrunings += len(solver.trail)
+            if status == False:
+                return []
+            nodes = [[]]
+            depth = 0
+            while len(nodes) < target and depth < len(index):
+                depth += 1
+                deeper = []
+                self.expand(solver, propagator, var_ord, val_ord, index, [], depth, deeper)
+                nodes = deeper
+                if all(len(node) < depth for node in nodes):
+                    #every node left is a solution, nothing to expand
+                    break
+            return nodes
+        finally:
+            #stop notifying an incremental ordering, as BT.search does, so
+            #it is neither forked into the workers nor left on the variables
+            for var in self.csp.vars:
+                var.order = None
+            solver.detach_trail()
+
+    def expand(self, solver, propagator, var_ord, val_ord, index, decisions, depth, nodes):
+        '''
+        Internal routine. Depth first expansion of the tree to depth
+        decisions, appending the nodes that survive propagation to nodes. A
+        node where every variable is assigned is kept even if shallower.
+        '''
+        unassigned = self.csp.get_all_unasgn_vars()
+        if depth == 0 or not unassigned:
+            nodes.append(list(decisions))
+            return
+        if var_ord:
+            var = var_ord(self.csp)
+        else:
+            var = unassigned[0]
+        if val_ord:
+            value_order = val_ord(self.csp, var)
+        else:
+            value_order = var.cur_domain()
+        for val in value_order:
+            var.assign(val)
+            self.nDecisions += 1
+            mark = solver.trail.checkpoint()
+            status, _ = propagator(self.csp, var)
+            self.nPrunings += len(solver.trail) - mark
+            if status:
+                decisions.append((index[var], val))
+                self.expand(solver, propagator, var_ord, val_ord, index, decisions,
+                            depth - 1, nodes)
+                decisions.pop()
+            solver.trail.backtrack()
+            var.unassign()
+
+if __name__ == "__main__":
+    import kenken_csp
+    from propagators import *
+    from heuristics import *
+    from tests import BOARDS, nQueens
+
+    for processes in (1, 2, 4):
+        csp = nQueens(10)
+        solver = ParallelBT(csp, processes)
+        count = solver.count_solutions(prop_FC, ord_mrv)
+        print("10-Queens: {} solutions with {} processes in {:.3f}s".format(
+            count, processes, solver.runtime))
+    for processes in (1, 2, 4):
+        csp, _ = kenken_csp.kenken_csp_model([list(cage) for cage in BOARDS[5]])
+        solver = ParallelBT(csp, processes)
+        solver.quiet()
+        solver.bt_search(prop_FC, ord_mrv)
+        print("Board 6: solved with {} processes in {:.3f}s".format(processes, solver.runtime))
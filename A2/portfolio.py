@@ -0,0 +1,144 @@
+'''
+Portfolio solver: race several search configurations on the same board in a
+process pool and keep the first answer.
+
+Which pairing of propagator and heuristics is fastest depends on the board, so
+solve_portfolio() starts one worker per (propagator, var_ord, val_ord)
+configuration. Every worker builds its own copy of the CSP with the model
+builder (e.g. kenken_csp_model) and runs bt_search on it. The first worker to
+finish, with a solution or with a proof that there is none, wins and the
+other workers are terminated. Workers that fail with an error are ignored
+unless all of them do.
+
+    result = solve_portfolio(kenken_csp_model, board, log_file="wins.jsonl")
+    result['solution'][0][0]   #value of the top left cell
+    result['config']           #e.g. ('prop_GAC', 'ord_mrv', 'val_lcv_counts')
+
+With a log_file, each win is appended to it as one JSON line (board,
+configuration, decisions, prunings and time), and tally_wins(log_file) counts
+the wins of each configuration, to tune the defaults over time.
+
+The configurations and the model builder are sent to the workers by pickling,
+so they must be module level functions or picklable objects (such as
+DomWdegOrder()).
+'''
+
+import collections
+import json
+import multiprocessing
+import time
+
+from cspbase import *
+from propagators import *
+from heuristics import *
+
+PORTFOLIO = [(prop_FC, ord_mrv, None),
+             (prop_GAC, ord_mrv, None),
+             (prop_GAC, ord_dh, None),
+             (prop_CT, DomWdegOrder(), val_lcv_counts)]
+
+def config_name(config):
+    '''(propagator, var_ord, val_ord) as a tuple of names, for records'''
+    names = []
+    for f in config:
+        if f is None:
+            names.append(None)
+        elif hasattr(f, '__name__'):
+            names.append(f.__name__)
+        else:
+            names.append(type(f).__name__)
+    return tuple(names)
+
+def run_config(task):
+    '''
+    Worker of solve_portfolio. Build the CSP for board with model and solve it
+    with one configuration. Return (index of the configuration, solution grid
+    or None if there is no solution, decisions, prunings, solve time).
+    '''
+    model, board, index, (prop, var_ord, val_ord) = task
+    csp, var_array = model([list(cage) for cage in board])
+    solver = BT(csp)
+    solver.quiet()
+    stime = time.perf_counter()
+    solver.bt_search(prop, var_ord, val_ord)
+    etime = time.perf_counter()
+    solution = None
+    if all(var.is_assigned() for var in csp.get_all_vars()):
+        solution = [[var.get_assigned_value() for var in row] for row in var_array]
+    return index, solution, solver.nDecisions, solver.nPrunings, etime - stime
+
+def solve_portfolio(model, board, configs=PORTFOLIO, processes=None, timeout=None,
+                    log_file=None):
+    '''
+    Race configs on board, each in its own process, and return the answer of
+    the first to finish as a dict with keys
+        solution  - list of lists of values of the model's var_array, or None
+                    if the board has no solution
+        config    - names of the winning (propagator, var_ord, val_ord)
+        index     - its position in configs
+        decisions, prunings, time - its search statistics
+    Return None if no configuration finished within timeout seconds. The
+    other workers are terminated as soon as there is a winner. A configuration
+    that raises an error drops out of the race; the error is raised only if
+    every configuration fails.
+
+    processes defaults to one per configuration, so that they all run at
+    once. If log_file is given the win is appended to it (see record_win).
+    '''
+    if processes is None:
+        processes = len(configs)
+    tasks = [(model, board, i, config) for i, config in enumerate(configs)]
+    with multiprocessing.Pool(processes) as pool:
+        results = pool.imap_unordered(run_config, tasks)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        errors = []
+        while True:
+            remaining = None if deadline is None else max(0, deadline - time.monotonic())
+            try:
+                index, solution, decisions, prunings, solve_time = results.next(remaining)
+                break
+            except multiprocessing.TimeoutError:
+                return None
+            except Exception as e:
+                #a failing configuration drops out of the race, the others
+                #may still solve the board
+                errors.append(e)
+                if len(errors) == len(tasks):
+                    raise errors[0]
+        #leaving the with block terminates the workers still searching
+    result = {'solution': solution,
+              'config': config_name(configs[index]),
+              'index': index,
+              'decisions': decisions,
+              'prunings': prunings,
+              'time': solve_time}
+    if log_file is not None:
+        record_win(log_file, board, result)
+    return result
+
+def record_win(log_file, board, result):
+    '''Append the winning configuration of board to log_file as a JSON line'''
+    record = {'board': board,
+              'config': result['config'],
+              'decisions': result['decisions'],
+              'prunings': result['prunings'],
+              'time': result['time']}
+    with open(log_file, 'a') as f:
+        f.write(json.dumps(record) + '\n')
+
+def tally_wins(log_file):
+    '''Return a Counter of the configurations recorded in log_file'''
+    wins = collections.Counter()
+    with open(log_file) as f:
+        for line in f:
+            if line.strip():
+                wins[tuple(json.loads(line)['config'])] += 1
+    return wins
+
+if __name__ == "__main__":
+    import kenken_csp
+    from tests import BOARDS
+    for n, board in enumerate(BOARDS):
+        result = solve_portfolio(kenken_csp.kenken_csp_model, board)
+        print("Board {}: won by {} in {:.4f}s ({} decisions)".format(
+            n + 1, result['config'], result['time'], result['decisions']))
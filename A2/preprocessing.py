@@ -0,0 +1,176 @@
+'''
+Preprocessing of a CSP before bt_search, with stronger consistencies than the
+propagators enforce during search.
+
+    result = preprocess(csp, time_limit=5, rpc=True)
+    result['removed']        #values removed from the domains
+    BT(csp).bt_search(prop_GAC, ord_mrv)
+
+1. Singleton arc consistency (SAC)
+    - Every value a of every variable x is tried: x is assigned a and
+      propagator (prop_GAC by default) runs from there. If that fails, no
+      solution has x = a and a is pruned, and propagator runs again at the
+      root to pass the pruning on. The values are tried again until a whole
+      round prunes nothing.
+
+2. Restricted path consistency (RPC), if rpc is set
+    - Only looks at binary constraints. A value a of x is pruned if it has no
+      support on some constraint of x, or if its only support b on a
+      constraint with y can not be extended to a third variable z
+      constrained with both x and y (no value of z is compatible with x = a
+      and y = b). It is cheaper than SAC and runs first.
+
+The prunings are made at the root, on a trail of their own, and are then
+committed to the CSP as one unary table constraint per variable that lost
+values (named SAC-<variable>), allowing only the values left. So they survive
+bt_search restoring all the domains when it starts, and a propagator applies
+them again with its first call. The constraints are returned, so they can be
+taken out of the CSP with remove_constraint.
+
+The preprocessing stops when time_limit seconds have passed, keeping what it
+pruned until then (every pruning is sound on its own).
+'''
+
+import collections
+import time
+
+from cspbase import *
+from propagators import *
+
+def preprocess(csp, propagator=prop_GAC, time_limit=None, rpc=False):
+    '''
+    Enforce RPC (if rpc) and SAC on csp at the root and commit the prunings
+    as unary constraints. Any assignment of the variables is undone. Return
+    a dict with keys
+        consistent  - False if the csp was found to have no solution (a
+                      variable is then left with no value)
+        complete    - False if time_limit ran out before the fixpoint
+        removed     - number of values removed from the domains of the csp
+        propagator_removed - how many of those propagator removes on its own
+                      at the root
+        constraints - the unary constraints added to the csp
+        time        - seconds used
+    '''
+    stime = time.perf_counter()
+    deadline = None if time_limit is None else stime + time_limit
+    solver = BT(csp)
+    solver.restore_all_variable_domains()
+    solver.attach_trail()
+    try:
+        status, _ = propagator(csp)
+        propagator_removed = len(solver.trail)
+        complete = True
+        if status and rpc:
+            status, complete = rpc_pass(csp, propagator, deadline)
+        if status and complete:
+            status, complete = sac_pass(csp, propagator, deadline)
+        removed = len(solver.trail)
+        constraints = []
+        for var in csp.get_all_vars():
+            if var.cur_domain_size() < var.domain_size():
+                c = Constraint("SAC-{}".format(var.name), [var])
+                c.add_satisfying_tuples([[val] for val in var.cur_domain()])
+                constraints.append(c)
+    finally:
+        solver.detach_trail()
+    for c in constraints:
+        csp.add_constraint(c)
+    return {'consistent': bool(status),
+            'complete': complete,
+            'removed': removed,
+            'propagator_removed': propagator_removed,
+            'constraints': constraints,
+            'time': time.perf_counter() - stime}
+
+def out_of_time(deadline):
+    return deadline is not None and time.perf_counter() > deadline
+
+def prune_at_root(csp, propagator, var, val):
+    '''
+    Internal routine. Prune val from var and propagate it. Return False if
+    the csp has no solution left.
+    '''
+    trail = var.trail
+    if trail is not None:
+        #not the doing of the constraint blamed last
+        trail.blamed = None
+    var.prune_value(val)
+    if var.cur_domain_size() == 0:
+        return False
+    status, _ = propagator(csp, var)
+    return status
+
+def sac_pass(csp, propagator, deadline):
+    '''
+    Internal routine. Prune the values whose assignment propagator refutes
+    until none is left, with the variables attached to a trail. Return
+    (False if the csp has no solution, False if the deadline passed).
+    '''
+    changed = True
+    while changed:
+        changed = False
+        for var in csp.get_all_vars():
+            for val in var.cur_domain():
+                if out_of_time(deadline):
+                    return True, False
+                if not var.in_cur_domain(val):
+                    #pruned by the propagation of an earlier value
+                    continue
+                var.trail.checkpoint()
+                var.assign(val)
+                status, _ = propagator(csp, var)
+                var.unassign()
+                var.trail.backtrack()
+                if not status:
+                    changed = True
+                    if not prune_at_root(csp, propagator, var, val):
+                        return False, True
+    return True, True
+
+def rpc_pass(csp, propagator, deadline):
+    '''
+    Internal routine. Prune the values that are not restricted path
+    consistent on the binary constraints until none is left. Return
+    (False if the csp has no solution, False if the deadline passed).
+    '''
+    #(x, y) -> the binary constraints between x and y
+    between = collections.defaultdict(list)
+    neighbours = collections.defaultdict(set)
+    for c in csp.get_all_cons():
+        scope = c.get_scope()
+        if len(scope) == 2 and scope[0] is not scope[1]:
+            x, y = scope
+            between[x, y].append(c)
+            between[y, x].append(c)
+            neighbours[x].add(y)
+            neighbours[y].add(x)
+
+    def compatible(x, a, y, b):
+        return all(c.check([a, b] if c.get_scope()[0] is x else [b, a])
+                   for c in between[x, y])
+
+    def consistent(x, a):
+        for y in neighbours[x]:
+            supports = [b for b in y.cur_domain() if compatible(x, a, y, b)]
+            if not supports:
+                return False
+            if len(supports) == 1:
+                b = supports[0]
+                for z in neighbours[x] & neighbours[y]:
+                    if not any(compatible(x, a, z, d) and compatible(y, b, z, d)
+                               for d in z.cur_domain()):
+                        return False
+        return True
+
+    changed = True
+    while changed:
+        changed = False
+        for var in csp.get_all_vars():
+            for val in var.cur_domain():
+                if out_of_time(deadline):
+                    return True, False
+                if var.in_cur_domain(val) and not consistent(var, val):
+                    changed = True
+                    if not prune_at_root(csp, propagator, var, val):
+                        return False, True
+    return True, True
@@ -25,12 +25,20 @@ The propagator returns True/False and a list of (Variable, Value) pairs, like so
 Propagators will return False if they detect a dead-end. In this case, bt_search 
 will backtrack. Propagators will return true if we can continue.
 
-The list of variable value pairs are all of the values that the propagator 
-pruned (using the variable's prune_value method). bt_search NEEDS to know this 
-in order to correctly restore these values when it undoes a variable assignment.
-
-Propagators SHOULD NOT prune a value that has already been pruned! Nor should 
-they prune a value twice.
+Propagators prune values with the variable's prune_value method. During 
+bt_search every variable records its prunings on the solver's Trail, which is 
+what bt_search uses to restore them when it undoes a variable assignment. So 
+propagators do not have to collect, deduplicate or return what they pruned; 
+the propagators below return an empty list, which bt_search ignores. Pruning a 
+value that is already pruned is a no-op.
+
+When a propagator detects a dead-end it calls record_conflict() on the 
+constraint responsible (the one that failed its check or wiped out a domain), 
+which feeds the conflict weights of the dom/wdeg variable ordering. Before it 
+prunes with a constraint it calls the constraint's blame(), so that when 
+bt_search backjumps the prunings are explained by the decisions the 
+constraint's scope depends on, and record_conflict reports the decisions 
+responsible for the dead-end.
 
 ---
 
@@ -44,7 +52,7 @@ we do nothing...return true, []
 variable) we look for unary constraints of the csp (constraints whose scope 
 contains only one variable) and we forward_check these constraints.
 
-3. For GAC we initialize the GAC queue with all constaints of the csp.
+3. For GAC (and CT) we initialize the GAC queue with all constaints of the csp.
 
 When a propagator is called with newly_instantiated_variable = a variable V
 
@@ -54,10 +62,17 @@ get_cons_with_var) that are fully assigned.
 2. For forward checking we forward check all constraints with V that have one 
 unassigned variable left
 
-3. For GAC we initialize the GAC queue with all constraints containing V.
+3. For GAC (and CT) we initialize the GAC queue with all constraints 
+containing V.
+
+prop_CT enforces the same consistency as prop_GAC, but filters table 
+constraints through their CompactTable (see cspbase) instead of checking each 
+value with has_support.
 
 '''
 
+from collections import deque
+
 def prop_BT(csp, newVar=None):
     '''
     Do plain backtracking propagation. That is, do no propagation at all. Just 
@@ -72,13 +87,15 @@ def prop_BT(csp, newVar=None):
             for var in vars:
                 vals.append(var.get_assigned_value())
             if not c.check(vals):
+                c.record_conflict()
                 return False, []
     return True, []
 
 def prop_FC(csp, newVar=None):
-    # TODO! IMPLEMENT THIS!
-    #pass
-    values_pruned = [] #list of pruned values, so we don't need to prune a value twice
+    '''
+    Do forward checking. That is, check constraints with only one unassigned 
+    variable left and prune the values of that variable without support.
+    '''
     constraints = []
     if(newVar == None):
         #no specific variable specifies, get all contraints
@@ -87,21 +104,19 @@ def prop_FC(csp, newVar=None):
         #get constraints associated with pass in variable
         constraints = csp.get_cons_with_var(newVar)
     for c in constraints:
-        if c.get_n_unasgn() == 1:
-            #get the constraint who only has 1 unassigned variable
-            var = c.get_unasgn_vars()[0]
+        var = c.get_last_unasgn_var()
+        if var is not None:
+            #the constraint only has 1 unassigned variable, var
+            c.blame()
             for d in var.cur_domain():
                 if not c.has_support(var, d):
-                    #setup for prunning since no support
-                    prune_tuple = (var, d)
-                    if(prune_tuple not in values_pruned):
-                        #remember the pruned value and prune it from var's domain
-                        values_pruned.append(prune_tuple)
-                        var.prune_value(d)         
+                    #no support, prune it from var's domain
+                    var.prune_value(d)
             if var.cur_domain_size() == 0:
                 #DWO, return immediately
-                return False, values_pruned
-    return True, values_pruned
+                c.record_conflict()
+                return False, []
+    return True, []
 
 def prop_GAC(csp, newVar=None):
     '''
@@ -109,10 +124,75 @@ def prop_GAC(csp, newVar=None):
     all constraints. Otherwise we do GAC enforce with constraints containing 
     newVar on GAC Queue.
     '''
-    # TODO! IMPLEMENT THIS!
-    #pass
-    values_pruned = [] #helps maintain a list of pruned values so we know whether a values has been removed already from a variable's domain
-    GACQueue = []
+    return GAC_enforce(csp, newVar, lambda c: c)
+
+def prop_CT(csp, newVar=None):
+    '''
+    Do GAC propagation with compact-table filtering. Table constraints keep 
+    their live tuples as a bitset that is updated incrementally as domains 
+    shrink and restored on backtrack, and all of their supports are derived 
+    from it in one pass. Other constraints use their own prune_unsupported. 
+    Prunes the same values as prop_GAC.
+    '''
+    return GAC_enforce(csp, newVar, CT_filter)
+
+def CT_filter(c):
+    return c.compact_table() or c
+
+class PropagationQueue:
+    '''
+    Scheduler of the constraints GAC_enforce still has to revise. 
+
+    A constraint is pushed with the variable whose domain change triggered 
+    it, and the queue accumulates these events until the constraint is 
+    popped, so it is scheduled at most once (O(1) check) and its filter knows 
+    which variables changed (None meaning all of them may have). Constraints 
+    are popped in order of their queue_priority(), cheap binary constraints 
+    first, and in FIFO order within a priority.
+    '''
+
+    N_PRIORITIES = 3
+
+    def __init__(self):
+        self.buckets = [deque() for _ in range(self.N_PRIORITIES)]
+        self.events = dict() #scheduled constraint -> set of changed variables or None
+
+    def push(self, c, var=None):
+        '''Schedule c because var changed (var None: anything may have)'''
+        if c in self.events:
+            changed = self.events[c]
+            if changed is not None:
+                if var is None:
+                    self.events[c] = None
+                else:
+                    changed.add(var)
+        else:
+            self.events[c] = None if var is None else set([var])
+            self.buckets[c.queue_priority()].append(c)
+
+    def pop(self):
+        '''Return the next constraint to revise and its changed variables'''
+        for bucket in self.buckets:
+            if bucket:
+                c = bucket.popleft()
+                return c, self.events.pop(c)
+
+    def clear(self):
+        for bucket in self.buckets:
+            bucket.clear()
+        self.events.clear()
+
+    def __len__(self):
+        return len(self.events)
+
+def GAC_enforce(csp, newVar, filter_of):
+    '''
+    GAC queue processing shared by prop_GAC and prop_CT. filter_of(c) returns 
+    the object whose prune_unsupported(changed_vars) prunes the unsupported 
+    values of constraint c (see Constraint.prune_unsupported) and whose 
+    idempotent attribute tells if c needs revising again after it prunes.
+    '''
+    GACQueue = PropagationQueue()
     if(newVar == None):
         constraints = csp.get_all_cons()
         #get all constraints if no variable specified
@@ -120,28 +200,30 @@ def prop_GAC(csp, newVar=None):
         constraints = csp.get_cons_with_var(newVar)
         #getting constraints associated with variable newVar
     for c in constraints:
-        #pushing all constraints into the end of GACQueue, a pseudo queue
-        GACQueue.append(c)
+        #the assignment of newVar is the domain change that triggers them
+        GACQueue.push(c, newVar)
     while len(GACQueue) != 0:
-        c = GACQueue.pop()
-        #get the last item in GACQueue (last item i.e. most recent item so the list behaves like a queue)
-        for var in c.get_scope():
-            for d in var.cur_domain():
-                if not c.has_support(var, d):
-                    #does not have support, so d must be pruned from var's domain
-                    prune_tuple = (var, d)
-                    if(prune_tuple not in values_pruned):
-                        # if not pruned, add to prune list and prune it from var's domain
-                        values_pruned.append(prune_tuple)
-                        var.prune_value(d)
-                    if var.cur_domain_size() == 0:
-                        #no remaining value left for variable, DWO return immediately
-                        GACQueue.clear()
-                        return False, values_pruned
-                    else:
-                        for c_prime in csp.get_cons_with_var(var):
-                            #since domain of var has been modified, we need to check contraints with var in its scope again
-                            if (c_prime not in GACQueue):
-                                #adding constraints with var in scope that isn't already in GACQueue
-                                GACQueue.append(c_prime)
-    return True, values_pruned
\ No newline at end of file
+        c, changed_vars = GACQueue.pop()
+        if c.get_n_unasgn() == 0 and not c.check([var.get_assigned_value() for var in c.get_scope()]):
+            #every variable is assigned, so the filter can not wipe out a 
+            #domain (an assigned variable keeps its value), check it instead
+            GACQueue.clear()
+            c.record_conflict()
+            return False, []
+        f = filter_of(c)
+        c.blame()
+        #prune the values without support, table constraints check each value 
+        #with has_support while e.g. all-different runs its matching filter
+        for var in f.prune_unsupported(changed_vars):
+            if var.cur_domain_size() == 0:
+                #no remaining value left for variable, DWO return immediately
+                GACQueue.clear()
+                c.record_conflict()
+                return False, []
+            for c_prime in csp.get_cons_with_var(var):
+                #since domain of var has been modified, we need to check 
+                #contraints with var in its scope again, except c itself if 
+                #its filter already reached its fixpoint
+                if c_prime is not c or not f.idempotent:
+                    GACQueue.push(c_prime, var)
+    return True, []
@@ -0,0 +1,397 @@
+'''
+Binary files of built CSPs, so that a model is built once and loaded in
+next to no time for every later run.
+
+    csp, var_array = kenken_csp_model(board)
+    save_csp(csp, 'board.csp', var_array)
+    ...
+    csp, var_array = load_csp('board.csp')
+    BT(csp).bt_search(prop_GAC, ord_mrv)
+
+load_csp returns the same pair as the models (var_array is None if none
+was saved), with the variables in the same order, the same constraints with
+the same names and scopes, and the same tables, so the search makes the same
+decisions. Only the permanent domains are saved: the current domains,
+assignments and conflict weights start fresh, as bt_search would make them.
+
+1. File format
+    - All numbers are little-endian. The file starts with a header (magic,
+      version, number of sections) and a directory of (name, offset, count)
+      entries, and the sections are 8-byte aligned arrays:
+        names, nameoff  - the CSP name, then the variable names, then the
+                          constraint names, as UTF-8 and their offsets
+        values          - the distinct domain values (64-bit integers)
+        domains, domoff - the domain of each variable, as indices in values
+        relinfo         - for each distinct table (arity, number of tuples,
+                          number of runs, offset in tuples, offset in runs)
+        tuples          - the tuples of each table, as a matrix of indices
+                          in values, one row per tuple
+        order, runs     - the support offsets: for each position of a table
+                          the numbers of its tuples grouped by value, and
+                          (position, value, end) runs marking each group
+        cons, scopes    - for each constraint (kind, offset in scopes, scope
+                          size, relation or offset in params)
+        params          - the numbers of the constraints without a table:
+                          offsets, totals, nogood values, lex entries
+        grid            - var_array if saved: number of rows, then the size
+                          and the variable indices of each row
+    - A table shared by several constraints (see Relation.intern) is saved
+      once, and the constraints refer to it by number.
+    - Domain and table values must be integers. FunctionConstraints can not
+      be saved, since their predicate is code.
+
+2. Loading
+    - The file is memory-mapped and the variables and constraints are made
+      at once (they are small), but a table is only read when it is first
+      used: StoredRelation is a Relation whose tuples, satisfying dict and
+      supports are built from the mapped arrays on first access, the
+      supports as slices of the saved order instead of by indexing every
+      tuple again. Tables the search never looks at are never read.
+    - The file stays mapped (and, on Windows, can not be deleted) while
+      the loaded CSP may still read tables from it. The map is kept as
+      csp.mapping, and close_csp reads the tables left and unmaps it.
+'''
+
+import array
+import mmap
+import os
+import struct
+import sys
+import functools
+
+from cspbase import *
+
+MAGIC = b'CSPB'
+VERSION = 1
+header = struct.Struct('<4sII')
+section = struct.Struct('<8sQQ')
+
+#typecode of each section
+SECTIONS = (('names', 'B'), ('nameoff', 'Q'), ('values', 'q'), ('domains', 'I'),
+            ('domoff', 'Q'), ('relinfo', 'Q'), ('tuples', 'I'), ('order', 'I'),
+            ('runs', 'I'), ('cons', 'Q'), ('scopes', 'I'), ('params', 'q'),
+            ('grid', 'Q'))
+
+#constraint kinds, the number of each class in the file
+TABLE, ALLDIFF, SUM, PRODUCT, NOGOOD, LEXLEQ = range(6)
+KINDS = (Constraint, AllDiffConstraint, SumConstraint, ProductConstraint,
+         NogoodConstraint, LexLeqConstraint)
+
+class StoredRelation(Relation):
+    '''
+    Relation of a table saved in a CSP file, read from the mapped arrays of
+    the file when its tuples, sat or supports are first used.
+    '''
+
+    def __init__(self, values, arity, size, tuples, order, runs):
+        '''
+        Internal, made by load_csp. values is the value list of the file,
+        tuples the size x arity matrix of value indices, order and runs the
+        support offsets of the table.
+        '''
+        self.values = values
+        self.arity = arity
+        self.size = size
+        self.indices = tuples
+        self.order = order
+        self.runs = runs
+        self.cts = dict()
+
+    @functools.cached_property
+    def tuples(self):
+        if self.arity == 0:
+            return ((),) * self.size
+        vals = map(self.values.__getitem__, self.indices)
+        return tuple(zip(*[vals] * self.arity))
+
+    @functools.cached_property
+    def sat(self):
+        return dict.fromkeys(self.tuples, True)
+
+    @functools.cached_property
+    def supports(self):
+        if not self.size:
+            return []
+        tuples = self.tuples
+        supports = [dict() for _ in range(self.arity)]
+        start = 0
+        runs = self.runs
+        for r in range(0, len(runs), 3):
+            pos, val, end = runs[r], runs[r + 1], runs[r + 2]
+            base = pos * self.size
+            supports[pos][self.values[val]] = tuple(
+                tuples[t] for t in self.order[base + start:base + end])
+            start = end if r + 3 < len(runs) and runs[r + 3] == pos else 0
+        return supports
+
+    def __len__(self):
+        return self.size
+
+def save_csp(csp, file, var_array=None):
+    '''
+    Save csp, and var_array (a list of lists of its variables) if given, to
+    the binary file. Return False, saving nothing, if csp has a constraint
+    or a value that can not be saved.
+    '''
+    data = dict((name, []) for name, _ in SECTIONS)
+    names = [csp.name]
+    var_index = dict((var, i) for i, var in enumerate(csp.vars))
+    value_index = dict()
+
+    def index(val):
+        if not isinstance(val, int):
+            print("ERROR: can not save value", repr(val), "of CSP", csp.name)
+            return None
+        return value_index.setdefault(val, len(value_index))
+
+    data['domoff'].append(0)
+    for var in csp.vars:
+        names.append(var.name)
+        for val in var.dom:
+            i = index(val)
+            if i is None:
+                return False
+            data['domains'].append(i)
+        data['domoff'].append(len(data['domains']))
+
+    rel_index = dict()
+    for c in csp.cons:
+        names.append(c.name)
+        if type(c) not in KINDS:
+            print("ERROR: can not save constraint", c, "of CSP", csp.name)
+            return False
+        kind = KINDS.index(type(c))
+        scope = data['scopes']
+        entry = [kind, len(scope), len(c.scope)]
+        scope.extend(var_index[var] for var in c.scope)
+        params = data['params']
+        if kind == TABLE:
+            relation = c.relation
+            if relation not in rel_index:
+                rel_index[relation] = len(rel_index)
+                if not save_relation(relation, len(c.scope), data, index):
+                    return False
+            entry.append(rel_index[relation])
+        else:
+            entry.append(len(params))
+        if kind == ALLDIFF:
+            params.extend(c.offsets)
+        elif kind in (SUM, PRODUCT):
+            params.extend((c.total, int(c.domain_consistency)))
+        elif kind == NOGOOD:
+            params.extend(c.values)
+        elif kind == LEXLEQ:
+            params.extend((len(c.left), len(c.right)))
+            for var, mapping in c.left + c.right:
+                params.append(var_index[var])
+                if mapping is None:
+                    params.append(-1)
+                else:
+                    params.append(len(mapping))
+                    for pair in mapping.items():
+                        params.extend(pair)
+        data['cons'].extend(entry)
+
+    if var_array is not None:
+        data['grid'].append(len(var_array))
+        for row in var_array:
+            data['grid'].append(len(row))
+            data['grid'].extend(var_index[var] for var in row)
+
+    data['values'] = list(value_index)
+    encoded = [name.encode('utf-8') for name in names]
+    data['names'] = b''.join(encoded)
+    offsets = data['nameoff']
+    offsets.append(0)
+    for name in encoded:
+        offsets.append(offsets[-1] + len(name))
+
+    for name, typecode in SECTIONS:
+        if any(not isinstance(x, int) for x in data[name]):
+            print("ERROR: can not save section", name, "of CSP", csp.name,
+                  "(values must be integers)")
+            return False
+    write_sections(file, data)
+    return True
+
+def save_relation(relation, arity, data, index):
+    '''
+    Internal routine. Append the tuples and support offsets of relation to
+    data. Return False if a value can not be saved.
+    '''
+    tuples = relation.tuples
+    size = len(tuples)
+    info = [arity, size, 0, len(data['tuples']), len(data['runs'])]
+    for t in tuples:
+        for val in t:
+            i = index(val)
+            if i is None:
+                return False
+            data['tuples'].append(i)
+    number = dict((t, n) for n, t in enumerate(tuples))
+    #the groups of each position in the order of Relation.supports, so the
+    #loaded supports are the same dicts
+    for pos, sup in enumerate(relation.supports[:arity] if size else []):
+        end = 0
+        for val, sups in sup.items():
+            data['order'].extend(number[t] for t in sups)
+            end += len(sups)
+            data['runs'].extend((pos, index(val), end))
+            info[2] += 1
+    data['relinfo'].extend(info)
+    return True
+
+def write_sections(file, data):
+    '''Internal routine. Write the header, the directory and the sections'''
+    blobs = []
+    for name, typecode in SECTIONS:
+        if typecode == 'B':
+            blob = bytes(data[name])
+        else:
+            values = array.array(typecode, data[name])
+            if sys.byteorder == 'big':
+                values.byteswap()
+            blob = values.tobytes()
+        blobs.append((name, len(data[name]), blob))
+    offset = header.size + section.size * len(blobs)
+    directory = []
+    for name, count, blob in blobs:
+        offset += -offset % 8
+        directory.append(section.pack(name.encode('ascii'), offset, count))
+        offset += len(blob)
+    with open(file, 'wb') as f:
+        f.write(header.pack(MAGIC, VERSION, len(blobs)))
+        for entry in directory:
+            f.write(entry)
+        for name, count, blob in blobs:
+            f.write(b'\0' * (-f.tell() % 8))
+            f.write(blob)
+
+def read_sections(file):
+    '''
+    Internal routine. Map file and return (the map, a dict of its sections 
+    as memoryviews of the map, or arrays on big-endian machines), or 
+    (None, None) if it is not a CSP file of this version.
+    '''
+    with open(file, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if size < header.size:
+            print("ERROR:", file, "is not a CSP file of version", VERSION)
+            return None, None
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    magic, version, count = header.unpack_from(mapped, 0)
+    if magic != MAGIC or version != VERSION or header.size + count * section.size > size:
+        mapped.close()
+        print("ERROR:", file, "is not a CSP file of version", VERSION)
+        return None, None
+    typecodes = dict(SECTIONS)
+    directory = []
+    for k in range(count):
+        name, offset, n = section.unpack_from(mapped, header.size + k * section.size)
+        name = name.rstrip(b'\0').decode('ascii', 'replace')
+        typecode = typecodes.get(name)
+        if typecode is None or offset + n * array.array(typecode).itemsize > size:
+            mapped.close()
+            print("ERROR:", file, "is not a CSP file of version", VERSION)
+            return None, None
+        directory.append((name, typecode, offset, n))
+    view = memoryview(mapped)
+    sections = dict()
+    for name, typecode, offset, n in directory:
+        data = view[offset:offset + n * array.array(typecode).itemsize]
+        if typecode == 'B':
+            sections[name] = data
+        elif sys.byteorder == 'big':
+            values = array.array(typecode, data.tobytes())
+            values.byteswap()
+            sections[name] = values
+        else:
+            sections[name] = data.cast(typecode)
+    return mapped, sections
+
+def load_csp(file):
+    '''
+    Load a CSP saved by save_csp. Return (csp, var_array), var_array None if
+    none was saved, or (None, None) if file is not a CSP file.
+    '''
+    mapped, sections = read_sections(file)
+    if sections is None:
+        return None, None
+    names = bytes(sections['names']).decode('utf-8')
+    nameoff = sections['nameoff']
+    name = iter(names[nameoff[i]:nameoff[i + 1]] for i in range(len(nameoff) - 1))
+    values = sections['values'].tolist()
+
+    csp = CSP(next(name))
+    domains = sections['domains']
+    domoff = sections['domoff']
+    vars = []
+    for i in range(len(domoff) - 1):
+        var = Variable(next(name), [values[d] for d in domains[domoff[i]:domoff[i + 1]]])
+        vars.append(var)
+        csp.add_var(var)
+
+    relinfo = sections['relinfo']
+    relations = []
+    for r in range(0, len(relinfo), 5):
+        arity, size, nruns, toff, roff = relinfo[r:r + 5]
+        relations.append(StoredRelation(
+            values, arity, size, sections['tuples'][toff:toff + size * arity],
+            sections['order'][toff:toff + size * arity],
+            sections['runs'][roff:roff + 3 * nruns]))
+
+    cons = sections['cons']
+    scopes = sections['scopes']
+    params = sections['params']
+    for k in range(0, len(cons), 4):
+        kind, soff, n, extra = cons[k:k + 4]
+        scope = [vars[v] for v in scopes[soff:soff + n]]
+        cname = next(name)
+        if kind == TABLE:
+            c = Constraint(cname, scope)
+            c.add_satisfying_tuples(relations[extra])
+        elif kind == ALLDIFF:
+            c = AllDiffConstraint(cname, scope, params[extra:extra + n].tolist())
+        elif kind in (SUM, PRODUCT):
+            c = KINDS[kind](cname, scope, params[extra], bool(params[extra + 1]))
+        elif kind == NOGOOD:
+            c = NogoodConstraint(cname, list(zip(scope, params[extra:extra + n].tolist())))
+        else:
+            entries = []
+            p = extra + 2
+            for _ in range(params[extra] + params[extra + 1]):
+                var, size = vars[params[p]], params[p + 1]
+                p += 2
+                if size < 0:
+                    entries.append(var)
+                else:
+                    pairs = params[p:p + 2 * size].tolist()
+                    entries.append((var, dict(zip(pairs[::2], pairs[1::2]))))
+                    p += 2 * size
+            c = LexLeqConstraint(cname, entries[:params[extra]], entries[params[extra]:])
+        csp.add_constraint(c)
+    #the tables read the map until close_csp
+    csp.mapping = mapped
+    csp.stored_relations = relations
+
+    var_array = None
+    grid = sections['grid']
+    if len(grid):
+        var_array = []
+        p = 1
+        for _ in range(grid[0]):
+            var_array.append([vars[v] for v in grid[p + 1:p + 1 + grid[p]]])
+            p += 1 + grid[p]
+    return csp, var_array
+
+def close_csp(csp):
+    '''
+    Read every table of csp, a CSP loaded by load_csp, that was not used yet 
+    and unmap its file. The csp can still be searched.
+    '''
+    for relation in csp.stored_relations:
+        relation.sat
+        relation.supports
+        relation.indices = relation.order = relation.runs = None
+    csp.stored_relations = []
+    csp.mapping.close()
@@ -0,0 +1,84 @@
+'''
+Opt-in symmetry breaking for the n-Queens and Latin square (KenKen grid)
+models. Each function adds constraints to a CSP built by the model and
+returns them, so they can be taken out again with csp.remove_constraint.
+
+    csp = nQueens(8)
+    break_queens_symmetry(csp, csp.get_all_vars())
+    BT(csp).count_solutions(prop_GAC)         #17 instead of 92
+
+    csp, var_array = binary_ne_grid([[4]])
+    break_grid_symmetry(csp, var_array)
+    BT(csp).count_solutions(prop_GAC)         #4 instead of 576
+
+The constraints keep at least one solution of every class of symmetric
+solutions (the lex-leader, i.e. the lexicographically least one), so a CSP
+with solutions keeps some, and fewer symmetric copies of each are searched.
+
+1. break_queens_symmetry
+    - The queens X[1..n] (queen i in row i, column X[i]) have the 8 symmetries
+      of the square. The reflections of the board and its half turn map X to
+      a permutation of its entries, and get a LexLeqConstraint each: X <=lex
+      n+1-X, X <=lex reversed(X) and X <=lex n+1-reversed(X). The transposes
+      and quarter turns map columns to rows, which is not a fixed permutation
+      of the entries, so only the first entry of their lex-leader constraints
+      is enforced: if the queen of row i is in a corner column (1 or n) then
+      X[1] <= min(i, n+1-i). This leaves some symmetric solutions in, e.g.
+      17 of the 92 solutions of 8 queens are left for its 12 classes.
+
+2. break_grid_symmetry
+    - A Latin square stays one when its rows or its columns are permuted
+      (double-lex: each row <=lex the next one and each column <=lex the next
+      one) and when its values are renamed (the first row is fixed to
+      1, 2, ..., n, leaving reduced Latin squares). Only for the empty grid:
+      cages are not symmetric in general, and for a KenKen board the
+      constraints can remove every solution.
+'''
+
+from cspbase import *
+
+def break_queens_symmetry(csp, queens):
+    '''
+    Add lex-leader constraints for the symmetries of the board to csp,
+    whose variables queens are the column of the queen of each row (with
+    domain 1..n). Return the constraints added.
+    '''
+    n = len(queens)
+    flip = dict((v, n + 1 - v) for v in range(1, n + 1))
+    cons = [LexLeqConstraint("Sym-Reflect", queens, [(q, flip) for q in queens]),
+            LexLeqConstraint("Sym-Reverse", queens, queens[::-1]),
+            LexLeqConstraint("Sym-HalfTurn", queens, [(q, flip) for q in queens[::-1]])]
+    dom = list(range(1, n + 1))
+    for i in range(2, n + 1):
+        #X[i] in a corner column => X[1] <= min(i, n+1-i), from the transposes
+        #and the quarter turns
+        bound = min(i, n + 1 - i)
+        c = Constraint("Sym-Corner({},{})".format(queens[0].name, queens[i - 1].name),
+                       [queens[0], queens[i - 1]])
+        c.add_satisfying_tuples([(a, b) for a in dom for b in dom
+                                 if (b != 1 and b != n) or a <= bound])
+        cons.append(c)
+    for c in cons:
+        csp.add_constraint(c)
+    return cons
+
+def break_grid_symmetry(csp, var_array, values=True):
+    '''
+    Add double-lex constraints on the rows and columns of var_array (a list
+    of rows of variables of an empty grid model) to csp and, if values, fix
+    the first row to 1..n. Return the constraints added.
+    '''
+    n = len(var_array)
+    cols = [[row[j] for row in var_array] for j in range(n)]
+    cons = []
+    for k in range(n - 1):
+        cons.append(LexLeqConstraint("Sym-Rows({})".format(k + 1), var_array[k], var_array[k + 1]))
+        cons.append(LexLeqConstraint("Sym-Cols({})".format(k + 1), cols[k], cols[k + 1]))
+    if values:
+        for j, var in enumerate(var_array[0]):
+            c = Constraint("Sym-Value({})".format(var.name), [var])
+            c.add_satisfying_tuples([[j + 1]])
+            cons.append(c)
+    for c in cons:
+        csp.add_constraint(c)
+    return cons
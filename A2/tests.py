@@ -1,7 +1,14 @@
 import unittest
 import sys
 import itertools
+import random
 import traceback
+import tempfile
+import os
+import json
+import operator
+import io
+import contextlib
 
 from cspbase import *
 from kenken_csp import *
@@ -9,6 +16,14 @@ from propagators import *
 from heuristics import *
 
 import propagators
+import portfolio
+import parallel
+import kenken_boards
+import kenken_csp
+import symmetry
+import preprocessing
+import localsearch
+import serialize
 
 BOARDS = [ [[3],[11,21,3,0],[12,22,2,1],[13,23,33,6,3],[31,32,5,0]],
 [[4],[11,21,6,3],[12,13,3,0],[14,24,3,1],[22,23,7,0],[31,32,2,2],[33,43,3,1],[34,44,6,3],[41,42,7,0]],
@@ -79,8 +94,7 @@ def check_cages(vars, board):
             continue
         if len(c) == 2:#forced value to a cell
             val = c[1]
-            cell_i = (c[0] // 10)-1
-            cell_j = (c[0] % 10)-1
+            cell_i, cell_j = cell_position(c[0], N)
             if vars[cell_i][cell_j].get_assigned_value() != val:
                 return False
         if len(c) > 2:#larger cage
@@ -88,8 +102,7 @@ def check_cages(vars, board):
             op = c[len(c)-1]
             cage_values = []
             for v in range(0,len(c)-2):#get vars in cage
-                cell_i = (c[v] // 10)-1
-                cell_j = (c[v] % 10)-1
+                cell_i, cell_j = cell_position(c[v], N)
                 cage_values.append(vars[cell_i][cell_j].get_assigned_value())
             if op == 0:
                 if add_check(cage_values,val) == False:
@@ -145,6 +158,12 @@ def nQueens(n):
 TEST_MODELS      = True
 TEST_HEURISTICS  = True
 TEST_PROPAGATORS = True
+TEST_CSPBASE     = True
+TEST_PORTFOLIO   = True
+
+def prop_broken(csp, newVar=None):
+    '''Propagator that always fails, to test error handling of the portfolio'''
+    raise RuntimeError("broken propagator")
 
 class TestStringMethods(unittest.TestCase):
     def helper_prop(self, board, prop=prop_FC, var_ord=ord_mrv):
@@ -228,6 +247,47 @@ class TestStringMethods(unittest.TestCase):
         board = BOARDS[5]
         self.helper_prop(board, prop_GAC)
 
+    @unittest.skipUnless(TEST_PROPAGATORS and TEST_MODELS, "Not Testing Propagators and Models.")
+    def test_props_CT(self):
+        for board in BOARDS[3:]:
+            self.helper_prop(board, prop_CT)
+
+    @unittest.skipUnless(TEST_PROPAGATORS, "Not Testing Propagotors.")
+    def test_CT_matches_GAC(self):
+        domains = []
+        for prop in (prop_GAC, prop_CT):
+            queens = nQueens(8)
+            curr_vars = queens.get_all_vars()
+            trail = Trail()
+            for var in curr_vars:
+                var.trail = trail
+            curr_vars[0].assign(1)
+            trail.checkpoint()
+            self.assertTrue(prop(queens, curr_vars[0])[0], "Unexpected DWO")
+            trail.backtrack()
+            curr_vars[0].unassign()
+            curr_vars[0].assign(2)
+            trail.checkpoint()
+            self.assertTrue(prop(queens, curr_vars[0])[0], "Unexpected DWO")
+            domains.append([var.cur_domain() for var in curr_vars])
+        self.assertEqual(domains[0], domains[1], "prop_CT and prop_GAC pruned differently")
+
+    @unittest.skipUnless(TEST_PROPAGATORS, "Not Testing Propagotors.")
+    def test_propagation_queue(self):
+        x = Variable('X', [1, 2, 3])
+        y = Variable('Y', [1, 2, 3])
+        z = Variable('Z', [1, 2, 3])
+        big = AllDiffConstraint('AllDiff', [x, y, z])
+        small = Constraint('X!=Y', [x, y])
+        queue = propagators.PropagationQueue()
+        queue.push(big, x)
+        queue.push(small, x)
+        queue.push(big, y)
+        queue.push(small)
+        self.assertEqual(len(queue), 2, "Constraints should only be scheduled once")
+        self.assertEqual(queue.pop(), (small, None), "Binary constraint should be revised first, for all variables")
+        self.assertEqual(queue.pop(), (big, set([x, y])), "Changed variables should be accumulated")
+
     @unittest.skipUnless(TEST_HEURISTICS, "Not Testing Heuristics.")
     def test_ord_mrv_1(self):
         a = Variable('A', [1])
@@ -256,6 +316,786 @@ class TestStringMethods(unittest.TestCase):
         var = ord_mrv(simpleCSP)
         self.assertEqual(var.name, simpleCSP.vars[len(simpleCSP.vars)-1].name, "MRV Picked the wrong variable")
 
+    @unittest.skipUnless(TEST_HEURISTICS, "Not Testing Heuristics.")
+    def test_val_lcv_counts(self):
+        x = Variable('X', [1, 2, 3])
+        y = Variable('Y', [1, 2, 3])
+        z = Variable('Z', [1, 2, 3])
+        w = Variable('W', [1, 2, 3])
+        lt = Constraint('X<Y', [x, y])
+        lt.add_satisfying_tuples([(a, b) for a in range(1, 4) for b in range(1, 4) if a < b])
+        ad = AllDiffConstraint('AllDiff', [x, z, w])
+        sm = FunctionConstraint('X+Z<=4', [x, z], lambda vals: sum(vals) <= 4, partial=True)
+        csp = CSP("LCV", [x, y, z, w])
+        for c in (lt, ad, sm):
+            csp.add_constraint(c)
+        self.assertEqual(val_lcv_counts(csp, x), val_lcv(csp, x), "Orderings of val_lcv_counts and val_lcv differ")
+        self.assertEqual(val_lcv_counts(csp, x), [1, 2, 3], "Wrong least constraining value order")
+        self.assertFalse(x.is_assigned(), "val_lcv_counts should not assign the variable")
+        z.prune_value(1)
+        w.assign(3)
+        self.assertEqual(val_lcv_counts(csp, x), val_lcv(csp, x), "Orderings of val_lcv_counts and val_lcv differ")
+        w.unassign()
+        z.unprune_value(1)
+        for board in BOARDS[:4]:
+            for model in (kenken_csp_model, kenken_csp_model_nary):
+                csp, _ = model([list(cage) for cage in board])
+                for var in csp.get_all_vars():
+                    self.assertEqual(val_lcv_counts(csp, var), val_lcv(csp, var), "Orderings of val_lcv_counts and val_lcv differ")
+        #the all-different counts, with pruned values, assigned variables and offsets
+        x, y, z, w = [Variable(name, [1, 2, 3, 4]) for name in 'XYZW']
+        for offsets in (None, [0, 1, 2, 3]):
+            c = AllDiffConstraint('AllDiff', [x, y, z, w], offsets)
+            y.prune_value(2)
+            w.assign(1)
+            expected = dict()
+            for a in x.cur_domain():
+                x.assign(a)
+                expected[a] = sum(c.has_support(v, b) for v in (y, z) for b in v.cur_domain())
+                x.unassign()
+            self.assertEqual(c.support_counts(x), expected, "Wrong all-different support counts")
+            w.unassign()
+            y.unprune_value(2)
+
+    @unittest.skipUnless(TEST_HEURISTICS, "Not Testing Heuristics.")
+    def test_heap_orders(self):
+        a = Variable('A', [1,2,3,4,5])
+        b = Variable('B', [1,2,3,4])
+        c = Variable('C', [1,2,3])
+        simpleCSP = CSP("Simple", [a,b,c])
+        order = MRVOrder()
+        self.assertIs(order(simpleCSP), c, "MRVOrder Picked the wrong variable")
+        a.prune_value(1)
+        a.prune_value(2)
+        a.prune_value(3)
+        self.assertIs(order(simpleCSP), a, "MRVOrder did not follow a prune")
+        c.assign(1)
+        a.unprune_value(3)
+        self.assertIs(order(simpleCSP), a, "MRVOrder should break ties by position")
+        a.assign(4)
+        self.assertIs(order(simpleCSP), b, "MRVOrder returned an assigned variable")
+        a.unassign()
+        c.unassign()
+        self.assertIs(order(simpleCSP), a, "MRVOrder did not follow an unassign")
+        for board in BOARDS[:4]:
+            self.helper_prop([list(cage) for cage in board], prop_GAC, MRVOrder())
+            self.helper_prop([list(cage) for cage in board], prop_FC, DomWdegOrder())
+        queens = nQueens(8)
+        solver = BT(queens)
+        solver.quiet()
+        solver.bt_search(prop_FC, DomWdegOrder())
+        weights = [con.weight for con in queens.get_all_cons()]
+        self.assertTrue(max(weights) > 1, "Wipeouts should increase constraint weights")
+        self.assertTrue(all(var.is_assigned() for var in queens.get_all_vars()), "DomWdegOrder did not solve 8 queens")
+        self.assertTrue(all(var.order is None for var in queens.get_all_vars()), "The ordering should be detached after bt_search")
+        order = MRVOrder()
+        for board in BOARDS[:2]:
+            csp, _ = kenken_csp_model([list(cage) for cage in board])
+            solver = BT(csp)
+            solver.quiet()
+            solver.bt_search(prop_GAC, order)
+            self.assertTrue(all(var.order is None for var in csp.get_all_vars()), "The ordering should be detached after bt_search")
+            #and is attached again by the next search
+            self.assertTrue(solver.bt_search(prop_GAC, order).status)
+
+    @unittest.skipUnless(TEST_CSPBASE, "Not Testing cspbase.")
+    def test_bitset_domain(self):
+        a = Variable('A', ['x', 'y', 'z'])
+        a.prune_value('y')
+        self.assertEqual(a.cur_domain(), ['x', 'z'], "Pruned value still in current domain")
+        self.assertEqual(a.cur_domain_size(), 2, "Wrong current domain size after pruning")
+        self.assertFalse(a.in_cur_domain('y'), "Pruned value reported as current")
+        self.assertFalse(a.in_cur_domain('w'), "Value outside domain reported as current")
+        a.add_domain_values(['w'])
+        self.assertTrue(a.in_cur_domain('w'), "Added value not in current domain")
+        a.assign('z')
+        self.assertEqual(a.cur_domain(), ['z'], "Assigned variable should only have its value")
+        self.assertEqual(a.cur_domain_size(), 1, "Assigned variable should have domain size 1")
+        a.unassign()
+        a.unprune_value('y')
+        self.assertEqual(a.cur_domain_size(), 4, "Unpruned value not restored")
+        a.prune_value('x')
+        a.restore_curdom()
+        self.assertEqual(a.cur_domain(), ['x', 'y', 'z', 'w'], "restore_curdom did not restore all values")
+
+    @unittest.skipUnless(TEST_CSPBASE, "Not Testing cspbase.")
+    def test_trail_backtrack(self):
+        a = Variable('A', [1, 2, 3])
+        b = Variable('B', [1, 2, 3])
+        trail = Trail()
+        a.trail = b.trail = trail
+        a.prune_value(1)
+        trail.checkpoint()
+        a.prune_value(2)
+        a.prune_value(2)
+        b.prune_value(3)
+        self.assertEqual(len(trail), 3, "Trail should record each removed value once")
+        trail.backtrack()
+        self.assertEqual(a.cur_domain(), [2, 3], "Backtrack did not restore the level's prunings")
+        self.assertEqual(b.cur_domain(), [1, 2, 3], "Backtrack did not restore the level's prunings")
+        trail.undo_all()
+        self.assertEqual(a.cur_domain(), [1, 2, 3], "undo_all did not restore root prunings")
+
+    @unittest.skipUnless(TEST_CSPBASE, "Not Testing cspbase.")
+    def test_unassigned_counters(self):
+        x = Variable('X', [1, 2])
+        y = Variable('Y', [1, 2])
+        z = Variable('Z', [1, 2])
+        y.assign(1)
+        c = Constraint('C', [x, y, z])
+        self.assertEqual(c.get_n_unasgn(), 2, "Counter should start from the current assignments")
+        self.assertIsNone(c.get_last_unasgn_var(), "Two variables are unassigned")
+        x.assign(2)
+        self.assertEqual(c.get_n_unasgn(), 1, "Assign should decrement the counter")
+        self.assertIs(c.get_last_unasgn_var(), z, "Z is the only unassigned variable")
+        self.assertEqual(c.get_unasgn_vars(), [z], "Z is the only unassigned variable")
+        z.assign(1)
+        y.unassign()
+        self.assertIs(c.get_last_unasgn_var(), y, "Unassign should make Y the last unassigned variable")
+        x.unassign()
+        self.assertEqual(c.get_unasgn_vars(), [x, y], "Unassigned variables should be in scope order")
+
+    @unittest.skipUnless(TEST_CSPBASE, "Not Testing cspbase.")
+    def test_residual_supports(self):
+        x = Variable('X', [1, 2, 3])
+        y = Variable('Y', [1, 2, 3])
+        c = Constraint('X!=Y', [x, y])
+        c.add_satisfying_tuples([t for t in itertools.product([1, 2, 3], repeat=2) if t[0] != t[1]])
+        self.assertTrue(c.has_support(x, 1), "X=1 should be supported")
+        y.prune_value(2)
+        self.assertTrue(c.has_support(x, 1), "Residue invalidated, scan should find Y=3")
+        y.prune_value(3)
+        self.assertFalse(c.has_support(x, 1), "X=1 has no support left")
+        y.unprune_value(2)
+        self.assertTrue(c.has_support(x, 1), "Scan should wrap around to earlier tuples")
+
+    @unittest.skipUnless(TEST_CSPBASE, "Not Testing cspbase.")
+    def test_function_constraint(self):
+        x = Variable('X', [1, 2, 3])
+        y = Variable('Y', [1, 2, 3])
+        z = Variable('Z', [1, 2, 3])
+        c = FunctionConstraint('X<Y<Z', [x, y, z], lambda vals: all(a < b for a, b in zip(vals, vals[1:])), partial=True)
+        self.assertTrue(c.check([1, 2, 3]), "Predicate constraint rejected a satisfying tuple")
+        self.assertFalse(c.check([2, 1, 3]), "Predicate constraint accepted a violating tuple")
+        self.assertTrue(c.has_support(y, 2), "Y=2 should be supported by X=1, Z=3")
+        self.assertFalse(c.has_support(y, 3), "Y=3 has no support")
+        x.prune_value(1)
+        self.assertFalse(c.has_support(y, 2), "Support must only use current domain values")
+        x.unprune_value(1)
+        csp = CSP("Chain", [x, y, z])
+        csp.add_constraint(c)
+        prop_GAC(csp)
+        self.assertEqual([v.cur_domain() for v in (x, y, z)], [[1], [2], [3]], "GAC on predicate constraint failed")
+
+    @unittest.skipUnless(TEST_CSPBASE, "Not Testing cspbase.")
+    def test_alldiff_constraint(self):
+        x = Variable('X', [1, 2])
+        y = Variable('Y', [1, 2])
+        z = Variable('Z', [1, 2, 3])
+        c = AllDiffConstraint('AllDiff', [x, y, z])
+        self.assertTrue(c.check([2, 1, 3]), "All-different rejected distinct values")
+        self.assertFalse(c.check([1, 1, 3]), "All-different accepted repeated values")
+        self.assertFalse(c.has_support(z, 1), "Z=1 leaves X and Y only one value")
+        csp = CSP("AllDiff", [x, y, z])
+        csp.add_constraint(c)
+        status, _ = prop_GAC(csp)
+        self.assertTrue(status, "GAC reported a wipeout on a satisfiable all-different")
+        self.assertEqual(z.cur_domain(), [3], "Matching filter should prune 1 and 2 from Z")
+        w = Variable('W', [1, 2])
+        c2 = AllDiffConstraint('AllDiff2', [x, y, w])
+        csp2 = CSP("Pigeonhole", [x, y, w])
+        csp2.add_constraint(c2)
+        status, _ = prop_GAC(csp2)
+        self.assertFalse(status, "GAC should detect the pigeonhole wipeout")
+
+        #violated constraints whose variables are all assigned
+        for make in (lambda x, y: AllDiffConstraint('AllDiff', [x, y]),
+                     lambda x, y: SumConstraint('Sum', [x, y], 5),
+                     lambda x, y: NogoodConstraint('Nogood', [(x, 1), (y, 1)])):
+            for prop in (prop_GAC, prop_CT):
+                x, y = Variable('X', [1, 2, 3]), Variable('Y', [1, 2, 3])
+                csp = CSP("Assigned", [x, y])
+                csp.add_constraint(make(x, y))
+                x.assign(1)
+                y.assign(1)
+                status, _ = prop(csp)
+                self.assertFalse(status, "{} should fail on a violated assigned constraint".format(prop.__name__))
+                y.unassign()
+                y.assign(2)
+                status, _ = prop(csp, y)
+                self.assertEqual(status, csp.get_all_cons()[0].check([1, 2]))
+
+    @unittest.skipUnless(TEST_CSPBASE, "Not Testing cspbase.")
+    def test_nogood_constraint(self):
+        x = Variable('X', [1, 2, 3])
+        y = Variable('Y', [1, 2, 3])
+        z = Variable('Z', [1, 2, 3])
+        c = NogoodConstraint('Nogood', [(x, 1), (y, 2), (z, 3)])
+        csp = CSP("Nogood", [x, y, z])
+        csp.add_constraint(c)
+        self.assertFalse(c.check([1, 2, 3]), "Nogood should forbid its literals")
+        self.assertTrue(c.check([1, 2, 1]), "Nogood should allow any other assignment")
+        x.assign(1)
+        status, _ = prop_GAC(csp, x)
+        self.assertEqual(z.cur_domain(), [1, 2, 3], "Nogood should not prune with two open literals")
+        y.assign(2)
+        status, _ = prop_GAC(csp, y)
+        self.assertTrue(status, "Nogood should not wipe out Z")
+        self.assertEqual(z.cur_domain(), [1, 2], "Nogood should prune its last literal")
+        y.unassign()
+        x.unassign()
+        csp.remove_constraint(c)
+        self.assertEqual(csp.get_all_cons(), [], "Constraint was not removed")
+        self.assertEqual(x.watchers, [], "Removed constraint should not be updated by assignments")
+
+    @unittest.skipUnless(TEST_CSPBASE, "Not Testing cspbase.")
+    def test_restarts(self):
+        self.assertEqual(list(itertools.islice(luby_cutoffs(1), 15)), [1, 1, 2, 1, 1, 2, 4, 1, 1, 2, 1, 1, 2, 4, 8], "Wrong Luby sequence")
+        self.assertEqual(list(itertools.islice(geometric_cutoffs(10, 2), 4)), [10, 20, 40, 80], "Wrong geometric sequence")
+        queens = nQueens(6)
+        n_cons = len(queens.get_all_cons())
+        solver = BT(queens)
+        solver.quiet()
+        solver.bt_search(prop_FC, ord_mrv, val_lcv, restarts=luby_cutoffs(2), seed=0)
+        self.assertTrue(len(solver.runs) > 1, "Search should have restarted")
+        self.assertEqual(solver.nDecisions, sum(run[0] for run in solver.runs), "nDecisions should total the runs")
+        for c in queens.get_all_cons():
+            self.assertTrue(c.check([var.get_assigned_value() for var in c.get_scope()]), "Restarted search returned a wrong solution")
+        self.assertEqual(len(queens.get_all_cons()), n_cons, "Learned nogoods should be removed after search")
+        self.assertIsNone(queens.rng, "Random tie-breaking should be turned off after search")
+        for board in BOARDS[:4]:
+            board = [list(cage) for cage in board]
+            csp, var_array = kenken_csp_model(board)
+            solver = BT(csp)
+            solver.quiet()
+            solver.bt_search(prop_GAC, DomWdegOrder(), restarts=geometric_cutoffs(4), seed=0)
+            self.assertTrue(check_cages(var_array, board), "Incorect value in a cage!")
+            self.assertTrue(check_diff(var_array, board), "Repeated value in a row or column!")
+        impossible = nQueens(3)
+        solver = BT(impossible)
+        solver.quiet()
+        solver.bt_search(prop_FC, ord_mrv, restarts=luby_cutoffs(1), seed=0)
+        self.assertFalse(any(var.is_assigned() for var in impossible.get_all_vars()), "3 queens has no solution")
+
+    @unittest.skipUnless(TEST_CSPBASE, "Not Testing cspbase.")
+    def test_backjumping(self):
+        for prop in (prop_BT, prop_FC, prop_GAC):
+            for board in BOARDS[:3]:
+                board = [list(cage) for cage in board]
+                decisions = []
+                for backjump in (False, True):
+                    csp, var_array = kenken_csp_model(board)
+                    solver = BT(csp)
+                    solver.quiet()
+                    solver.bt_search(prop, ord_mrv, backjump=backjump)
+                    self.assertTrue(check_cages(var_array, board), "Incorect value in a cage!")
+                    self.assertTrue(check_diff(var_array, board), "Repeated value in a row or column!")
+                    decisions.append(solver.nDecisions)
+                self.assertTrue(decisions[1] <= decisions[0], "Backjumping should not make more decisions")
+        csp, _ = kenken_csp_model([list(cage) for cage in BOARDS[2]])
+        solver = BT(csp)
+        solver.quiet()
+        solver.bt_search(prop_FC, ord_mrv, backjump=True)
+        self.assertEqual(solver.nDecisions, 91, "Backjumping should skip irrelevant levels")
+        for var in csp.get_all_vars():
+            self.assertEqual(var.expl, 0, "Explanations should be restored after search")
+        impossible = nQueens(3)
+        solver = BT(impossible)
+        solver.quiet()
+        solver.bt_search(prop_FC, ord_mrv, backjump=True)
+        self.assertFalse(any(var.is_assigned() for var in impossible.get_all_vars()), "3 queens has no solution")
+
+    @unittest.skipUnless(TEST_PORTFOLIO, "Not Testing Portfolio.")
+    def test_portfolio(self):
+        board = [list(cage) for cage in BOARDS[2]]
+        with tempfile.TemporaryDirectory() as tmp:
+            log_file = os.path.join(tmp, "wins.jsonl")
+            result = portfolio.solve_portfolio(kenken_csp_model, board, processes=2, log_file=log_file)
+            self.assertIn(result['config'], [portfolio.config_name(config) for config in portfolio.PORTFOLIO], "Unknown winning configuration")
+            _, var_array = kenken_csp_model([list(cage) for cage in board])
+            for row, values in zip(var_array, result['solution']):
+                for var, value in zip(row, values):
+                    var.assign(value)
+            self.assertTrue(check_cages(var_array, board), "Incorect value in a cage!")
+            self.assertTrue(check_diff(var_array, board), "Repeated value in a row or column!")
+            self.assertEqual(portfolio.tally_wins(log_file), {result['config']: 1}, "Win was not recorded")
+        result = portfolio.solve_portfolio(nary_ad_grid, [[3]], configs=[(prop_FC, ord_mrv, None)])
+        self.assertIsNotNone(result['solution'], "Grid without cages has a solution")
+        configs = [(prop_broken, ord_mrv, None), (prop_FC, ord_mrv, None)]
+        result = portfolio.solve_portfolio(kenken_csp_model, board, configs=configs)
+        self.assertEqual(result['index'], 1, "A failing configuration should not end the race")
+        with self.assertRaises(RuntimeError):
+            portfolio.solve_portfolio(kenken_csp_model, board, configs=configs[:1] * 2)
+
+    @unittest.skipUnless(TEST_PORTFOLIO, "Not Testing Portfolio.")
+    def test_parallel_bt(self):
+        for n, count in ((3, 0), (6, 4), (7, 40)):
+            solver = parallel.ParallelBT(nQueens(n), processes=2)
+            self.assertEqual(solver.count_solutions(prop_FC, ord_mrv), count, "Wrong number of {}-queens solutions".format(n))
+            self.assertEqual(BT(nQueens(n)).count_solutions(prop_GAC, MRVOrder()), count, "Wrong number of {}-queens solutions".format(n))
+        board = [list(cage) for cage in BOARDS[3]]
+        csp, var_array = kenken_csp_model(board)
+        solver = parallel.ParallelBT(csp, processes=2)
+        solver.quiet()
+        stats = solver.bt_search(prop_GAC, ord_mrv)
+        self.assertIs(stats.status, True, "ParallelBT did not find a solution")
+        self.assertEqual(stats.decisions, solver.nDecisions)
+        self.assertTrue(check_cages(var_array, board), "Incorect value in a cage!")
+        self.assertTrue(check_diff(var_array, board), "Repeated value in a row or column!")
+        solver = parallel.ParallelBT(nQueens(3), processes=2)
+        solver.quiet()
+        stats = solver.bt_search(prop_FC, ord_mrv)
+        self.assertIs(stats.status, False, "3 queens has no solution")
+        self.assertFalse(stats, "A search without a solution should be false")
+        queens = nQueens(8)
+        solver = parallel.ParallelBT(queens, processes=2)
+        self.assertEqual(solver.count_solutions(prop_FC, MRVOrder()), 92, "Wrong number of 8-queens solutions")
+        self.assertTrue(all(var.order is None for var in queens.get_all_vars()), "The ordering should be detached after the run")
+
+    @unittest.skipUnless(TEST_CSPBASE, "Not Testing cspbase.")
+    def test_solutions(self):
+        queens = nQueens(6)
+        solver = BT(queens)
+        solns = list(solver.solutions(prop_FC, ord_mrv))
+        self.assertEqual(sorted(solns), [(2, 4, 6, 1, 3, 5), (3, 6, 2, 5, 1, 4), (4, 1, 5, 2, 6, 3), (5, 3, 1, 6, 4, 2)], "Wrong 6-queens solutions")
+        self.assertEqual(solver.count_solutions(prop_GAC, ord_mrv), 4, "Wrong number of 6-queens solutions")
+        self.assertEqual(solver.count_solutions(prop_BT, limit=2), 2, "Counting should stop at the limit")
+        generator = solver.solutions(prop_GAC)
+        first = next(generator)
+        self.assertEqual(tuple(var.get_assigned_value() for var in queens.get_all_vars()), first, "Variables should hold the solution being yielded")
+        generator.close()
+        self.assertEqual(queens.get_all_unasgn_vars(), queens.get_all_vars(), "Closing the generator should unassign the variables")
+        board = [list(cage) for cage in BOARDS[3]]
+        csp, _ = kenken_csp_model(board)
+        self.assertEqual(BT(csp).count_solutions(prop_GAC, ord_mrv, limit=2), 1, "Board should have a unique solution")
+
+    @unittest.skipUnless(TEST_CSPBASE, "Not Testing cspbase.")
+    def test_pause_resume(self):
+        board = [list(cage) for cage in BOARDS[5]]
+        csp, _ = kenken_csp_model(board)
+        solver = BT(csp)
+        solver.quiet()
+        solver.bt_search(prop_FC, ord_mrv)
+        decisions, solution = solver.nDecisions, [var.get_assigned_value() for var in csp.get_all_vars()]
+        stats = solver.bt_search(prop_FC, ord_mrv, max_decisions=100)
+        self.assertIsNone(stats.status, "Search should pause")
+        self.assertFalse(stats, "A paused search should be false")
+        self.assertEqual(solver.nDecisions, 100, "Search should pause after max_decisions")
+        out = io.StringIO()
+        solver.trace_off()
+        with contextlib.redirect_stdout(out):
+            solver.bt_resume(max_decisions=1)
+        solver.quiet()
+        self.assertNotIn("bt_search finished", out.getvalue(), "A paused search should not be reported as finished")
+        while solver.bt_resume(max_decisions=100).status is None:
+            pass
+        self.assertEqual(solver.nDecisions, decisions, "Pausing should not change the search")
+        self.assertEqual([var.get_assigned_value() for var in csp.get_all_vars()], solution, "Pausing should not change the solution")
+        solver.bt_search(prop_GAC, ord_mrv, max_decisions=1)
+        solver.stop()
+        self.assertEqual(csp.get_all_unasgn_vars(), csp.get_all_vars(), "Stopping should unassign the variables")
+        self.assertTrue(all(var.cur_domain_size() == var.domain_size() for var in csp.get_all_vars()), "Stopping should restore the domains")
+
+        #a chain deeper than the recursion limit
+        n = sys.getrecursionlimit() + 100
+        vars = [Variable("V{}".format(i), [1, 2]) for i in range(n)]
+        chain = CSP("Chain", vars)
+        for i in range(n - 1):
+            c = Constraint("C{}".format(i), [vars[i], vars[i + 1]])
+            c.add_satisfying_tuples([[1, 2], [2, 1]])
+            chain.add_constraint(c)
+        solver = BT(chain)
+        solver.quiet()
+        self.assertTrue(solver.bt_search(prop_FC).status, "Chain should be solved")
+        self.assertEqual([var.get_assigned_value() for var in vars], [1, 2] * (n // 2) + [1] * (n % 2), "Wrong chain solution")
+        self.assertEqual(solver.count_solutions(prop_FC), 2, "Chain has two solutions")
+
+    @unittest.skipUnless(TEST_CSPBASE, "Not Testing cspbase.")
+    def test_search_stats(self):
+        board = [list(cage) for cage in BOARDS[4]]
+        csp, _ = kenken_csp_model(board)
+        solver = BT(csp)
+        solver.quiet()
+        with tempfile.TemporaryDirectory() as tmp:
+            trace_file = os.path.join(tmp, "trace.bin")
+            stats = solver.bt_search(prop_FC, ord_mrv, trace_file=trace_file)
+            self.assertTrue(stats.status, "Board should be solved")
+            self.assertEqual((stats.decisions, stats.prunings, stats.solutions), (solver.nDecisions, solver.nPrunings, 1), "Wrong search counts")
+            self.assertEqual(stats.max_depth, len(csp.get_all_vars()), "Solution should be at the depth of the number of variables")
+            self.assertEqual(sum(stats.pruned.values()), stats.prunings, "Every pruning should be attributed")
+            self.assertTrue(stats.wipeouts, "Search should have hit dead-ends")
+            self.assertTrue(stats.time_propagation + stats.time_var_ord + stats.time_val_ord <= stats.time, "Time split exceeds the search time")
+            record = json.loads(stats.to_json())
+            self.assertEqual(record['decisions'], stats.decisions, "Wrong JSON export")
+            events = list(SearchTrace.read(trace_file))
+            self.assertEqual(sum(1 for e in events if e[0] == 'decision'), stats.decisions, "Trace should log every decision")
+            self.assertEqual(sum(1 for e in events if e[0] == 'fail'), sum(stats.wipeouts.values()), "Trace should log every dead-end")
+            self.assertEqual(events[-1][0], 'solution', "Trace should end with the solution")
+            self.assertEqual(json.loads(SearchTrace.to_json(trace_file)), [list(e) for e in events], "Wrong JSON trace")
+
+    @unittest.skipUnless(TEST_MODELS, "Not Testing Models.")
+    def test_cage_tuples(self):
+        for operation in range(4):
+            for size in range(1, 4):
+                for target in range(0, 40):
+                    expected = []
+                    for t in itertools.product(range(1, 6), repeat=size):
+                        for p in itertools.permutations(t):
+                            value = p[0]
+                            for v in p[1:]:
+                                value = [value + v, value - v, value / v, value * v][operation]
+                            if value == target:
+                                expected.append(t)
+                                break
+                            if operation in (0, 3):
+                                break
+                    self.assertEqual(list(cage_tuples(operation, target, size, 5)), expected, "Wrong tuples for cage {}".format((operation, target, size)))
+        self.assertIs(cage_tuples(3, 24, 3, 6), cage_tuples(3, 24, 3, 6), "Cage tuples should be memoized")
+
+    @unittest.skipUnless(TEST_CSPBASE, "Not Testing cspbase.")
+    def test_arithmetic_cages(self):
+        rng = random.Random(0)
+        for _ in range(300):
+            size = rng.randint(1, 4)
+            operation = rng.choice([0, 3])
+            target = rng.randint(1, 5 * size if operation == 0 else 5 ** size)
+            arithmetic = SumConstraint if operation == 0 else ProductConstraint
+            for domain_consistency in (True, False):
+                vars = [Variable("V{}".format(i), [1, 2, 3, 4, 5]) for i in range(size)]
+                for var in vars:
+                    for d in rng.sample(range(1, 6), rng.randint(0, 2)):
+                        var.prune_value(d)
+                doms = [var.cur_domain() for var in vars]
+                c = arithmetic("Cage", vars, target, domain_consistency)
+                supported = [set(t[i] for t in cage_tuples(operation, target, size, 5)
+                                 if all(v in d for v, d in zip(t, doms))) for i in range(size)]
+                for t in itertools.product(*doms):
+                    self.assertEqual(c.check(t), t in cage_tuples(operation, target, size, 5), "Wrong check")
+                for var, sup in zip(vars, supported):
+                    for d in var.cur_domain():
+                        self.assertEqual(c.has_support(var, d), d in sup, "Wrong support")
+                c.prune_unsupported()
+                if not all(supported):
+                    if domain_consistency or size == 1:
+                        self.assertTrue(any(var.cur_domain_size() == 0 for var in vars), "Unsatisfiable cage not detected")
+                    continue
+                for var, sup in zip(vars, supported):
+                    if domain_consistency or size == 1:
+                        self.assertEqual(set(var.cur_domain()), sup, "Domain consistency should prune like the table")
+                    else:
+                        self.assertTrue(sup <= set(var.cur_domain()), "Bounds consistency pruned a supported value")
+        x, y, z = (Variable(name, list(range(1, 10))) for name in "XYZ")
+        c = SumConstraint("Sum", [x, y, z], 24)
+        c.prune_unsupported()
+        self.assertEqual(x.cur_domain(), [6, 7, 8, 9], "Wrong bounds")
+        x, y, z = (Variable(name, list(range(1, 10))) for name in "XYZ")
+        c = ProductConstraint("Product", [x, y, z], 7)
+        self.assertEqual(c.prune_unsupported(), [x, y, z])
+        self.assertEqual(x.cur_domain(), [1, 7], "Only divisors of 7 are supported")
+        x, y = (Variable(name, list(range(1, 10))) for name in "XY")
+        c = ArithmeticConstraint("Add", [x, y], 4, operator.add, 0, operator.sub, True)
+        c.prune_unsupported()
+        self.assertEqual(x.cur_domain(), [1, 2, 3], "ArithmeticConstraint should take its operation")
+        self.assertTrue(c.check([3, 1]) and not c.check([2, 1]))
+
+        rng = random.Random(3)
+        board = kenken_boards.generate_board(6, rng, sizes={3: 1, 5: 2, 6: 2, 7: 1})
+        self.assertTrue(any(len(cage) > 7 for cage in board), "The board should have a large cage")
+        for model in (kenken_csp_model, kenken_csp_model_nary):
+            csp, var_array = model([list(cage) for cage in board])
+            self.assertTrue(any(isinstance(c, ArithmeticConstraint) for c in csp.get_all_cons()), "Large cages should not be tables")
+            for prop in (prop_FC, prop_GAC, prop_CT):
+                solver = BT(csp)
+                solver.quiet()
+                solver.bt_search(prop, ord_mrv)
+                self.assertTrue(check_diff(var_array, board) and check_cages(var_array, board), "Wrong solution with large cages")
+                solver.restore_all_variable_domains()
+            decisions = solver.count_solutions(prop_GAC, ord_mrv), solver.nDecisions
+            csp, var_array = model([list(cage) for cage in board], arithmetic_size=float('inf'))
+            self.assertFalse(any(isinstance(c, ArithmeticConstraint) for c in csp.get_all_cons()), "Every cage should be a table")
+            solver = BT(csp)
+            solver.quiet()
+            self.assertEqual((solver.count_solutions(prop_GAC, ord_mrv), solver.nDecisions), decisions, "Domain consistency should search like the tables")
+
+    @unittest.skipUnless(TEST_CSPBASE, "Not Testing cspbase.")
+    def test_shared_relations(self):
+        csp, _ = binary_ne_grid([[5]])
+        relations = set(id(c.relation) for c in csp.get_all_cons())
+        self.assertEqual(len(relations), 1, "Not-equal constraints should share one relation")
+        x, y, z = Variable('X', [1, 2, 3]), Variable('Y', [1, 2, 3]), Variable('Z', [1, 2, 3])
+        c1, c2 = Constraint('C1', [x, y]), Constraint('C2', [y, z])
+        c1.add_satisfying_tuples([(1, 2), (2, 3), (1, 2)])
+        c2.add_satisfying_tuples([[1, 2], [2, 3]])
+        self.assertIs(c1.relation, c2.relation, "Identical tables should be interned")
+        self.assertEqual(list(c1.sat_tuples), [(1, 2), (2, 3)], "Repeated tuples should be dropped")
+        self.assertEqual(c2.sup_tuples[(y, 2)], [(2, 3)], "Wrong supports")
+        self.assertTrue(c1.check([2, 3]) and not c1.check([3, 2]), "Wrong check")
+        y.prune_value(2)
+        self.assertFalse(c1.has_support(x, 1), "Support should be lost")
+        self.assertTrue(c2.has_support(z, 2), "Support should remain")
+        c2.add_satisfying_tuples([(3, 1)])
+        self.assertIsNot(c1.relation, c2.relation, "Adding tuples should not change the other constraint")
+        self.assertEqual(len(c1.sat_tuples), 2, "Adding tuples should not change the other constraint")
+
+    @unittest.skipUnless(TEST_MODELS, "Not Testing Models.")
+    def test_generated_boards(self):
+        self.assertEqual(cell_position(23, 6), (1, 2), "Wrong cell of a small board")
+        self.assertEqual(cell_position(1012, 12), (9, 11), "Wrong cell of a large board")
+        self.assertEqual(cell_position(cell_code(3, 11, 11), 11), (2, 10), "cell_code should invert cell_position")
+        rng = random.Random(0)
+        boards = [kenken_boards.generate_board(n, rng) for n in (4, 6, 10)]
+        with tempfile.TemporaryDirectory() as tmp:
+            kenken_boards.save_boards(os.path.join(tmp, "boards.json"), boards)
+            self.assertEqual(kenken_boards.load_boards(os.path.join(tmp, "boards.json")), boards, "Boards should load as saved")
+        for board in boards:
+            n = board[0][0]
+            cells = [cell for cage in board[1:] for cell in (cage[:1] if len(cage) == 2 else cage[:-2])]
+            self.assertEqual(sorted(cell_position(cell, n) for cell in cells), [(i, j) for i in range(n) for j in range(n)], "Cages should cover the board once")
+            self.assertEqual(len(kenken_boards.two_solutions(board)), 1, "Board should have a unique solution")
+            for model in (kenken_csp_model, kenken_csp_model_nary):
+                csp, var_array = model([list(cage) for cage in board])
+                solver = BT(csp)
+                solver.quiet()
+                solver.bt_search(prop_GAC, ord_mrv)
+                self.assertTrue(check_diff(var_array, board) and check_cages(var_array, board), "Wrong solution of a {}x{} board".format(n, n))
+
+    @unittest.skipUnless(TEST_CSPBASE, "Not Testing CSP Base.")
+    def test_symmetry_breaking(self):
+        x, y, z = (Variable(name, [1, 2, 3]) for name in "XYZ")
+        flip = {1: 3, 2: 2, 3: 1}
+        c = LexLeqConstraint("Lex", [x, y], [(y, flip), z])
+        self.assertEqual(c.get_scope(), [x, y, z], "Wrong scope of a lex constraint")
+        self.assertTrue(c.check([1, 2, 1]) and c.check([2, 2, 2]), "x <= 4-y, ties broken by y <= z")
+        self.assertFalse(c.check([2, 3, 3]) or c.check([2, 2, 1]), "Lex constraint accepted a violation")
+        x.prune_value(1)
+        self.assertEqual(c.prune_unsupported(), [y], "y > 2 leaves x no value")
+        self.assertEqual(y.cur_domain(), [1, 2])
+        x.assign(2)
+        y.assign(2)
+        self.assertFalse(c.has_support(z, 1), "z=1 makes the right vector smaller")
+        self.assertEqual(c.prune_unsupported(), [z])
+        self.assertEqual(z.cur_domain(), [2, 3])
+
+        sols = set()
+        for n in (6, 8):
+            csp = nQueens(n)
+            queens = csp.get_all_vars()
+            solver = BT(csp)
+            solver.quiet()
+            all_sols = set(tuple(q.get_assigned_value() for q in queens) for _ in solver.solutions(prop_FC))
+            added = symmetry.break_queens_symmetry(csp, queens)
+            for prop in (prop_BT, prop_FC, prop_GAC, prop_CT):
+                sols = set(tuple(q.get_assigned_value() for q in queens) for _ in solver.solutions(prop, ord_mrv))
+                self.assertTrue(sols <= all_sols, "Symmetry breaking made a wrong solution")
+                #the lex-least solution of each class must be kept
+                for sol in all_sols:
+                    images = [sol, sol[::-1], tuple(n + 1 - v for v in sol), tuple(n + 1 - v for v in sol[::-1])]
+                    inverse = tuple(sol.index(i) + 1 for i in range(1, n + 1))
+                    images += [inverse, inverse[::-1], tuple(n + 1 - v for v in inverse), tuple(n + 1 - v for v in inverse[::-1])]
+                    self.assertIn(min(images), sols, "Symmetry breaking lost a class of solutions")
+            for c in added:
+                csp.remove_constraint(c)
+            self.assertEqual(solver.count_solutions(prop_FC), len(all_sols), "Removing the constraints should restore the solutions")
+        self.assertEqual(len(sols), 17, "Wrong number of 8-queens solutions left")
+
+        for model in (binary_ne_grid, nary_ad_grid):
+            csp, var_array = model([[4]])
+            symmetry.break_grid_symmetry(csp, var_array)
+            solver = BT(csp)
+            solver.quiet()
+            self.assertEqual(solver.count_solutions(prop_GAC, ord_mrv), 4, "There are 4 reduced 4x4 Latin squares")
+            csp, var_array = model([[4]])
+            symmetry.break_grid_symmetry(csp, var_array, values=False)
+            solver = BT(csp)
+            solver.quiet()
+            for _ in solver.solutions(prop_FC):
+                self.assertTrue(check_diff(var_array, [[4]]), "Repeated value in a row or column!")
+                rows = [[v.get_assigned_value() for v in row] for row in var_array]
+                self.assertEqual(rows, sorted(rows), "Rows should be in lex order")
+                self.assertEqual(list(zip(*rows)), sorted(zip(*rows)), "Columns should be in lex order")
+
+    @unittest.skipUnless(TEST_PROPAGATORS, "Not Testing Propagotors.")
+    def test_preprocessing(self):
+        for board in (BOARDS[1], BOARDS[4]):
+            csp, var_array = kenken_csp_model([list(cage) for cage in board])
+            solver = BT(csp)
+            solver.quiet()
+            count = solver.count_solutions(prop_GAC, ord_mrv)
+            result = preprocessing.preprocess(csp, prop_GAC)
+            self.assertTrue(result['consistent'] and result['complete'])
+            self.assertTrue(result['removed'] > result['propagator_removed'], "SAC should prune more than GAC")
+            self.assertEqual(len(csp.get_all_cons()), len(kenken_csp_model([list(cage) for cage in board])[0].get_all_cons()) + len(result['constraints']))
+            self.assertEqual(solver.count_solutions(prop_GAC, ord_mrv), count, "Preprocessing changed the solutions")
+            #the prunings survive bt_search restoring the domains
+            solver.restore_all_variable_domains()
+            propagators.prop_GAC(csp)
+            self.assertEqual(sum(var.domain_size() - var.cur_domain_size() for var in csp.get_all_vars()), result['removed'], "Prunings were not committed")
+            solver.restore_all_variable_domains()
+        csp, var_array = kenken_csp_model([list(cage) for cage in BOARDS[1]])
+        preprocessing.preprocess(csp, prop_GAC)
+        solver = BT(csp)
+        solver.quiet()
+        solver.restore_all_variable_domains()
+        propagators.prop_FC(csp)
+        self.assertTrue(all(var.cur_domain_size() == 1 for var in csp.get_all_vars()), "SAC should solve board 2")
+        solver.restore_all_variable_domains()
+
+        csp, _ = kenken_csp_model([list(cage) for cage in BOARDS[3]])
+        result = preprocessing.preprocess(csp, prop_GAC, time_limit=0)
+        self.assertFalse(result['complete'], "The time limit was ignored")
+        self.assertEqual(result['removed'], result['propagator_removed'])
+
+        #three variables with two values, pairwise different: arc consistent 
+        #but not path consistent
+        vars = [Variable(name, [1, 2]) for name in "XYZ"]
+        csp = CSP("Triangle", vars)
+        for x, y in itertools.combinations(vars, 2):
+            c = Constraint("NE({},{})".format(x.name, y.name), [x, y])
+            c.add_satisfying_tuples([(1, 2), (2, 1)])
+            csp.add_constraint(c)
+        self.assertTrue(preprocessing.preprocess(csp, prop_FC)['consistent'], "Forward checking can not refute a value here")
+        for c in [c for c in csp.get_all_cons() if c.name.startswith("SAC-")]:
+            csp.remove_constraint(c)
+        for rpc, prop in ((True, prop_FC), (False, prop_GAC)):
+            result = preprocessing.preprocess(csp, prop, rpc=rpc)
+            self.assertFalse(result['consistent'], "The triangle has no solution")
+            solver = BT(csp)
+            solver.quiet()
+            self.assertEqual(solver.count_solutions(prop_FC), 0)
+            for c in result['constraints']:
+                csp.remove_constraint(c)
+        self.assertEqual(solver.count_solutions(prop_BT), 0)
+
+    @unittest.skipUnless(TEST_CSPBASE, "Not Testing CSP Base.")
+    def test_local_search(self):
+        def check_queens(queens):
+            cols = [q.get_assigned_value() for q in queens]
+            return all(cols[i] != cols[j] and abs(cols[i] - cols[j]) != j - i
+                       for i in range(len(cols)) for j in range(i + 1, len(cols)))
+        csp = localsearch.queens_csp(8)
+        solver = BT(csp)
+        solver.quiet()
+        self.assertEqual(solver.count_solutions(prop_GAC), 92, "All-different with offsets should model 8-queens")
+        for csp in (nQueens(8), localsearch.queens_csp(8), localsearch.queens_csp(200)):
+            solver = localsearch.MinConflicts(csp)
+            solver.quiet()
+            self.assertTrue(solver.search(seed=1), "Min-conflicts should solve {}".format(csp.name))
+            self.assertTrue(check_queens(csp.get_all_vars()), "Wrong solution of {}".format(csp.name))
+        self.assertTrue(solver.nSteps < 1000, "200-queens should take few moves")
+        csp = localsearch.queens_csp(3)
+        solver = localsearch.MinConflicts(csp)
+        solver.quiet()
+        self.assertFalse(solver.search(max_steps=500, seed=1), "3-queens has no solution")
+        self.assertEqual(solver.nSteps, 500)
+        self.assertFalse(any(q.is_assigned() for q in csp.get_all_vars()), "Nothing should be assigned")
+
+        #a permutation with one free variable left has nothing to swap with, 
+        #with C in 1..2 there is no solution
+        for seed in range(50):
+            for c_dom in ([1, 2, 3], [1, 2]):
+                a, b, c = Variable('A', [1]), Variable('B', [2]), Variable('C', c_dom)
+                e, f, g = Variable('E', [1, 2, 3]), Variable('F', [1, 2, 3]), Variable('G', [1, 2, 3])
+                csp = CSP("OneFree", [a, b, c, e, f, g])
+                csp.add_constraint(AllDiffConstraint("ABC", [a, b, c]))
+                csp.add_constraint(AllDiffConstraint("CEF", [c, e, f]))
+                csp.add_constraint(AllDiffConstraint("EG", [e, g]))
+                solver = localsearch.MinConflicts(csp)
+                solver.quiet()
+                solved = solver.search(max_steps=2000, seed=seed)
+                self.assertEqual(solved, len(c_dom) == 3, "Wrong result with one free variable in a permutation")
+
+        csp, var_array = nary_ad_grid([[20]])
+        solver = localsearch.MinConflicts(csp)
+        solver.quiet()
+        self.assertTrue(solver.search(seed=1) and check_diff(var_array, [[20]]), "Min-conflicts should fill a 20x20 grid")
+        for model in (kenken_csp_model, kenken_csp_model_nary):
+            csp, var_array = model([list(cage) for cage in BOARDS[1]])
+            solver = localsearch.MinConflicts(csp)
+            solver.quiet()
+            self.assertTrue(solver.search(seed=1), "Min-conflicts should solve board 2")
+            self.assertTrue(check_diff(var_array, BOARDS[1]) and check_cages(var_array, BOARDS[1]), "Wrong solution of board 2")
+            #the solution is left assigned as bt_search leaves it
+            self.assertTrue(all(var.is_assigned() for var in csp.get_all_vars()))
+
+    @unittest.skipUnless(TEST_CSPBASE, "Not Testing CSP Base.")
+    def test_serialize(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            file = os.path.join(tmp, "board.csp")
+            for model in (kenken_csp_model, kenken_csp_model_nary):
+                csp, var_array = model([list(cage) for cage in BOARDS[3]])
+                self.assertTrue(serialize.save_csp(csp, file, var_array))
+                loaded, loaded_array = serialize.load_csp(file)
+                self.assertEqual([v.name for v in loaded.get_all_vars()], [v.name for v in csp.get_all_vars()])
+                self.assertEqual([v.domain() for v in loaded.get_all_vars()], [v.domain() for v in csp.get_all_vars()])
+                self.assertEqual([str(c) for c in loaded.get_all_cons()], [str(c) for c in csp.get_all_cons()])
+                self.assertEqual([[v.name for v in row] for row in loaded_array], [[v.name for v in row] for row in var_array])
+                for c, d in zip(csp.get_all_cons(), loaded.get_all_cons()):
+                    self.assertIs(type(c), type(d))
+                    if type(c) is Constraint:
+                        self.assertEqual(d.relation.tuples, c.relation.tuples)
+                        self.assertEqual(d.relation.supports, c.relation.supports)
+                #the tables shared in the model are shared once loaded
+                relations = set(id(c.relation) for c in csp.get_all_cons() if type(c) is Constraint)
+                self.assertEqual(len(set(id(c.relation) for c in loaded.get_all_cons() if type(c) is Constraint)), len(relations))
+                stats = []
+                for problem, grid in ((csp, var_array), (loaded, loaded_array)):
+                    solver = BT(problem)
+                    solver.quiet()
+                    stats.append(solver.bt_search(prop_GAC, ord_mrv))
+                    self.assertTrue(check_diff(grid, BOARDS[3]) and check_cages(grid, BOARDS[3]), "Wrong solution of the loaded board")
+                self.assertEqual(stats[0].decisions, stats[1].decisions, "The loaded CSP should be searched the same way")
+
+            #all-different offsets, lex constraints with mappings, arithmetic and nogood constraints
+            csp = localsearch.queens_csp(8)
+            symmetry.break_queens_symmetry(csp, csp.get_all_vars())
+            x, y, z, w = csp.get_all_vars()[:4]
+            csp.add_constraint(SumConstraint("Sum", [x, y, z], 14, True))
+            csp.add_constraint(ProductConstraint("Product", [x, y], 10))
+            csp.add_constraint(NogoodConstraint("Nogood", [(z, 7), (w, 4)]))
+            file = os.path.join(tmp, "queens.csp")
+            self.assertTrue(serialize.save_csp(csp, file))
+            loaded, grid = serialize.load_csp(file)
+            self.assertIsNone(grid)
+            counts = []
+            for problem in (csp, loaded):
+                solver = BT(problem)
+                solver.quiet()
+                counts.append(solver.count_solutions(prop_GAC))
+            self.assertEqual(counts[0], counts[1], "The loaded CSP should have the same solutions")
+            self.assertEqual(counts[0], 1)
+
+            csp = CSP("Function", [x])
+            csp.add_constraint(FunctionConstraint("Odd", [x], lambda vals: vals[0] % 2))
+            self.assertFalse(serialize.save_csp(csp, os.path.join(tmp, "function.csp")), "Function constraints can not be saved")
+            self.assertFalse(os.path.exists(os.path.join(tmp, "function.csp")))
+            text = os.path.join(tmp, "text.csp")
+            with open(text, 'w') as f:
+                f.write("not a CSP file")
+            self.assertEqual(serialize.load_csp(text), (None, None))
+            with open(file, 'rb') as f:
+                data = f.read()
+            for content in (b'', data[:4], data[:100], data[:len(data) // 2]):
+                with open(text, 'wb') as f:
+                    f.write(content)
+                self.assertEqual(serialize.load_csp(text), (None, None), "Short files are not CSP files")
+
+            #close_csp reads the tables left and unmaps the file
+            loaded, _ = serialize.load_csp(file)
+            serialize.close_csp(loaded)
+            self.assertTrue(loaded.mapping.closed)
+            solver = BT(loaded)
+            solver.quiet()
+            self.assertEqual(solver.count_solutions(prop_GAC), 1, "The closed CSP should still be searched")
+
+    @unittest.skipUnless(TEST_MODELS, "Not Testing Models.")
+    def test_nary_ad_grid(self):
+        csp, var_array = nary_ad_grid([[4]])
+        self.assertEqual(len(csp.get_all_cons()), 8, "Wrong number of all-different constraints for nary_ad_grid!")
+        solver = BT(csp)
+        solver.quiet()
+        solver.bt_search(prop_GAC, ord_mrv)
+        self.assertTrue(check_diff(var_array, [[4]]), "Repeated value in a row or column!")
+
     ##Tests FC after the first queen is placed in position 1.
     @unittest.skipUnless(TEST_PROPAGATORS, "Not Testing Propagotors.")
     def test_simple_FC(self):